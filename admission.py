@@ -0,0 +1,232 @@
+"""Admission control: per-route concurrency limits and per-client rate limits.
+
+Expensive routes share the workers with cheap ones, so a burst of bcrypt
+logins or large predictions from one client would otherwise raise latency
+for everybody. `AdmissionMiddleware` sorts each request into a route class
+before it reaches the router:
+
+    auth      POST /login, POST /register             (bcrypt)
+    predict   /predict, /predict/batch                (model inference)
+    users     GET /users, GET /users/export, POST /users/bulk
+    default   everything else
+
+and applies two checks, both O(1):
+
+* a token bucket per client and class (the verified token's `sub`, or the
+  client IP); an empty bucket answers 429 with `Retry-After` set to when
+  the next token is due;
+* a cap on the class's requests in flight; a full class answers 503 with
+  `Retry-After: 1`, shedding instead of queueing like the password hasher.
+
+`/health`, `/me`, `/metrics` and `/ai/health` skip both checks, so they stay
+responsive while the limited classes are saturated.
+
+Buckets live in an LRU map bounded by `ADMISSION_MAX_CLIENTS` per class.
+Buckets idle for `ADMISSION_IDLE_SECONDS` are dropped from the cold end as
+new clients arrive; an idle bucket has refilled anyway, so forgetting it
+changes nothing.
+"""
+
+from collections import OrderedDict
+import math
+import threading
+import time
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from fastapi.responses import JSONResponse
+
+import config
+from auth.tokens import token_subject
+
+EXEMPT_PATHS = frozenset(["/health", "/me", "/metrics", "/ai/health"])
+
+
+class TokenBuckets:
+    """Per-key token buckets in a bounded LRU map."""
+
+    def __init__(self, rate: float, burst: int, max_keys: int, idle_seconds: float):
+        self.rate = rate
+        self.burst = float(max(burst, 1))
+        self.max_keys = max_keys
+        self.idle_seconds = idle_seconds
+        self._buckets: "OrderedDict[Hashable, List[float]]" = OrderedDict()  # key -> [tokens, updated_at]
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def take(self, key: Hashable, now: Optional[float] = None) -> float:
+        """Take one token for `key`: 0.0 if granted, else seconds until one is due."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [self.burst, now]
+                self._evict(now)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] >= 1.0:
+                bucket[0] -= 1.0
+                return 0.0
+            return (1.0 - bucket[0]) / self.rate
+
+    def _evict(self, now: float) -> None:
+        # Called with the lock held when a key is added: drop at most a couple
+        # of idle buckets from the cold end, then enforce the size bound
+        for _ in range(2):
+            key, (_, updated_at) = next(iter(self._buckets.items()))
+            if now - updated_at < self.idle_seconds:
+                break
+            del self._buckets[key]
+            self.evictions += 1
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+            self.evictions += 1
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class RouteClass:
+    """Limits and counters for one class of routes."""
+
+    def __init__(self, name: str, concurrency: int, rate: float, burst: int):
+        self.name = name
+        self.concurrency = concurrency
+        self.buckets = (
+            TokenBuckets(rate, burst, config.ADMISSION_MAX_CLIENTS, config.ADMISSION_IDLE_SECONDS)
+            if rate > 0 else None
+        )
+        # Only touched on the event loop, so plain integers are enough
+        self.in_flight = 0
+        self.admitted = 0
+        self.rate_limited = 0
+        self.overloaded = 0
+
+    def stats(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "in_flight": self.in_flight,
+            "admitted": self.admitted,
+            "rate_limited": self.rate_limited,
+            "overloaded": self.overloaded,
+            "clients": len(self.buckets) if self.buckets is not None else 0,
+            "evictions": self.buckets.evictions if self.buckets is not None else 0,
+        }
+
+
+ROUTE_CLASSES: Dict[str, RouteClass] = {
+    "auth": RouteClass(
+        "auth", config.ADMISSION_AUTH_CONCURRENCY, config.ADMISSION_AUTH_RATE, config.ADMISSION_AUTH_BURST
+    ),
+    "predict": RouteClass(
+        "predict", config.ADMISSION_PREDICT_CONCURRENCY, config.ADMISSION_PREDICT_RATE,
+        config.ADMISSION_PREDICT_BURST,
+    ),
+    "users": RouteClass(
+        "users", config.ADMISSION_USERS_CONCURRENCY, config.ADMISSION_USERS_RATE, config.ADMISSION_USERS_BURST
+    ),
+    "default": RouteClass(
+        "default", config.ADMISSION_DEFAULT_CONCURRENCY, config.ADMISSION_DEFAULT_RATE,
+        config.ADMISSION_DEFAULT_BURST,
+    ),
+}
+
+
+def classify(method: str, path: str) -> Optional[RouteClass]:
+    """The route class of a request, or None for exempt paths"""
+    if path in EXEMPT_PATHS:
+        return None
+    if method == "POST" and path in ("/login", "/register"):
+        return ROUTE_CLASSES["auth"]
+    if path == "/predict" or path.startswith("/predict/"):
+        return ROUTE_CLASSES["predict"]
+    if (method == "GET" and path in ("/users", "/users/export")) or (method == "POST" and path == "/users/bulk"):
+        return ROUTE_CLASSES["users"]
+    return ROUTE_CLASSES["default"]
+
+
+def _header(scope, name: bytes) -> Optional[str]:
+    for key, value in scope.get("headers", ()):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+def client_key(scope) -> Tuple[str, str]:
+    """Who a request is rate-limited as: ("sub", email) or ("ip", address)"""
+    if config.ADMISSION_KEY == "subject":
+        authorization = _header(scope, b"authorization")
+        if authorization and authorization[:7].lower() == "bearer ":
+            subject = token_subject(authorization[7:].strip())
+            if subject is not None:
+                return ("sub", subject)
+    if config.ADMISSION_TRUST_FORWARDED:
+        forwarded = _header(scope, b"x-forwarded-for")
+        if forwarded:
+            return ("ip", forwarded.split(",", 1)[0].strip())
+    client = scope.get("client")
+    return ("ip", client[0] if client else "unknown")
+
+
+class AdmissionMiddleware:
+    """ASGI middleware applying the route-class limits (see module docstring)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not config.ADMISSION_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        route_class = classify(scope.get("method", ""), scope.get("path", ""))
+        if route_class is None:
+            await self.app(scope, receive, send)
+            return
+
+        if route_class.buckets is not None:
+            wait = route_class.buckets.take(client_key(scope))
+            if wait > 0:
+                route_class.rate_limited += 1
+                response = JSONResponse(
+                    status_code=429,
+                    content={"detail": "Too many requests, please slow down"},
+                    headers={"Retry-After": str(max(1, math.ceil(wait)))},
+                )
+                await response(scope, receive, send)
+                return
+
+        if route_class.concurrency and route_class.in_flight >= route_class.concurrency:
+            route_class.overloaded += 1
+            response = JSONResponse(
+                status_code=503,
+                content={"detail": "Server busy, please retry shortly"},
+                headers={"Retry-After": "1"},
+            )
+            await response(scope, receive, send)
+            return
+
+        route_class.admitted += 1
+        route_class.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            route_class.in_flight -= 1
+
+
+def stats() -> Optional[dict]:
+    if not config.ADMISSION_ENABLED:
+        return None
+    return {name: route_class.stats() for name, route_class in ROUTE_CLASSES.items()}
+
+
+def flat_stats() -> Optional[dict]:
+    """`stats()` flattened to `<class>_<counter>` for the metrics exporter"""
+    nested = stats()
+    if nested is None:
+        return None
+    return {
+        f"{name}_{key}": value
+        for name, values in nested.items()
+        for key, value in values.items()
+    }
@@ -0,0 +1,243 @@
+"""Background audit log of prediction inputs and outputs.
+
+Every `/predict` and `/predict/batch` result is recorded for compliance and
+retraining, but a request must never wait on the disk. `record` only appends
+to a bounded in-memory ring buffer; a writer thread drains it, encodes the
+entries as NDJSON and appends them in one write per batch. A batch is
+written once `batch_size` entries are queued or `flush_interval` seconds
+after the first of them arrived, whichever comes first.
+
+When the buffer is full, `overflow="drop"` discards the new entry and
+counts it. `overflow="block"` makes the caller wait for room for at most
+`block_timeout` seconds before dropping. That is backpressure on the
+buffer, not on the disk: the wait ends as soon as the writer drains.
+
+The file is rotated once it would grow past `max_bytes`:
+`predictions.jsonl` becomes `predictions.jsonl.1` (`.1.gz` with
+`compress`), older backups shift up and the oldest beyond `backups` is
+removed.
+"""
+
+from collections import deque
+import gzip
+import logging
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterable, List, Optional
+
+from serialization import dumps_line
+
+logger = logging.getLogger("uvicorn.error")
+
+OVERFLOW_MODES = ("drop", "block")
+
+
+class PredictionLog:
+    """Bounded buffer drained to a rotating NDJSON file by a writer thread."""
+
+    def __init__(
+        self,
+        path: str,
+        capacity: int = 10000,
+        batch_size: int = 512,
+        flush_interval: float = 1.0,
+        max_bytes: int = 100 * 1024 * 1024,
+        backups: int = 5,
+        compress: bool = True,
+        overflow: str = "drop",
+        block_timeout: float = 0.05,
+        fsync: bool = False,
+    ):
+        if overflow not in OVERFLOW_MODES:
+            raise ValueError(f"overflow must be one of {OVERFLOW_MODES}, got {overflow!r}")
+        self.path = Path(path)
+        self.capacity = max(1, capacity)
+        self.batch_size = max(1, min(batch_size, self.capacity))
+        self.flush_interval = max(0.0, flush_interval)
+        self.max_bytes = max_bytes
+        self.backups = max(0, backups)
+        self.compress = compress
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.fsync = fsync
+
+        self._buffer: Deque[dict] = deque()
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = False
+        self._file = None
+        self._size = 0
+
+        self._recorded = 0
+        self._dropped = 0
+        self._blocked = 0
+        self._written = 0
+        self._batches = 0
+        self._bytes = 0
+        self._rotations = 0
+        self._errors = 0
+
+    # -- submission ---------------------------------------------------------
+
+    def record(self, entry: Dict[str, Any]) -> bool:
+        """Queue one entry; False if it was dropped because the buffer is full"""
+        return self.record_many([entry]) == 1
+
+    def record_many(self, entries: Iterable[Dict[str, Any]]) -> int:
+        """Queue entries under a single lock acquisition; returns how many were kept"""
+        if self._stopped:
+            return 0
+        self._ensure_started()
+        kept = 0
+        with self._lock:
+            for entry in entries:
+                if len(self._buffer) >= self.capacity and not self._wait_for_room():
+                    self._dropped += 1
+                    continue
+                self._buffer.append(entry)
+                kept += 1
+            self._recorded += kept
+            if len(self._buffer) >= self.batch_size:
+                self._not_empty.notify()
+        return kept
+
+    def _wait_for_room(self) -> bool:
+        # Called with the lock held and the buffer full
+        if self.overflow != "block":
+            return False
+        self._blocked += 1
+        self._not_empty.notify()
+        return self._not_full.wait_for(
+            lambda: len(self._buffer) < self.capacity or self._stopped, self.block_timeout
+        ) and not self._stopped
+
+    # -- writer -------------------------------------------------------------
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="prediction-log", daemon=True)
+                self._thread.start()
+
+    def _take_batch(self) -> List[dict]:
+        with self._lock:
+            self._not_empty.wait_for(lambda: self._buffer or self._stopped)
+            if self._buffer and not self._stopped:
+                # Give the batch time to fill up before writing it
+                self._not_empty.wait_for(
+                    lambda: len(self._buffer) >= self.batch_size or self._stopped, self.flush_interval
+                )
+            batch = list(self._buffer)
+            self._buffer.clear()
+            self._not_full.notify_all()
+            return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._take_batch()
+            if batch:
+                self._write(batch)
+            elif self._stopped:
+                break
+        self._close_file()
+
+    def _write(self, batch: List[dict]) -> None:
+        try:
+            data = b"".join(dumps_line(entry) for entry in batch)
+            if self._file is None:
+                self._open()
+            if self._size and self._size + len(data) > self.max_bytes:
+                self._rotate()
+            self._file.write(data)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+        except Exception as e:
+            logger.exception("Prediction log write failed, %d entries lost: %s", len(batch), e)
+            with self._lock:
+                self._errors += 1
+                self._dropped += len(batch)
+            self._close_file()
+            return
+        self._size += len(data)
+        with self._lock:
+            self._written += len(batch)
+            self._batches += 1
+            self._bytes += len(data)
+
+    def _open(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "ab")
+        self._size = self._file.tell()
+
+    def _close_file(self) -> None:
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError:
+                pass
+            self._file = None
+
+    def _backup(self, n: int) -> Path:
+        suffix = f".{n}.gz" if self.compress else f".{n}"
+        return self.path.with_name(self.path.name + suffix)
+
+    def _rotate(self) -> None:
+        self._close_file()
+        if self.backups == 0:
+            self.path.unlink()
+        else:
+            self._backup(self.backups).unlink(missing_ok=True)
+            for n in range(self.backups - 1, 0, -1):
+                if self._backup(n).exists():
+                    self._backup(n).rename(self._backup(n + 1))
+            if self.compress:
+                with open(self.path, "rb") as src, gzip.open(self._backup(1), "wb") as dst:
+                    shutil.copyfileobj(src, dst)
+                self.path.unlink()
+            else:
+                self.path.rename(self._backup(1))
+        with self._lock:
+            self._rotations += 1
+        self._open()
+
+    # -- lifecycle / stats --------------------------------------------------
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Write out what is buffered and stop the writer"""
+        with self._lock:
+            self._stopped = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "path": str(self.path),
+                "overflow": self.overflow,
+                "capacity": self.capacity,
+                "queued": len(self._buffer),
+                "recorded": self._recorded,
+                "dropped": self._dropped,
+                "blocked": self._blocked,
+                "written": self._written,
+                "batches": self._batches,
+                "bytes_written": self._bytes,
+                "rotations": self._rotations,
+                "errors": self._errors,
+            }
+
+
+def prediction_entry(endpoint: str, model: Optional[str], inputs: Dict[str, Any], output: Any) -> dict:
+    """One audit record; `output` may hold NumPy values (encoded by the writer)"""
+    return {"ts": time.time(), "endpoint": endpoint, "model": model, "input": inputs, "output": output}
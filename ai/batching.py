@@ -0,0 +1,205 @@
+"""Micro-batching scheduler for model inference.
+
+Concurrent `/predict` requests each contribute one feature row. Instead of
+running the whole sklearn pipeline once per request, a background thread
+collects rows for at most `max_wait_ms` milliseconds (or until `max_batch_size`
+rows are queued), runs a single vectorized prediction over the batch and hands
+each caller its own result through a Future.
+
+If a batch fails, its rows are scored again one at a time, so a row the
+model rejects (an unknown category, say) only fails its own caller.
+
+With `concurrency > 1` that many threads collect and dispatch batches in
+parallel, for a `predict_batch` that releases the GIL while it waits (the
+inference worker pool in `ai.workers`).
+"""
+
+import asyncio
+from concurrent.futures import Future
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+# Batch size histogram buckets (upper bounds, inclusive)
+_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+class InferenceBatcher:
+    """Collects single-row requests into batches for `predict_batch`.
+
+    `predict_batch` receives a list of feature dicts and must return a list of
+    per-row results in the same order.
+    """
+
+    def __init__(
+        self,
+        predict_batch: Callable[[List[Dict[str, Any]]], Sequence[Any]],
+        max_batch_size: int = 32,
+        max_wait_ms: float = 2.0,
+        concurrency: int = 1,
+    ):
+        self.predict_batch = predict_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.concurrency = max(1, concurrency)
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._threads: List[threading.Thread] = []
+        self._start_lock = threading.Lock()
+        self._stopped = False
+
+        self._stats_lock = threading.Lock()
+        self._histogram = {b: 0 for b in _BUCKETS}
+        self._histogram_overflow = 0
+        self._batches = 0
+        self._rows = 0
+        self._errors = 0
+        self._retried_batches = 0
+        self._queue_wait = 0.0
+        self._inference_time = 0.0
+
+    # -- submission ---------------------------------------------------------
+
+    def submit(self, row: Dict[str, Any]) -> Future:
+        if self._stopped:
+            raise RuntimeError("inference batcher is stopped")
+        self._ensure_started()
+        future: Future = Future()
+        self._queue.put((row, future, time.monotonic()))
+        return future
+
+    def predict(self, row: Dict[str, Any], timeout: Optional[float] = None) -> Any:
+        """Submit one row and block until its result is ready.
+
+        Raises `TimeoutError` after `timeout` seconds; the row is then
+        withdrawn if no batch has picked it up yet.
+        """
+        future = self.submit(row)
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+    async def predict_async(self, row: Dict[str, Any]) -> Any:
+        return await asyncio.wrap_future(self.submit(row))
+
+    # -- worker -------------------------------------------------------------
+
+    def _ensure_started(self) -> None:
+        if self._threads:
+            return
+        with self._start_lock:
+            if not self._threads:
+                threads = [
+                    threading.Thread(
+                        target=self._run, name=f"inference-batcher-{i}", daemon=True
+                    )
+                    for i in range(self.concurrency)
+                ]
+                for thread in threads:
+                    thread.start()
+                self._threads = threads
+
+    def _collect(self) -> List[tuple]:
+        item = self._queue.get()
+        if item is None:
+            # Pass the stop marker on to the other batcher threads
+            self._queue.put(None)
+            return []
+        batch = [item]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Re-post the stop marker so the outer loops see it
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            if not batch:
+                return
+            started = time.monotonic()
+            futures = [f for _, f, _ in batch if f.set_running_or_notify_cancel()]
+            rows = [r for r, f, _ in batch if f in futures]
+            if not rows:
+                continue
+            try:
+                results = self.predict_batch(rows)
+            except BaseException as exc:
+                if len(rows) == 1:
+                    with self._stats_lock:
+                        self._errors += 1
+                    futures[0].set_exception(exc)
+                else:
+                    self._predict_each(rows, futures)
+            else:
+                for f, result in zip(futures, results):
+                    f.set_result(result)
+            finished = time.monotonic()
+            self._record(len(rows), sum(started - t for _, _, t in batch), finished - started)
+
+    def _predict_each(self, rows: List[Dict[str, Any]], futures: List[Future]) -> None:
+        # The batch failed: find out which rows the error belongs to
+        errors = 0
+        for row, f in zip(rows, futures):
+            try:
+                result = self.predict_batch([row])[0]
+            except BaseException as exc:
+                errors += 1
+                f.set_exception(exc)
+            else:
+                f.set_result(result)
+        with self._stats_lock:
+            self._retried_batches += 1
+            self._errors += errors
+
+    def _record(self, size: int, queue_wait: float, elapsed: float) -> None:
+        with self._stats_lock:
+            self._batches += 1
+            self._rows += size
+            self._queue_wait += queue_wait
+            self._inference_time += elapsed
+            for bound in _BUCKETS:
+                if size <= bound:
+                    self._histogram[bound] += 1
+                    break
+            else:
+                self._histogram_overflow += 1
+
+    # -- lifecycle / stats --------------------------------------------------
+
+    def close(self) -> None:
+        self._stopped = True
+        if self._threads:
+            self._queue.put(None)
+            for thread in self._threads:
+                thread.join(timeout=5)
+            self._threads = []
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            histogram = {f"le_{b}": n for b, n in self._histogram.items()}
+            histogram["gt_" + str(_BUCKETS[-1])] = self._histogram_overflow
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "concurrency": self.concurrency,
+                "batches": self._batches,
+                "rows": self._rows,
+                "errors": self._errors,  # failed rows
+                "retried_batches": self._retried_batches,
+                "queued": self._queue.qsize(),
+                "avg_batch_size": round(self._rows / self._batches, 3) if self._batches else 0.0,
+                "avg_queue_wait_ms": round(self._queue_wait / self._rows * 1000, 3) if self._rows else 0.0,
+                "avg_inference_ms": round(self._inference_time / self._batches * 1000, 3) if self._batches else 0.0,
+                "batch_size_histogram": histogram,
+            }
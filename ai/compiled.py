@@ -0,0 +1,329 @@
+"""Compiled fast-path scorer for fitted preprocessing + tree-ensemble pipelines.
+
+For one row, sklearn spends far longer validating input and building
+DataFrames than the actual arithmetic, which for this model is a few
+one-hot lookups and a walk down each tree. `compile_pipeline` turns a fitted
+
+    Pipeline([ColumnTransformer(OneHotEncoder / passthrough ...),
+              RandomForestClassifier | ExtraTreesClassifier | DecisionTreeClassifier])
+
+into a `CompiledPipeline` made of category -> column dicts and the trees'
+node tables concatenated into flat NumPy arrays, walked for every
+(tree, row) pair at once. Anything else raises `UnsupportedModel`.
+
+Every compiled scorer is checked against the original pipeline on inputs
+generated from the model's own categories and split thresholds before it is
+returned. At prediction time, inputs it cannot score exactly as sklearn
+would (unknown categories, missing values, absent columns) raise
+`UnsupportedInput` and `run_model` falls back to the pipeline.
+
+The tree walk costs about the same per row as sklearn's Cython loop plus
+NumPy indexing overhead, so the win is in sklearn's fixed per-call cost:
+`run_model` only uses the scorer for batches of up to `max_rows` rows.
+"""
+
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+class UnsupportedModel(ValueError):
+    """The fitted model has a step the compiler does not handle."""
+
+
+class UnsupportedInput(ValueError):
+    """This input has to go through the original pipeline."""
+
+
+def _column(features: Mapping[str, Any], name: str) -> Any:
+    try:
+        value = features[name]
+    except KeyError:
+        raise UnsupportedInput(f"missing feature: {name}") from None
+    # Scalars (from engineer_row) become one-element columns
+    return value if isinstance(value, np.ndarray) else [value]
+
+
+class CompiledPipeline:
+    """Specialised scorer; see `compile_pipeline`."""
+
+    def __init__(self, classes: np.ndarray, width: int,
+                 encoders: List[Tuple[str, Dict[Any, int], bool]],
+                 passthrough: List[Tuple[str, int]],
+                 roots: np.ndarray, left: np.ndarray, right: np.ndarray,
+                 feature: np.ndarray, threshold: np.ndarray,
+                 values: np.ndarray, depth: int):
+        self.classes_ = classes
+        self.width = width
+        self.encoders = encoders          # (column, {category: output index}, ignore_unknown)
+        self.passthrough = passthrough    # (column, output index)
+        self.roots = roots
+        self.left = left
+        self.right = right
+        self.feature = feature
+        self.threshold = threshold
+        self.values = values              # per-node class probabilities
+        self.depth = depth
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.left)
+
+    def transform(self, features: Mapping[str, Any]) -> np.ndarray:
+        """Build the float32 matrix the trees see (what sklearn would build)."""
+        n = None
+        X = None
+        for name, table, ignore_unknown in self.encoders:
+            column = _column(features, name)
+            if X is None:
+                n = len(column)
+                X = np.zeros((n, self.width), dtype=np.float32)
+            for i, value in enumerate(column):
+                try:
+                    index = table.get(value)
+                except TypeError:  # unhashable
+                    index = None
+                if index is None:
+                    if not ignore_unknown:
+                        raise UnsupportedInput(f"unknown category {value!r} in {name}")
+                    continue
+                X[i, index] = 1.0
+        for name, index in self.passthrough:
+            try:
+                column = np.asarray(_column(features, name), dtype=np.float64)
+            except (TypeError, ValueError):
+                raise UnsupportedInput(f"non-numeric value in {name}") from None
+            if X is None:
+                n = len(column)
+                X = np.zeros((n, self.width), dtype=np.float32)
+            if np.isnan(column).any():
+                raise UnsupportedInput(f"missing value in {name}")
+            X[:, index] = column
+        if X is None:
+            raise UnsupportedInput("no input columns")
+        return X
+
+    def predict_proba(self, features: Mapping[str, Any]) -> np.ndarray:
+        X = self.transform(features)
+        n = X.shape[0]
+        rows = np.tile(np.arange(n), self.n_trees)
+        node = np.repeat(self.roots, n)
+        # Leaves point at themselves, so every walk can run the full depth
+        for _ in range(self.depth):
+            go_left = X[rows, self.feature[node]] <= self.threshold[node]
+            node = np.where(go_left, self.left[node], self.right[node])
+        leaf = self.values[node].reshape(self.n_trees, n, -1)
+        # Summed tree by tree, then averaged, like ForestClassifier.predict_proba
+        return np.add.reduce(leaf, axis=0) / self.n_trees
+
+    def stats(self) -> dict:
+        return {
+            "trees": self.n_trees,
+            "nodes": self.n_nodes,
+            "depth": self.depth,
+            "inputs": self.width,
+        }
+
+
+# -- compiler ---------------------------------------------------------------
+
+def _resolve_columns(columns: Any, names: Sequence[str]) -> List[str]:
+    if isinstance(columns, str):
+        return [columns]
+    out = []
+    for col in list(columns):
+        if isinstance(col, str):
+            out.append(col)
+        elif isinstance(col, (int, np.integer)) and not isinstance(col, bool):
+            out.append(names[col])
+        else:
+            raise UnsupportedModel(f"unsupported column selector: {columns!r}")
+    return out
+
+
+def _is_identity(transformer: Any) -> bool:
+    if transformer == "passthrough":
+        return True
+    # sklearn >= 1.2 stores fitted "passthrough" as an identity FunctionTransformer
+    return (
+        type(transformer).__name__ == "FunctionTransformer"
+        and getattr(transformer, "func", None) is None
+    )
+
+
+def _compile_preprocessor(ct: Any) -> Tuple[int, list, list, List[str]]:
+    from sklearn.preprocessing import OneHotEncoder
+
+    names = list(getattr(ct, "feature_names_in_", []))
+    encoders: List[Tuple[str, Dict[Any, int], bool]] = []
+    passthrough: List[Tuple[str, int]] = []
+    width = 0
+    for _, transformer, columns in ct.transformers_:
+        if transformer == "drop":
+            continue
+        cols = _resolve_columns(columns, names)
+        if _is_identity(transformer):
+            for col in cols:
+                passthrough.append((col, width))
+                width += 1
+        elif isinstance(transformer, OneHotEncoder):
+            if getattr(transformer, "drop_idx_", None) is not None:
+                raise UnsupportedModel("OneHotEncoder(drop=...) is not supported")
+            if getattr(transformer, "_infrequent_enabled", False):
+                raise UnsupportedModel("infrequent categories are not supported")
+            ignore_unknown = transformer.handle_unknown != "error"
+            for col, categories in zip(cols, transformer.categories_):
+                table = {value: width + i for i, value in enumerate(categories.tolist())}
+                if len(table) != len(categories):
+                    raise UnsupportedModel(f"ambiguous categories in {col}")
+                encoders.append((col, table, ignore_unknown))
+                width += len(categories)
+        else:
+            raise UnsupportedModel(f"unsupported transformer: {type(transformer).__name__}")
+    return width, encoders, passthrough, names
+
+
+def _compile_trees(estimator: Any) -> Tuple[np.ndarray, ...]:
+    name = type(estimator).__name__
+    if name in ("RandomForestClassifier", "ExtraTreesClassifier"):
+        trees = list(estimator.estimators_)
+    elif name == "DecisionTreeClassifier":
+        trees = [estimator]
+    else:
+        raise UnsupportedModel(f"unsupported estimator: {name}")
+    if getattr(estimator, "n_outputs_", 1) != 1:
+        raise UnsupportedModel("multi-output estimators are not supported")
+    n_classes = len(estimator.classes_)
+
+    roots, lefts, rights, features, thresholds, values = [], [], [], [], [], []
+    offset = 0
+    depth = 0
+    for tree in trees:
+        t = tree.tree_
+        count = t.node_count
+        own = np.arange(count)
+        leaf = t.children_left == -1
+        roots.append(offset)
+        lefts.append(np.where(leaf, own, t.children_left) + offset)
+        rights.append(np.where(leaf, own, t.children_right) + offset)
+        features.append(np.where(leaf, 0, t.feature))
+        thresholds.append(t.threshold)
+        # DecisionTreeClassifier.predict_proba normalises leaf values per row
+        proba = t.value[:, 0, :n_classes].astype(np.float64)
+        normalizer = proba.sum(axis=1)[:, np.newaxis]
+        normalizer[normalizer == 0.0] = 1.0
+        values.append(proba / normalizer)
+        offset += count
+        depth = max(depth, t.max_depth)
+
+    return (
+        np.asarray(roots, dtype=np.intp),
+        np.concatenate(lefts).astype(np.intp),
+        np.concatenate(rights).astype(np.intp),
+        np.concatenate(features).astype(np.intp),
+        np.concatenate(thresholds).astype(np.float64),
+        np.concatenate(values),
+        depth,
+    )
+
+
+def _check_rows(scorer: CompiledPipeline, names: Sequence[str],
+                samples: int, seed: int) -> Dict[str, np.ndarray]:
+    """Inputs covering every category and values on/around every split."""
+    rng = np.random.default_rng(seed)
+    columns: Dict[str, np.ndarray] = {}
+    for name, table, _ in scorer.encoders:
+        categories = list(table)
+        picked = [categories[i] for i in rng.integers(0, len(categories), samples)]
+        picked[:len(categories)] = categories
+        columns[name] = np.array(picked, dtype=object)
+    for name, index in scorer.passthrough:
+        splits = scorer.threshold[scorer.feature == index]
+        if len(splits) == 0:
+            splits = np.array([0.0])
+        picks = rng.choice(splits, samples)
+        # On a threshold exactly, a hair either side, or anywhere in range
+        mode = rng.integers(0, 4, samples)
+        jitter = np.abs(picks) * 1e-6 + 1e-6
+        spread = rng.uniform(splits.min() - 1, splits.max() + 1, samples)
+        col = np.select(
+            [mode == 0, mode == 1, mode == 2], [picks, picks - jitter, picks + jitter], spread
+        )
+        columns[name] = col
+    return {name: columns[name] for name in names if name in columns}
+
+
+def _verify(model: Any, scorer: CompiledPipeline, names: Sequence[str],
+            samples: int = 1000, seed: int = 0) -> None:
+    import pandas as pd
+
+    rows = _check_rows(scorer, names, samples, seed)
+    expected = model.predict_proba(pd.DataFrame(rows, columns=list(rows)))
+    got = scorer.predict_proba(rows)
+    if got.shape != expected.shape or not np.allclose(got, expected, rtol=0, atol=1e-9):
+        raise UnsupportedModel("compiled scorer disagrees with the pipeline")
+    if not np.array_equal(got.argmax(axis=1), expected.argmax(axis=1)):
+        raise UnsupportedModel("compiled scorer picks different classes than the pipeline")
+
+
+def compile_pipeline(model: Any, verify: bool = True) -> CompiledPipeline:
+    """Compile a fitted pipeline; raises `UnsupportedModel` if it cannot be."""
+    steps = getattr(model, "steps", None)
+    if not steps or len(steps) != 2:
+        raise UnsupportedModel("expected a Pipeline of a ColumnTransformer and a tree model")
+    preprocessor, estimator = steps[0][1], steps[1][1]
+    if type(preprocessor).__name__ != "ColumnTransformer":
+        raise UnsupportedModel(f"unsupported preprocessor: {type(preprocessor).__name__}")
+
+    width, encoders, passthrough, names = _compile_preprocessor(preprocessor)
+    if width != getattr(estimator, "n_features_in_", width):
+        raise UnsupportedModel("preprocessor output does not match the estimator input")
+    roots, left, right, feature, threshold, values, depth = _compile_trees(estimator)
+    scorer = CompiledPipeline(
+        np.asarray(model.classes_), width, encoders, passthrough,
+        roots, left, right, feature, threshold, values, depth,
+    )
+    if verify:
+        _verify(model, scorer, names)
+    return scorer
+
+
+def try_compile(model: Any) -> Tuple[Optional[CompiledPipeline], Optional[str]]:
+    """`(scorer, None)`, or `(None, reason)` when the model has to run as is."""
+    try:
+        return compile_pipeline(model), None
+    except UnsupportedModel as e:
+        return None, str(e)
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+def _rows(features: Mapping[str, Any]) -> int:
+    for value in features.values():
+        return len(value) if isinstance(value, np.ndarray) else 1
+    return 0
+
+
+def run_model(model: Any, features: Mapping[str, Any],
+              scorer: Optional[CompiledPipeline] = None,
+              max_rows: int = 256) -> Tuple[Optional[np.ndarray], Optional[list]]:
+    """Score engineered features: `(probabilities, None)` or `(None, predictions)`.
+
+    Uses `scorer` when given, the batch has at most `max_rows` rows and the
+    scorer can handle the input; the pipeline otherwise.
+    """
+    if scorer is not None and _rows(features) <= max_rows:
+        try:
+            return scorer.predict_proba(features), None
+        except UnsupportedInput:
+            pass
+    from ai.features import to_model_input
+
+    X = to_model_input(features, model)
+    if hasattr(model, "predict_proba") and hasattr(model, "classes_"):
+        return model.predict_proba(X), None
+    return None, model.predict(X).tolist()
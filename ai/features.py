@@ -0,0 +1,145 @@
+"""Feature engineering for the insurance premium model.
+
+The model pipeline expects these columns:
+
+    bmi, income_lpa            numeric, passed through
+    age_group, lifestyle_risk  derived categories
+    occupation, city_tier      categorical inputs
+
+`engineer_row` derives them for a single request with plain Python (NumPy
+has more per-call overhead than the arithmetic itself for one row), and
+`engineer_columns` / `engineer_records` do the same for whole batches with
+`np.select`/`np.where` so batch scoring never branches per row in Python.
+`to_model_input` turns either result into what the model accepts, only
+building a DataFrame when the model selects columns by name.
+
+tests/test_features.py pins both paths to the original per-row logic.
+"""
+
+from typing import Any, Dict, Mapping, Optional, Sequence
+
+import numpy as np
+
+INPUT_FIELDS = ("age", "weight", "height", "income_lpa", "smoker", "city", "occupation")
+
+# City tiers used when the model was trained; anything else is tier 3.
+TIER_1_CITIES = frozenset([
+    "Mumbai", "Delhi", "Bangalore", "Chennai", "Kolkata", "Hyderabad", "Pune",
+])
+TIER_2_CITIES = frozenset([
+    "Jaipur", "Chandigarh", "Indore", "Lucknow", "Patna", "Ranchi", "Visakhapatnam",
+    "Coimbatore", "Bhopal", "Nagpur", "Vadodara", "Surat", "Rajkot", "Jodhpur",
+    "Raipur", "Amritsar", "Varanasi", "Agra", "Dehradun", "Mysore", "Jabalpur",
+    "Guwahati", "Thiruvananthapuram", "Ludhiana", "Nashik", "Allahabad", "Udaipur",
+    "Aurangabad", "Hubli", "Belgaum", "Salem", "Vijayawada", "Tiruchirappalli",
+    "Bhavnagar", "Gwalior", "Dhanbad", "Bareilly", "Aligarh", "Gaya", "Kozhikode",
+    "Warangal", "Kolhapur", "Bilaspur", "Jalandhar", "Noida", "Guntur", "Asansol",
+    "Siliguri",
+])
+
+
+def city_tier(city: Optional[str]) -> int:
+    if city in TIER_1_CITIES:
+        return 1
+    if city in TIER_2_CITIES:
+        return 2
+    return 3
+
+
+def engineer_row(age: int, weight: float, height: float, income_lpa: float,
+                 smoker: bool, city: Optional[str], occupation: Optional[str]) -> Dict:
+    """Derive the model features for one input row."""
+    bmi = weight / (height ** 2) if height > 0 else 0.0
+    lifestyle_risk = "low"
+    if smoker and bmi > 30:
+        lifestyle_risk = "high"
+    elif smoker or bmi > 27:
+        lifestyle_risk = "medium"
+
+    age_group = "senior"
+    if age < 25:
+        age_group = "adult"
+    elif age < 60:
+        age_group = "middle_aged"
+
+    return {
+        "bmi": bmi,
+        "age_group": age_group,
+        "lifestyle_risk": lifestyle_risk,
+        "income_lpa": income_lpa,
+        "city": city or "",
+        "city_tier": city_tier(city),
+        "occupation": occupation or "",
+    }
+
+
+def engineer_columns(age: Sequence, weight: Sequence, height: Sequence,
+                     income_lpa: Sequence, smoker: Sequence,
+                     city: Sequence, occupation: Sequence) -> Dict[str, np.ndarray]:
+    """Column-wise equivalent of `engineer_row` for a batch of inputs."""
+    age = np.asarray(age, dtype=np.int64)
+    weight = np.asarray(weight, dtype=np.float64)
+    height = np.asarray(height, dtype=np.float64)
+    smoker = np.asarray(smoker, dtype=bool)
+    city = np.array([c or "" for c in city], dtype=object)
+    occupation = np.array([o or "" for o in occupation], dtype=object)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        bmi = np.where(height > 0, weight / (height ** 2), 0.0)
+
+    lifestyle_risk = np.select(
+        [smoker & (bmi > 30), smoker | (bmi > 27)],
+        ["high", "medium"],
+        default="low",
+    ).astype(object)
+    age_group = np.select(
+        [age < 25, age < 60],
+        ["adult", "middle_aged"],
+        default="senior",
+    ).astype(object)
+    tier = np.select(
+        [np.isin(city, list(TIER_1_CITIES)), np.isin(city, list(TIER_2_CITIES))],
+        [1, 2],
+        default=3,
+    )
+
+    return {
+        "bmi": bmi,
+        "age_group": age_group,
+        "lifestyle_risk": lifestyle_risk,
+        "income_lpa": np.asarray(income_lpa, dtype=np.float64),
+        "city": city,
+        "city_tier": tier,
+        "occupation": occupation,
+    }
+
+
+def engineer_records(records: Sequence[Mapping[str, Any]]) -> Dict[str, np.ndarray]:
+    """Column-wise feature engineering for a batch of input records (dicts)."""
+    columns = {name: [r.get(name) for r in records] for name in INPUT_FIELDS}
+    return engineer_columns(**columns)
+
+
+def _column(features: Mapping[str, Any], name: str) -> Any:
+    value = features[name]
+    # Scalars (from engineer_row) become one-element columns
+    return value if isinstance(value, np.ndarray) else [value]
+
+
+def to_model_input(features: Mapping[str, Any], model: Any) -> Any:
+    """Build the model input from engineered features (one row or columns).
+
+    Pipelines fitted on a DataFrame (they have `feature_names_in_`) select
+    columns by name, so they get a DataFrame restricted to, and ordered like,
+    those columns. Anything else gets a plain 2-D NumPy array and pandas is
+    not touched at all.
+    """
+    names = getattr(model, "feature_names_in_", None)
+    if names is None:
+        cols = [np.asarray(_column(features, n)) for n in features]
+        return np.column_stack(cols) if cols else np.empty((0, 0))
+
+    import pandas as pd
+
+    names = list(names)
+    return pd.DataFrame({n: _column(features, n) for n in names}, columns=names, copy=False)
@@ -1,40 +1,192 @@
+"""Model artifact discovery and loading.
+
+Two on-disk formats are supported:
+
+* `.pkl`: a plain pickle of the estimator, read with `pickle.load`.
+* `.skmm`: the estimator pickle plus its compiled scorer (`ai.compiled`),
+  in one file whose sections are each 64-byte aligned:
+
+      b"SKMM0001" | u64 index length | JSON index | model pickle
+                  | scorer pickle | scorer node arrays
+
+  The scorer is pickled with protocol 5 and its flat node arrays (`roots`,
+  `left`, `right`, `feature`, `threshold`, `values`) stored out-of-band.
+  Loading memory-maps the file and hands those arrays to `pickle.loads` as
+  zero-copy views: the scorer walks them in place, so they are neither
+  parsed nor copied, and every worker process that maps the same file
+  shares their page-cache pages (copy-on-write). The scorer was verified
+  against the pipeline when the artifact was written, so loading skips the
+  compile-and-verify step a `.pkl` needs.
+
+  The estimator itself is stored in-band: sklearn's Cython `Tree` copies its
+  node table into private memory when unpickled, so mapping its arrays would
+  share nothing. Encoder categories are small Python objects and are pickled
+  in-band too. A model the compiler does not support is stored without a
+  scorer and then loads no faster than its `.pkl`.
+
+`python -m ai.loader convert models/model.pkl` writes `models/model.skmm`;
+`python -m ai.loader bench models/model.pkl` compares load times.
+"""
+
 from pathlib import Path
+import hashlib
+import mmap
 import pickle
 import json
-from typing import Any, Dict, Optional
+import struct
+from typing import Any, Dict, List, Optional, Tuple
+
+MMAP_MAGIC = b"SKMM0001"
+MMAP_SUFFIX = ".skmm"
+# Preferred first: a converted .skmm wins over the .pkl it was made from
+MODEL_SUFFIXES = (MMAP_SUFFIX, ".pkl")
+_ALIGN = 64
+_HEADER = struct.Struct("<8sQ")
 
 
 def find_model_file(search_dirs=("models", ".")) -> Optional[Path]:
-    """Return the first .pkl file found in the provided search dirs."""
+    """Return the first model file (.skmm, then .pkl) found in the provided search dirs."""
     for d in search_dirs:
         p = Path(d)
         if not p.exists():
             continue
         # search non-recursively first
-        for f in p.glob("*.pkl"):
-            return f
+        for suffix in MODEL_SUFFIXES:
+            for f in p.glob("*" + suffix):
+                return f
         # fallback to recursive search
-        for f in p.rglob("*.pkl"):
-            return f
+        for suffix in MODEL_SUFFIXES:
+            for f in p.rglob("*" + suffix):
+                return f
     return None
 
 
-def load_model(path: Path) -> Any:
-    """Safely load a pickle model. Raises if loading fails."""
-    # `path` should be a Path pointing to the .pkl file. Handle the case where
+def _resolve_model_path(path: Path) -> Path:
+    # `path` should be a Path pointing to the model file. Handle the case where
     # a directory or a string was passed accidentally by resolving to an actual
-    # .pkl file when needed.
+    # model file when needed.
     model_path = Path(path)
     if model_path.is_dir():
-        # search inside the directory for a .pkl
+        # search inside the directory for a model file
         candidate = find_model_file((str(model_path),))
         if candidate is None:
-            raise FileNotFoundError(f"No .pkl model found in directory: {model_path}")
+            raise FileNotFoundError(f"No model file found in directory: {model_path}")
         model_path = candidate
+    return model_path
+
+
+def load_model(path: Path) -> Any:
+    """Safely load a pickle (or memory-mapped .skmm) model. Raises if loading fails."""
+    return load_artifact(path)[0]
+
+
+def load_artifact(path: Path) -> Tuple[Any, Optional[Any]]:
+    """`(model, scorer)`: the scorer stored in a .skmm artifact, else None."""
+    model_path = _resolve_model_path(path)
+    if is_mmap_artifact(model_path):
+        return load_mmap(model_path)
 
     # Open the model file in binary read mode and unpickle it.
     with model_path.open("rb") as f:
-        return pickle.load(f)
+        return pickle.load(f), None
+
+
+def is_mmap_artifact(path: Path) -> bool:
+    """True if `path` is a .skmm artifact (checked by magic bytes, not suffix)."""
+    try:
+        with Path(path).open("rb") as f:
+            return f.read(len(MMAP_MAGIC)) == MMAP_MAGIC
+    except OSError:
+        return False
+
+
+def _aligned(offset: int) -> int:
+    return (offset + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def save_mmap(model: Any, path: Path, scorer: Any = None) -> Dict:
+    """Write `model` (and its compiled `scorer`, if any) as a .skmm artifact; return its index."""
+    model_stream = pickle.dumps(model, protocol=5)
+    buffers: List[pickle.PickleBuffer] = []
+    scorer_stream = b""
+    if scorer is not None:
+        scorer_stream = pickle.dumps(scorer, protocol=5, buffer_callback=buffers.append)
+    views = [b.raw() for b in buffers]
+
+    # The index holds absolute offsets, which depend on the index's own
+    # length; lay out until that length stops changing.
+    index: Dict[str, Any] = {}
+    while True:
+        encoded = json.dumps(index, separators=(",", ":")).encode("utf-8")
+        offset = _aligned(_HEADER.size + len(encoded))
+        layout: Dict[str, Any] = {"format": 2, "pickle": [offset, len(model_stream)]}
+        offset = _aligned(offset + len(model_stream))
+        layout["scorer"] = [offset, len(scorer_stream)] if scorer is not None else None
+        offset = _aligned(offset + len(scorer_stream))
+        layout["buffers"] = []
+        for view in views:
+            layout["buffers"].append([offset, view.nbytes])
+            offset = _aligned(offset + view.nbytes)
+        if layout == index:
+            break
+        index = layout
+
+    sections = [(index["pickle"][0], model_stream)]
+    if scorer is not None:
+        sections.append((index["scorer"][0], scorer_stream))
+    sections += [(start, view) for (start, _), view in zip(index["buffers"], views)]
+
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("wb") as f:
+        f.write(_HEADER.pack(MMAP_MAGIC, len(encoded)))
+        f.write(encoded)
+        for start, data in sections:
+            f.write(b"\0" * (start - f.tell()))
+            f.write(data)
+    tmp.replace(path)  # never leave a half-written artifact under the real name
+    return index
+
+
+def _read_index(view: memoryview, path: Path) -> Dict:
+    magic, index_len = _HEADER.unpack_from(view, 0)
+    if magic != MMAP_MAGIC:
+        raise ValueError(f"{path} is not a {MMAP_SUFFIX} model artifact")
+    return json.loads(bytes(view[_HEADER.size:_HEADER.size + index_len]))
+
+
+def load_mmap(path: Path) -> Tuple[Any, Optional[Any]]:
+    """Load a .skmm artifact: `(model, scorer)`, the scorer's arrays mapped from the file."""
+    with Path(path).open("rb") as f:
+        # ACCESS_COPY: pages are shared until written, and arrays stay writeable
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    view = memoryview(mm)
+    index = _read_index(view, path)
+    if index.get("format") != 2:
+        raise ValueError(f"{path}: unsupported {MMAP_SUFFIX} format "
+                         f"{index.get('format')!r}; re-run `python -m ai.loader convert`")
+    start, length = index["pickle"]
+    model = pickle.loads(view[start:start + length])
+    scorer = None
+    if index["scorer"] is not None:
+        start, length = index["scorer"]
+        buffers = [view[off:off + n] for off, n in index["buffers"]]
+        # The scorer's arrays reference `mm` through these views, which keeps
+        # the mapping alive for as long as the scorer is.
+        scorer = pickle.loads(view[start:start + length], buffers=buffers)
+    return model, scorer
+
+
+def convert_to_mmap(src: Path, dst: Optional[Path] = None) -> Path:
+    """Convert a pickle model to a .skmm artifact next to it (or at `dst`)."""
+    from ai.compiled import try_compile
+
+    src = Path(src)
+    dst = Path(dst) if dst is not None else src.with_suffix(MMAP_SUFFIX)
+    with src.open("rb") as f:
+        model = pickle.load(f)
+    save_mmap(model, dst, try_compile(model)[0])
+    return dst
 
 
 def find_metadata(path: Path) -> Dict:
@@ -47,3 +199,103 @@ def find_metadata(path: Path) -> Dict:
         except Exception:
             return {}
     return {}
+
+
+def model_fingerprint(path: Path, meta: Optional[Dict] = None) -> str:
+    """Short identifier that changes whenever the model file or its metadata does."""
+    st = Path(path).stat()
+    h = hashlib.blake2b(digest_size=8)
+    h.update(f"{Path(path).resolve()}:{st.st_mtime_ns}:{st.st_size}".encode("utf-8"))
+    h.update(json.dumps(meta or {}, sort_keys=True, default=str).encode("utf-8"))
+    return h.hexdigest()
+
+
+def read_index(path: Path) -> Dict:
+    """The JSON index of a .skmm artifact (section offsets and lengths)."""
+    with Path(path).open("rb") as f:
+        magic, index_len = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != MMAP_MAGIC:
+            raise ValueError(f"{path} is not a {MMAP_SUFFIX} model artifact")
+        return json.loads(f.read(index_len))
+
+
+def benchmark(path: Path, repeat: int = 20) -> Dict[str, Any]:
+    """Time loading a .pkl against its .skmm twin, each ready to serve.
+
+    A .pkl load is `pickle.load` plus `try_compile` (what the registry does
+    with it); a .skmm load is `load_mmap`, which maps the stored scorer.
+    The .skmm is created (in a temporary directory) if it does not exist.
+    Each loader runs once untimed first so imports are not counted.
+    """
+    import statistics
+    import tempfile
+    import time
+
+    from ai.compiled import try_compile
+
+    src = Path(path)
+    mm_path = src.with_suffix(MMAP_SUFFIX)
+    tmpdir = None
+    if not mm_path.exists():
+        tmpdir = tempfile.TemporaryDirectory()
+        mm_path = convert_to_mmap(src, Path(tmpdir.name) / (src.stem + MMAP_SUFFIX))
+
+    def _pickle_load():
+        with src.open("rb") as f:
+            return pickle.load(f)
+
+    def _time(fn) -> Dict[str, float]:
+        fn()
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            fn()
+            samples.append((time.perf_counter() - started) * 1000.0)
+        return {
+            "median_ms": round(statistics.median(samples), 3),
+            "min_ms": round(min(samples), 3),
+            "max_ms": round(max(samples), 3),
+        }
+
+    try:
+        index = read_index(mm_path)
+        return {
+            "pickle": {"path": str(src), "bytes": src.stat().st_size, **_time(_pickle_load)},
+            "pickle_and_compile": _time(lambda: try_compile(_pickle_load())),
+            "mmap": {
+                "path": str(mm_path),
+                "bytes": mm_path.stat().st_size,
+                "model_pickle_bytes": index["pickle"][1],
+                "has_scorer": index["scorer"] is not None,
+                # The only bytes used in place from the mapping, and so the
+                # only ones worker processes share
+                "mapped_buffers": len(index["buffers"]),
+                "mapped_bytes": sum(n for _, n in index["buffers"]),
+                **_time(lambda: load_mmap(mm_path)),
+            },
+            "repeat": repeat,
+        }
+    finally:
+        if tmpdir is not None:
+            tmpdir.cleanup()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="python -m ai.loader")
+    commands = parser.add_subparsers(dest="command", required=True)
+    convert_cmd = commands.add_parser("convert", help="convert a .pkl model to .skmm")
+    convert_cmd.add_argument("src")
+    convert_cmd.add_argument("dst", nargs="?")
+    bench_cmd = commands.add_parser("bench", help="compare pickle and mmap load times")
+    bench_cmd.add_argument("src")
+    bench_cmd.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        out = convert_to_mmap(Path(args.src), Path(args.dst) if args.dst else None)
+        scorer = "with" if read_index(out)["scorer"] is not None else "without"
+        print(f"wrote {out} ({scorer} a compiled scorer)")
+    else:
+        print(json.dumps(benchmark(Path(args.src), args.repeat), indent=2))
@@ -0,0 +1,390 @@
+"""Versioned model registry with background loading and atomic swaps.
+
+Every model file (`.skmm` or `.pkl`, see `ai.loader`) directly under the
+models directory is a version named after its stem (`models/v2.pkl` -> "v2"),
+and so is every subdirectory holding one (`models/v3/model.pkl` -> "v3").
+
+Candidates are loaded and warmed (one throwaway prediction, so lazy
+initialisation happens before real traffic sees the model) on a background
+thread while the current version keeps serving. Activation then replaces a
+single reference, so each request sees either the old model or the new one,
+never a mix. The previously active version stays in memory for an instant
+`rollback()`; anything else is unloaded after a swap.
+"""
+
+import logging
+import pickle
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from ai.compiled import try_compile
+from ai.loader import MODEL_SUFFIXES, find_metadata, load_artifact, model_fingerprint
+
+logger = logging.getLogger("uvicorn.error")
+
+
+class UnknownModelVersion(LookupError):
+    """No model version with that name is registered."""
+
+
+class ModelNotReady(RuntimeError):
+    """The version has not been loaded (or failed to load)."""
+
+
+class _ByteCounter:
+    """Write-only sink that just counts bytes (for `_estimate_size`)."""
+
+    def __init__(self):
+        self.count = 0
+
+    def write(self, data) -> int:
+        n = memoryview(data).nbytes
+        self.count += n
+        return n
+
+
+def _estimate_size(obj: Any) -> Optional[int]:
+    """Approximate in-memory size of a model as its serialized size.
+
+    Fitted estimators keep almost everything in NumPy arrays (tree nodes,
+    coefficients), which pickle writes out byte for byte, so this is a close
+    estimate. The pickle is streamed into a counter and never held in memory.
+    """
+    sink = _ByteCounter()
+    try:
+        pickle.Pickler(sink, protocol=pickle.HIGHEST_PROTOCOL).dump(obj)
+    except Exception:
+        return None
+    return sink.count
+
+
+def version_sort_key(name: str) -> list:
+    """Natural order for version names, so "v10" sorts after "v2"."""
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", name)]
+
+
+class ModelVersion:
+    """One model artifact and, once loaded, the model itself."""
+
+    def __init__(self, name: str, path: Path):
+        self.name = name
+        self.path = Path(path)
+        self.state = "available"  # loading | ready | failed
+        self.model: Any = None
+        self.meta: Dict = {}
+        self.fingerprint: Optional[str] = None
+        self.error: Optional[str] = None
+        self.loaded_at: Optional[float] = None
+        self.load_seconds: Optional[float] = None
+        self.warmup_ms: Optional[float] = None
+        self.memory_bytes: Optional[int] = None
+        self.scorer = None  # ai.compiled.CompiledPipeline, when compilation is on and succeeded
+        self.compile_error: Optional[str] = None
+
+    def info(self) -> dict:
+        try:
+            file_bytes = self.path.stat().st_size
+        except OSError:
+            file_bytes = None
+        return {
+            "version": self.name,
+            "path": str(self.path),
+            "state": self.state,
+            "type": str(type(self.model)) if self.model is not None else None,
+            "fingerprint": self.fingerprint,
+            "loaded_at": self.loaded_at,
+            "load_seconds": self.load_seconds,
+            "warmup_ms": self.warmup_ms,
+            "memory_bytes": self.memory_bytes,
+            "file_bytes": file_bytes,
+            "compiled": self.scorer.stats() if self.scorer is not None else None,
+            "compile_error": self.compile_error,
+            "meta": self.meta,
+            "error": self.error,
+        }
+
+
+class ModelRegistry:
+    """Tracks model versions on disk and which one is serving.
+
+    `warmup(model)` is called after each load; an exception there fails the
+    load, so a model that cannot predict is never activated. Callbacks
+    registered with `on_swap` run after every activation or rollback with
+    the new and previous versions; those registered with `on_change` after
+    anything `versions()` reports changes (a scan finding or dropping
+    versions, a load starting or finishing, a swap). With `compile`, each loaded model also
+    gets a verified `ai.compiled` scorer when its pipeline is supported.
+    """
+
+    def __init__(self, directory: str = "models",
+                 warmup: Optional[Callable[[Any], Any]] = None,
+                 compile: bool = False):
+        self.directory = Path(directory)
+        self._warmup = warmup
+        self.compile = compile
+        self._lock = threading.RLock()
+        # Loads run one at a time: they are CPU/memory heavy and rare
+        self._load_lock = threading.Lock()
+        self._versions: Dict[str, ModelVersion] = {}
+        self._loaders: Dict[str, threading.Thread] = {}
+        self._swap_callbacks: List[Callable[[ModelVersion, Optional[ModelVersion]], Any]] = []
+        self._change_callbacks: List[Callable[[], Any]] = []
+        self.active: Optional[ModelVersion] = None
+        self.previous: Optional[ModelVersion] = None
+        self._swaps = 0
+
+    # -- discovery ----------------------------------------------------------
+
+    def _discover(self) -> Dict[str, Path]:
+        found: Dict[str, Path] = {}
+        if not self.directory.is_dir():
+            return found
+        # MODEL_SUFFIXES is in preference order, so a converted .skmm shadows
+        # the .pkl it was made from
+        for suffix in MODEL_SUFFIXES:
+            for entry in sorted(self.directory.iterdir()):
+                if entry.is_file() and entry.suffix == suffix:
+                    found.setdefault(entry.stem, entry)
+                elif entry.is_dir():
+                    candidates = sorted(entry.glob("*" + suffix))
+                    if candidates:
+                        found.setdefault(entry.name, candidates[0])
+        return found
+
+    def scan(self) -> List[str]:
+        """Sync the registry with the models directory; return version names.
+
+        New files become "available" versions; versions whose file is gone are
+        dropped unless they are serving (active or previous).
+        """
+        found = self._discover()
+        with self._lock:
+            before = dict(self._versions)
+            for name, path in found.items():
+                version = self._versions.get(name)
+                if version is None or (version.path != path and version.state != "loading"
+                                       and version not in (self.active, self.previous)):
+                    self._versions[name] = ModelVersion(name, path)
+            for name in list(self._versions):
+                version = self._versions[name]
+                if (name not in found and not self._is_external(version)
+                        and version not in (self.active, self.previous)
+                        and version.state != "loading"):
+                    del self._versions[name]
+            changed = self._versions != before
+            names = sorted(self._versions)
+        if changed:
+            self._changed()
+        return names
+
+    def _is_external(self, version: ModelVersion) -> bool:
+        try:
+            version.path.resolve().relative_to(self.directory.resolve())
+            return False
+        except ValueError:
+            return True
+
+    def register(self, path: Path, name: Optional[str] = None) -> ModelVersion:
+        """Return the version for `path`, registering it if it is not known yet.
+
+        Used for a model file outside the models directory (`MODEL_FILE`).
+        """
+        path = Path(path)
+        name = name or path.stem
+        with self._lock:
+            for version in self._versions.values():
+                if version.path.resolve() == path.resolve():
+                    return version
+            version = self._versions.get(name)
+            if version is not None:
+                return version
+            version = self._versions[name] = ModelVersion(name, path)
+        self._changed()
+        return version
+
+    def latest(self) -> Optional[str]:
+        """Name of the newest registered version (last in `version_sort_key` order)."""
+        with self._lock:
+            return max(self._versions, key=version_sort_key, default=None)
+
+    def get(self, name: str) -> ModelVersion:
+        with self._lock:
+            version = self._versions.get(name)
+        if version is None:
+            raise UnknownModelVersion(f"unknown model version: {name}")
+        return version
+
+    # -- loading ------------------------------------------------------------
+
+    def load(self, name: str) -> ModelVersion:
+        """Load and warm a version on the calling thread (no-op if ready)."""
+        version = self.get(name)
+        with self._load_lock:
+            if version.state == "ready":
+                return version
+            version.state = "loading"
+            version.error = None
+            self._changed()
+            started = time.monotonic()
+            try:
+                model, stored_scorer = load_artifact(version.path)
+                meta = find_metadata(version.path)
+                if not self.compile:
+                    scorer, compile_error = None, None
+                elif stored_scorer is not None:
+                    # Verified when the .skmm was written; its arrays are mapped
+                    scorer, compile_error = stored_scorer, None
+                else:
+                    scorer, compile_error = try_compile(model)
+                if compile_error is not None:
+                    logger.info("Model version %s runs uncompiled: %s", name, compile_error)
+                warm_started = time.monotonic()
+                if self._warmup is not None:
+                    self._warmup(model)
+                warmup_ms = (time.monotonic() - warm_started) * 1000.0
+            except Exception as e:
+                logger.exception("Failed to load model version %s: %s", name, e)
+                version.state = "failed"
+                version.error = str(e)
+                self._changed()
+                raise
+            fingerprint = model_fingerprint(version.path, meta)
+            memory_bytes = _estimate_size(model)
+            with self._lock:
+                version.model = model
+                version.scorer = scorer
+                version.compile_error = compile_error
+                version.meta = meta
+                version.fingerprint = fingerprint
+                version.load_seconds = round(time.monotonic() - started, 6)
+                version.warmup_ms = round(warmup_ms, 3)
+                version.memory_bytes = memory_bytes
+                version.loaded_at = time.time()
+                version.state = "ready"
+        self._changed()
+        logger.info("Loaded model version %s from %s", name, version.path)
+        return version
+
+    def load_in_background(self, name: str, activate: bool = False) -> ModelVersion:
+        """Start loading a version on a background thread.
+
+        With `activate`, the version is swapped in once it is loaded and warm.
+        """
+        version = self.get(name)
+        with self._lock:
+            if version.state == "ready":
+                if activate:
+                    self.activate(name)
+                return version
+            if name in self._loaders:
+                return version
+            version.state = "loading"
+            thread = threading.Thread(
+                target=self._load_then_maybe_activate, args=(name, activate),
+                name=f"model-loader-{name}", daemon=True,
+            )
+            self._loaders[name] = thread
+        self._changed()
+        thread.start()
+        return version
+
+    def _load_then_maybe_activate(self, name: str, activate: bool) -> None:
+        try:
+            self.load(name)
+            if activate:
+                self.activate(name)
+        except Exception:
+            pass  # recorded on the version by load()
+        finally:
+            with self._lock:
+                self._loaders.pop(name, None)
+
+    def _unload(self, version: ModelVersion) -> None:
+        # Called with the lock held: back to what a never-loaded version reports
+        version.state = "available"
+        version.model = None
+        version.scorer = None
+        version.compile_error = None
+        version.meta = {}
+        version.fingerprint = None
+        version.loaded_at = None
+        version.load_seconds = None
+        version.warmup_ms = None
+        version.memory_bytes = None
+
+    # -- swapping -----------------------------------------------------------
+
+    def on_change(self, callback: Callable[[], Any]) -> None:
+        self._change_callbacks.append(callback)
+
+    def _changed(self) -> None:
+        for callback in self._change_callbacks:
+            try:
+                callback()
+            except Exception:
+                logger.exception("Model registry change callback failed")
+
+    def on_swap(self, callback: Callable[[ModelVersion, Optional[ModelVersion]], Any]) -> None:
+        self._swap_callbacks.append(callback)
+
+    def _swap_to(self, version: Optional[ModelVersion] = None) -> ModelVersion:
+        """Make `version` (default: the previous one) active, if it is loaded.
+
+        The readiness check and the swap happen under one lock acquisition,
+        so a concurrent swap cannot unload the version in between.
+        """
+        with self._lock:
+            if version is None:
+                version = self.previous
+                if version is None or version.state != "ready":
+                    raise ModelNotReady("no previous model version to roll back to")
+            if version.state != "ready":
+                raise ModelNotReady(f"model version {version.name} is {version.state}, not ready")
+            if version is self.active:
+                return version
+            old = self.active
+            self.active = version
+            self.previous = old
+            self._swaps += 1
+            for other in self._versions.values():
+                if other not in (self.active, self.previous) and other.state == "ready":
+                    self._unload(other)
+        logger.info(
+            "Model version %s active (previous: %s)",
+            version.name, old.name if old is not None else None,
+        )
+        self._changed()
+        for callback in self._swap_callbacks:
+            try:
+                callback(version, old)
+            except Exception:
+                logger.exception("Model swap callback failed")
+        return version
+
+    def activate(self, name: str) -> ModelVersion:
+        """Make a loaded version the one serving predictions."""
+        return self._swap_to(self.get(name))
+
+    def rollback(self) -> ModelVersion:
+        """Swap back to the previously active version."""
+        return self._swap_to()
+
+    # -- introspection ------------------------------------------------------
+
+    def versions(self) -> List[dict]:
+        with self._lock:
+            return [self._versions[name].info() for name in sorted(self._versions)]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "directory": str(self.directory),
+                "active": self.active.name if self.active is not None else None,
+                "previous": self.previous.name if self.previous is not None else None,
+                "versions": len(self._versions),
+                "loading": sorted(self._loaders),
+                "swaps": self._swaps,
+            }
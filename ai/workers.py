@@ -0,0 +1,415 @@
+"""Pool of dedicated inference processes.
+
+sklearn's ColumnTransformer/OneHotEncoder do a lot of GIL-holding Python
+work per call, so threads in one process do not scale `/predict` across
+cores. With `INFERENCE_WORKERS > 0` the active model is also loaded in that
+many worker processes and each batch is sent to whichever worker is idle.
+
+Feature engineering stays in the web process. Numeric feature columns and the
+returned probabilities go through a per-worker shared memory block (no
+pickling of arrays); only the string columns and a short control message
+travel over the worker's pipe. A monitor thread pings idle workers and
+replaces dead ones. A worker that crashes or hangs mid-batch is killed and
+restarted, and that batch fails with `WorkerError`.
+"""
+
+import logging
+import multiprocessing
+from multiprocessing import shared_memory
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger("uvicorn.error")
+
+# Upper bound on numeric feature columns per batch (sizes the input block)
+_MAX_NUMERIC_COLUMNS = 16
+_STARTUP_TIMEOUT = 60.0
+_PING_TIMEOUT = 5.0
+
+
+class WorkerError(RuntimeError):
+    """A batch could not be scored by the worker pool."""
+
+
+class WorkerPoolClosed(WorkerError):
+    """The pool was shut down (e.g. replaced after a model swap)."""
+
+
+# -- worker process ---------------------------------------------------------
+
+def _worker_score(model: Any, scorer: Any, max_rows: int, msg: tuple, shm_in, shm_out) -> tuple:
+    from ai.compiled import run_model
+
+    _, n, order, numeric, objects = msg
+    block = np.ndarray((n, len(numeric)), dtype=np.float64, buffer=shm_in.buf)
+    positions = {name: (j, dtype) for j, (name, dtype) in enumerate(numeric)}
+    features: Dict[str, Any] = {}
+    for name in order:
+        if name in positions:
+            j, dtype = positions[name]
+            features[name] = block[:, j].astype(dtype)
+        else:
+            features[name] = np.array(objects[name], dtype=object)
+    del block
+    probs, preds = run_model(model, features, scorer, max_rows)
+    if probs is not None:
+        out = np.ndarray(probs.shape, dtype=np.float64, buffer=shm_out.buf)
+        out[:] = probs
+        del out
+        return ("ok", probs.shape[1], None)
+    return ("ok", 0, preds)
+
+
+def _worker_main(conn, path: str, in_name: str, out_name: str,
+                 compile: bool = False, compiled_max_rows: int = 256) -> None:
+    from ai.compiled import try_compile
+    from ai.loader import load_artifact
+
+    model, scorer = load_artifact(path)
+    if not compile:
+        scorer = None
+    elif scorer is None:
+        scorer = try_compile(model)[0]
+    shm_in = shared_memory.SharedMemory(name=in_name)
+    shm_out = shared_memory.SharedMemory(name=out_name)
+    conn.send(("ready", os.getpid()))
+    try:
+        while True:
+            try:
+                msg = conn.recv()
+            except (EOFError, OSError):
+                break  # parent went away
+            if msg[0] == "stop":
+                break
+            if msg[0] == "ping":
+                conn.send(("pong",))
+                continue
+            try:
+                reply = _worker_score(model, scorer, compiled_max_rows, msg, shm_in, shm_out)
+            except Exception as e:
+                reply = ("error", f"{type(e).__name__}: {e}")
+            conn.send(reply)
+    finally:
+        shm_in.close()
+        shm_out.close()
+
+
+# -- parent side -------------------------------------------------------------
+
+class _Worker:
+    def __init__(self, index: int, capacity: int, n_outputs: int):
+        self.index = index
+        self.shm_in = shared_memory.SharedMemory(
+            create=True, size=capacity * _MAX_NUMERIC_COLUMNS * 8
+        )
+        self.shm_out = shared_memory.SharedMemory(
+            create=True, size=capacity * max(1, n_outputs) * 8
+        )
+        self.process = None
+        self.conn = None
+        self.started_at = 0.0
+
+    def release(self) -> None:
+        for shm in (self.shm_in, self.shm_out):
+            try:
+                shm.close()
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def _columns(features: Mapping[str, Any]) -> Dict[str, np.ndarray]:
+    # Scalars (from engineer_row) become one-element columns
+    return {
+        name: value if isinstance(value, np.ndarray) else np.asarray([value])
+        for name, value in features.items()
+    }
+
+
+class InferenceWorkerPool:
+    """Fixed-size pool of processes that each hold a copy of one model.
+
+    `path` is the model file (`.pkl` or `.skmm`) and `n_outputs` the number
+    of probability columns it returns (`len(model.classes_)`). `capacity` is
+    the most rows sent to a worker at once; larger batches are split. With
+    `compile`, workers also use the `ai.compiled` scorer for small batches:
+    the one stored in a `.skmm`, whose node arrays are mapped and so shared
+    between workers, or else one each worker compiles for itself.
+    `version` is an opaque tag for the model the pool serves (the app passes
+    its registry `ModelVersion`), so callers can tell a stale pool apart.
+    """
+
+    def __init__(self, path: str, n_outputs: int, workers: int = 2,
+                 capacity: int = 1024, timeout: float = 30.0,
+                 health_interval: float = 5.0, compile: bool = False,
+                 compiled_max_rows: int = 256, version: Any = None):
+        self.path = str(path)
+        self.version = version
+        self.n_outputs = n_outputs
+        self.workers = max(1, workers)
+        self.capacity = max(1, capacity)
+        self.timeout = timeout
+        self.health_interval = health_interval
+        self.compile = compile
+        self.compiled_max_rows = compiled_max_rows
+
+        methods = multiprocessing.get_all_start_methods()
+        # Same reasoning as the password hasher: never fork a process that
+        # already runs server threads.
+        self._ctx = multiprocessing.get_context(
+            "forkserver" if "forkserver" in methods else "spawn"
+        )
+        self._workers: List[_Worker] = []
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        self._closed = False
+        self._monitor: Optional[threading.Thread] = None
+        self._stop_monitor = threading.Event()
+
+        self._lock = threading.Lock()
+        self._batches = 0
+        self._rows = 0
+        self._errors = 0
+        self._timeouts = 0
+        self._restarts = 0
+        self._busy_time = 0.0
+
+    # -- lifecycle ----------------------------------------------------------
+
+    def start(self) -> "InferenceWorkerPool":
+        """Start every worker and wait until each has loaded the model."""
+        try:
+            for index in range(self.workers):
+                worker = _Worker(index, self.capacity, self.n_outputs)
+                self._workers.append(worker)
+                self._spawn(worker)
+                self._idle.put(worker)
+        except BaseException:
+            self.close()
+            raise
+        if self.health_interval > 0:
+            self._monitor = threading.Thread(
+                target=self._monitor_loop, name="inference-workers-monitor", daemon=True
+            )
+            self._monitor.start()
+        return self
+
+    def _spawn(self, worker: _Worker) -> None:
+        parent_conn, child_conn = self._ctx.Pipe()
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(child_conn, self.path, worker.shm_in.name, worker.shm_out.name,
+                  self.compile, self.compiled_max_rows),
+            name=f"inference-worker-{worker.index}",
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        worker.process = process
+        worker.conn = parent_conn
+        worker.started_at = time.monotonic()
+        try:
+            ready = parent_conn.poll(_STARTUP_TIMEOUT) and parent_conn.recv()[0] == "ready"
+        except (EOFError, OSError):
+            ready = False
+        if not ready:
+            self._kill(worker)
+            raise WorkerError(f"inference worker {worker.index} failed to start")
+
+    def _kill(self, worker: _Worker) -> None:
+        if worker.conn is not None:
+            worker.conn.close()
+            worker.conn = None
+        if worker.process is not None:
+            worker.process.kill()
+            worker.process.join(timeout=5)
+            worker.process = None
+
+    def _restart(self, worker: _Worker) -> None:
+        self._kill(worker)
+        with self._lock:
+            self._restarts += 1
+        logger.warning("Restarting inference worker %d", worker.index)
+        self._spawn(worker)
+
+    def _stop(self, worker: _Worker) -> None:
+        try:
+            worker.conn.send(("stop",))
+            worker.process.join(timeout=5)
+        except Exception:
+            pass
+        self._kill(worker)
+        worker.release()
+
+    def _checkin(self, worker: _Worker) -> None:
+        if self._closed:
+            self._stop(worker)
+        else:
+            self._idle.put(worker)
+
+    def close(self) -> None:
+        """Stop the workers. Busy ones are stopped when their batch finishes."""
+        self._closed = True
+        self._stop_monitor.set()
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._stop(worker)
+        for worker in self._workers:
+            if worker.process is None:
+                worker.release()
+
+    # -- health -------------------------------------------------------------
+
+    def _healthy(self, worker: _Worker) -> bool:
+        if worker.process is None or not worker.process.is_alive():
+            return False
+        try:
+            worker.conn.send(("ping",))
+            return worker.conn.poll(_PING_TIMEOUT) and worker.conn.recv()[0] == "pong"
+        except (EOFError, OSError):
+            return False
+
+    def _monitor_loop(self) -> None:
+        while not self._stop_monitor.wait(self.health_interval):
+            # Only idle workers are checked; busy ones are covered by dispatch
+            for _ in range(self.workers):
+                try:
+                    worker = self._idle.get_nowait()
+                except queue.Empty:
+                    break
+                try:
+                    if not self._healthy(worker):
+                        self._restart(worker)
+                except Exception:
+                    logger.exception("Inference worker %d health check failed", worker.index)
+                finally:
+                    self._checkin(worker)
+
+    # -- dispatch -----------------------------------------------------------
+
+    def _checkout(self) -> _Worker:
+        deadline = time.monotonic() + self.timeout
+        while True:
+            if self._closed:
+                raise WorkerPoolClosed("inference worker pool is closed")
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                with self._lock:
+                    self._timeouts += 1
+                raise WorkerError(f"no inference worker available within {self.timeout:.1f}s")
+            try:
+                worker = self._idle.get(timeout=min(remaining, 0.1))
+            except queue.Empty:
+                continue
+            if worker.process is None or not worker.process.is_alive():
+                # Died while idle (or a previous restart failed): replace it
+                # now rather than fail the batch.
+                try:
+                    self._restart(worker)
+                except WorkerError:
+                    self._checkin(worker)
+                    raise
+            return worker
+
+    def _send(self, worker: _Worker, columns: Dict[str, np.ndarray],
+              start: int, stop: int) -> Tuple[Optional[np.ndarray], Optional[list]]:
+        n = stop - start
+        numeric: List[Tuple[str, str]] = []
+        objects: Dict[str, list] = {}
+        for name, column in columns.items():
+            if column.dtype.kind in "biuf":
+                numeric.append((name, column.dtype.str))
+            else:
+                objects[name] = column[start:stop].tolist()
+        if len(numeric) > _MAX_NUMERIC_COLUMNS:
+            raise WorkerError(f"too many numeric feature columns ({len(numeric)})")
+        block = np.ndarray((n, len(numeric)), dtype=np.float64, buffer=worker.shm_in.buf)
+        for j, (name, _) in enumerate(numeric):
+            block[:, j] = columns[name][start:stop]
+        del block
+
+        try:
+            worker.conn.send(("predict", n, list(columns), numeric, objects))
+        except OSError:
+            self._restart(worker)
+            raise WorkerError("inference worker crashed") from None
+        if not worker.conn.poll(self.timeout):
+            with self._lock:
+                self._timeouts += 1
+            self._restart(worker)
+            raise WorkerError(f"inference worker timed out after {self.timeout:.1f}s")
+        try:
+            reply = worker.conn.recv()
+        except (EOFError, OSError):
+            self._restart(worker)
+            raise WorkerError("inference worker crashed while scoring a batch") from None
+        if reply[0] == "error":
+            raise WorkerError(reply[1])
+        _, n_outputs, preds = reply
+        if preds is not None:
+            return None, preds
+        out = np.ndarray((n, n_outputs), dtype=np.float64, buffer=worker.shm_out.buf)
+        probs = out.copy()
+        del out
+        return probs, None
+
+    def predict(self, features: Mapping[str, Any]) -> Tuple[Optional[np.ndarray], Optional[list]]:
+        """Score engineered features; return `(probabilities, None)` or `(None, predictions)`."""
+        columns = _columns(features)
+        total = len(next(iter(columns.values()))) if columns else 0
+        probs_parts: List[np.ndarray] = []
+        preds: List[Any] = []
+        started = time.monotonic()
+        try:
+            for start in range(0, total, self.capacity):
+                stop = min(total, start + self.capacity)
+                worker = self._checkout()
+                try:
+                    probs, part = self._send(worker, columns, start, stop)
+                finally:
+                    self._checkin(worker)
+                if probs is not None:
+                    probs_parts.append(probs)
+                else:
+                    preds.extend(part)
+        except BaseException:
+            with self._lock:
+                self._errors += 1
+            raise
+        with self._lock:
+            self._batches += 1
+            self._rows += total
+            self._busy_time += time.monotonic() - started
+        if probs_parts:
+            return np.concatenate(probs_parts), None
+        if preds:
+            return None, preds
+        return np.empty((0, self.n_outputs)), None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "path": self.path,
+                "workers": self.workers,
+                "alive": sum(
+                    1 for w in self._workers
+                    if w.process is not None and w.process.is_alive()
+                ),
+                "idle": self._idle.qsize(),
+                "capacity": self.capacity,
+                "batches": self._batches,
+                "rows": self._rows,
+                "errors": self._errors,
+                "timeouts": self._timeouts,
+                "restarts": self._restarts,
+                "avg_batch_ms": round(self._busy_time / self._batches * 1000, 3)
+                if self._batches else 0.0,
+                "pids": [w.process.pid for w in self._workers if w.process is not None],
+            }
@@ -0,0 +1,121 @@
+"""Deferred loading of the AI routes and startup model (`LAZY_STARTUP=1`).
+
+Importing app.py pulls in NumPy and the AI modules, and `init_model`
+unpickles the startup model (which imports sklearn) and warms it up. Workers
+that only serve user traffic should not wait for either before accepting
+requests. In lazy mode main.py registers placeholder routes for the AI paths
+instead, and `AILoader.start` imports app.py, swaps its router in and loads
+the model on a background thread.
+
+Until the router is in, the placeholders answer 503 with `Retry-After`.
+After that `/predict` answers 503 on its own until a model is active, exactly
+as it does when no model was found at startup.
+"""
+
+import logging
+import threading
+import time
+from typing import Callable, List, Optional
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from starlette.requests import Request
+from starlette.routing import BaseRoute, Route
+
+logger = logging.getLogger("uvicorn.error")
+
+# Every path served by app.ai_router
+AI_PATHS = ["/ai/health", "/models", "/models/{rest:path}", "/predict", "/predict/batch"]
+
+_METHODS = ["GET", "POST", "PUT", "DELETE"]
+
+
+class AILoader:
+    """Imports the AI routes and loads the startup model off the startup path."""
+
+    def __init__(self, app: FastAPI):
+        self.app = app
+        self.state = "pending"  # pending -> importing -> loading -> ready | failed
+        self.error: Optional[str] = None
+        self.import_seconds: Optional[float] = None
+        self.load_seconds: Optional[float] = None
+        self._placeholders: List[BaseRoute] = []
+        self._shutdown_model: Optional[Callable[[], None]] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def install_placeholders(self) -> None:
+        """Answer the AI paths with 503 until the real routes are in place"""
+        for path in AI_PATHS:
+            route = Route(path, self._not_ready, methods=_METHODS, include_in_schema=False)
+            self._placeholders.append(route)
+            self.app.router.routes.append(route)
+
+    async def _not_ready(self, request: Request) -> JSONResponse:
+        if self.state == "failed":
+            return JSONResponse(
+                status_code=503, content={"detail": f"AI routes unavailable: {self.error}"}
+            )
+        return JSONResponse(
+            status_code=503,
+            content={"detail": "Model is loading, please retry shortly"},
+            headers={"Retry-After": "1"},
+        )
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="ai-loader", daemon=True)
+            self._thread.start()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until loading has finished (used by tests and benchmarks)"""
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.state == "ready"
+
+    def _run(self) -> None:
+        started = time.perf_counter()
+        self.state = "importing"
+        try:
+            from app import ai_router, init_model, shutdown_model
+            self._shutdown_model = shutdown_model
+            self.app.include_router(ai_router)
+            # The real routes were appended behind the placeholders; drop those
+            # with a single assignment so requests being routed right now keep
+            # iterating a consistent list
+            self.app.router.routes = [
+                route for route in self.app.router.routes if route not in self._placeholders
+            ]
+            self.app.openapi_schema = None
+        except Exception as e:
+            logger.exception("Failed to import the AI routes: %s", e)
+            self.error = str(e)
+            self.state = "failed"
+            return
+        self.import_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        self.state = "loading"
+        try:
+            init_model()
+        except Exception as e:
+            # /predict keeps answering 503 "No model loaded", as in eager mode
+            logger.exception("AI model init failed: %s", e)
+            self.error = str(e)
+        self.load_seconds = time.perf_counter() - started
+        self.state = "ready"
+        logger.info(
+            "AI routes ready (import %.2fs, model load %.2fs)", self.import_seconds, self.load_seconds
+        )
+
+    def shutdown(self) -> None:
+        if self._shutdown_model is not None:
+            self._shutdown_model()
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "ready": self.state == "ready",
+            "import_seconds": self.import_seconds,
+            "load_seconds": self.load_seconds,
+            "error": self.error,
+        }
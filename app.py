@@ -1,25 +1,46 @@
 """AI prediction app: clean, robust endpoint to load a pickle model and serve predictions.
 
-This file replaces the previous, malformed `app.py`. It will attempt to find a
-`.pkl` model in a `models/` directory (or repository root) at startup using
-`ai.loader.find_model_file`. If no model is found the /predict endpoint returns
-503 until a model is available.
+This file replaces the previous, malformed `app.py`. Models are served from a
+versioned registry over the `models/` directory (`ai.registry`); at startup the
+version named by `MODEL_VERSION` (else the `MODEL_FILE` version, else the
+latest version name) is loaded and activated. Admins (`ADMIN_EMAILS`) can
+load, activate and roll back other versions through the `/models` endpoints
+without a restart. If no model is found the /predict endpoint returns 503
+until a model is available.
 """
 
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel, Field
-from typing import Optional
-import pandas as pd
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
 from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import hashlib
+import json
 import logging
+import time
 
-from ai.loader import find_model_file, load_model, find_metadata
+import config
+import http_cache
+import metrics
+from ai.audit import PredictionLog, prediction_entry
+from ai.batching import InferenceBatcher
+from ai.compiled import run_model
+from ai.features import INPUT_FIELDS, engineer_columns, engineer_records, engineer_row, to_model_input
+from ai.registry import ModelNotReady, ModelRegistry, UnknownModelVersion
+from ai.workers import InferenceWorkerPool, WorkerPoolClosed
+from auth.tokens import require_admin
+from caching import TTLCache
+from serialization import FastJSONResponse, dumps_line
+from uploads import RecordError, detect_format, iter_records, spool_request
 
 
 logger = logging.getLogger("uvicorn.error")
 
 # Expose router so main application can include these endpoints
 ai_router = APIRouter()
+# Routes that change which model serves; included into ai_router below
+model_admin_router = APIRouter(dependencies=[Depends(require_admin)])
 
 
 class PredictInput(BaseModel):
@@ -32,82 +53,465 @@ class PredictInput(BaseModel):
     occupation: Optional[str] = None
 
 
-# Globals to hold the loaded model and metadata
-MODEL = None
-MODEL_PATH: Optional[Path] = None
-MODEL_META: dict = {}
+# Input used to warm up every model version before it is activated
+_WARMUP_RECORD = {
+    "age": 30, "weight": 70.0, "height": 1.75, "income_lpa": 10.0,
+    "smoker": False, "city": "Mumbai", "occupation": "private_job",
+}
+
+
+def _warm_up(model: Any) -> None:
+    X = to_model_input(engineer_records([_WARMUP_RECORD]), model)
+    if hasattr(model, "predict_proba"):
+        model.predict_proba(X)
+    else:
+        model.predict(X)
+
+
+# Versioned models; `registry.active` is the one serving predictions
+registry = ModelRegistry(config.MODEL_DIR, warmup=_warm_up, compile=config.COMPILED_SCORER)
+
+# Optional cache of /predict results keyed on the normalized feature vector.
+# Keys include the model fingerprint; entries of other versions are dropped on swap.
+prediction_cache = TTLCache(config.PREDICT_CACHE_SIZE, config.PREDICT_CACHE_TTL)
+registry.on_swap(lambda new, old: prediction_cache.clear())
+# GET /models is revalidated against this counter (see http_cache.py)
+registry.on_change(lambda: http_cache.versions.bump("models"))
+
+# Audit trail of prediction inputs and outputs, written off the request path
+prediction_log: Optional[PredictionLog] = None
+if config.AUDIT_LOG_ENABLED:
+    prediction_log = PredictionLog(
+        config.AUDIT_LOG_PATH,
+        capacity=config.AUDIT_LOG_CAPACITY,
+        batch_size=config.AUDIT_LOG_BATCH_SIZE,
+        flush_interval=config.AUDIT_LOG_FLUSH_INTERVAL,
+        max_bytes=config.AUDIT_LOG_MAX_BYTES,
+        backups=config.AUDIT_LOG_BACKUPS,
+        compress=config.AUDIT_LOG_COMPRESS,
+        overflow=config.AUDIT_LOG_OVERFLOW,
+        block_timeout=config.AUDIT_LOG_BLOCK_TIMEOUT,
+        fsync=config.AUDIT_LOG_FSYNC,
+    )
+
+# Worker processes holding the active model (INFERENCE_WORKERS > 0)
+worker_pool: Optional[InferenceWorkerPool] = None
+
+
+def _start_worker_pool(new, old) -> None:
+    """Replace the worker pool with one serving the newly active version.
+
+    The pool is tagged with the version it serves. Until the new workers
+    are up, `predict_features` sees that the old pool's version is no longer
+    the active one and scores in the web process; the old pool only serves
+    requests that started before the swap. If the new workers fail to start,
+    scoring stays in the web process.
+    """
+    global worker_pool
+    if config.INFERENCE_WORKERS <= 0:
+        return
+    try:
+        pool = InferenceWorkerPool(
+            new.path,
+            n_outputs=len(getattr(new.model, "classes_", ())),
+            workers=config.INFERENCE_WORKERS,
+            capacity=config.INFERENCE_WORKER_MAX_ROWS,
+            timeout=config.PREDICT_TIMEOUT,
+            health_interval=config.INFERENCE_WORKER_HEALTH_INTERVAL,
+            compile=new.scorer is not None,
+            compiled_max_rows=config.COMPILED_SCORER_MAX_ROWS,
+            version=new,
+        ).start()
+    except Exception as e:
+        logger.exception("Failed to start inference workers for %s: %s", new.name, e)
+        pool = None
+    previous, worker_pool = worker_pool, pool
+    if previous is not None:
+        previous.close()
+
+
+registry.on_swap(_start_worker_pool)
+
+metrics.register_stats("model_registry", "Model registry", registry.stats)
+metrics.register_stats(
+    "predict_batcher", "Inference micro-batcher",
+    lambda: batcher.stats() if config.PREDICT_BATCHING else None,
+)
+metrics.register_stats(
+    "prediction_cache", "Prediction result cache",
+    lambda: prediction_cache.stats() if config.PREDICT_CACHE_ENABLED else None,
+)
+metrics.register_stats(
+    "inference_workers", "Inference worker pool",
+    lambda: worker_pool.stats() if worker_pool is not None else None,
+)
+metrics.register_stats(
+    "prediction_log", "Prediction audit log",
+    lambda: prediction_log.stats() if prediction_log is not None else None,
+)
 
 
 def init_model():
-    """Attempt to find and load a model file. Called by the main app at startup."""
-    global MODEL, MODEL_PATH, MODEL_META
-    p = find_model_file(("models", "."))
-    if p is None:
-        logger.warning("No .pkl model found at startup. /predict will return 503 until a model is available.")
+    """Load and activate the startup model version. Called by the main app at startup."""
+    registry.scan()
+    name = config.MODEL_VERSION
+    if config.MODEL_FILE is not None:
+        registered = registry.register(Path(config.MODEL_FILE)).name
+        name = name or registered
+    name = name or registry.latest()
+    if name is None:
+        logger.warning("No model found at startup. /predict will return 503 until a model is available.")
         return
 
     try:
-        MODEL = load_model(p)
-        MODEL_PATH = p
-        MODEL_META = find_metadata(p)
-        logger.info(f"Loaded model from {p} (type={type(MODEL)})")
+        version = registry.load(name)
+        registry.activate(name)
+        logger.info(f"Loaded model {name} from {version.path} (type={type(version.model)})")
     except Exception as e:
         logger.exception("Failed to load model at startup: %s", e)
-        MODEL = None
+
+
+def shutdown_model() -> None:
+    """Stop background inference machinery. Called by the main app at shutdown."""
+    global worker_pool
+    batcher.close()
+    if worker_pool is not None:
+        worker_pool.close()
+        worker_pool = None
+    if prediction_log is not None:
+        prediction_log.close()
+
+
+def predict_features(features: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Run the loaded model over engineered features and return one result per row.
+
+    `features` is either a single row from `engineer_row` or columns from
+    `engineer_columns`. The class is derived from the probabilities
+    (`classes_[argmax]`, which is exactly what sklearn classifiers' `predict`
+    does) so the pipeline only runs once per batch instead of once for
+    `predict_proba` and again for `predict`. Small batches use the compiled
+    scorer when the model has one. With inference workers running for the
+    active version, scoring happens in a worker process.
+    """
+    current = registry.active
+    if current is None:
+        raise HTTPException(status_code=503, detail="No model loaded")
+    model = current.model
+    probs = preds = None
+    started = time.perf_counter()
+    pool = worker_pool
+    if pool is not None and pool.version is not current:
+        pool = None  # still serving the previous model; its replacement is starting
+    if pool is not None:
+        try:
+            probs, preds = pool.predict(features)
+        except WorkerPoolClosed:
+            pool = None  # replaced mid-request by a model swap
+    if pool is None:
+        probs, preds = run_model(model, features, current.scorer, config.COMPILED_SCORER_MAX_ROWS)
+    metrics.observe_stage(
+        "inference", time.perf_counter() - started, "workers" if pool is not None else "in_process"
+    )
+    if probs is not None:
+        preds = model.classes_.take(probs.argmax(axis=1)).tolist()
+        # Probabilities stay NumPy (one 1xN row view each) and are encoded
+        # straight from the array by serialization.dumps
+        return [
+            {"prediction": pred, "probabilities": probs[i:i + 1]}
+            for i, pred in enumerate(preds)
+        ]
+    return [{"prediction": pred} for pred in preds]
+
+
+def prediction_cache_key(row: Dict[str, Any], model: Any, model_id: Optional[str]) -> str:
+    """Hash of the model identity and the features the model actually reads.
+
+    Only the model's input columns are included, so inputs that engineer to
+    the same vector (e.g. two tier-1 cities, `None` vs empty occupation) share
+    an entry.
+    """
+    names = getattr(model, "feature_names_in_", None)
+    names = list(names) if names is not None else sorted(row)
+    h = hashlib.blake2b(digest_size=16)
+    h.update(str(model_id).encode("utf-8"))
+    for name in names:
+        value = row.get(name)
+        if isinstance(value, float):
+            value = value.hex()  # exact and canonical (10 and 10.0 hash alike)
+        elif isinstance(value, int) and not isinstance(value, bool):
+            value = float(value).hex()
+        h.update(f"\x1f{name}={value!r}".encode("utf-8"))
+    return h.hexdigest()
+
+
+def _engineer_input(data: PredictInput) -> Dict[str, Any]:
+    with metrics.stage("features", "row"):
+        return engineer_row(
+            data.age, data.weight, data.height, data.income_lpa,
+            data.smoker, data.city, data.occupation,
+        )
+
+
+def _predict_records(records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    with metrics.stage("features", "batch"):
+        features = engineer_records(records)
+    return predict_features(features)
+
+
+# Collects concurrent /predict calls into one vectorized model call
+batcher = InferenceBatcher(
+    _predict_records,
+    max_batch_size=config.PREDICT_BATCH_MAX_SIZE,
+    max_wait_ms=config.PREDICT_BATCH_MAX_WAIT_MS,
+    # One dispatching thread per worker process, so all of them stay busy
+    concurrency=max(1, config.INFERENCE_WORKERS),
+)
 
 
 @ai_router.get("/ai/health")
 def health():
-    return {"status": "ok", "model_loaded": MODEL is not None, "model_path": str(MODEL_PATH) if MODEL_PATH else None}
+    current = registry.active
+    return {
+        "status": "ok",
+        "model_loaded": current is not None,
+        "model_path": str(current.path) if current is not None else None,
+        "model_version": current.name if current is not None else None,
+        "registry": registry.stats(),
+        "batching": batcher.stats() if config.PREDICT_BATCHING else None,
+        "workers": worker_pool.stats() if worker_pool is not None else None,
+        "prediction_cache": prediction_cache.stats() if config.PREDICT_CACHE_ENABLED else None,
+        "prediction_log": prediction_log.stats() if prediction_log is not None else None,
+    }
 
 
 @ai_router.get("/models")
-def list_models():
-    """Return information about the loaded model (if any)."""
-    if MODEL is None:
-        raise HTTPException(status_code=404, detail="No model loaded")
-    return {"path": str(MODEL_PATH), "type": str(type(MODEL)), "meta": MODEL_META}
+def list_models(request: Request, response: Response):
+    """List every model version with its state, load time and memory footprint."""
+    registry.scan()
+    cache = http_cache.cache_headers("models")
+    if http_cache.is_fresh(request, "models", cache):
+        return http_cache.not_modified_response(cache)
+    stats = registry.stats()
+    http_cache.cacheable(response, cache)
+    return {
+        "active": stats["active"],
+        "previous": stats["previous"],
+        "versions": registry.versions(),
+    }
+
+
+@model_admin_router.post("/models/scan")
+def scan_models():
+    """Pick up model files added to (or removed from) the models directory."""
+    return {"versions": registry.scan()}
+
+
+@model_admin_router.post("/models/rollback")
+def rollback_model():
+    """Swap back to the previously active version (kept loaded for this)."""
+    try:
+        version = registry.rollback()
+    except ModelNotReady as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return version.info()
+
+
+@model_admin_router.post("/models/{version}/load", status_code=202)
+def load_model_version(version: str):
+    """Load and warm a version in the background without activating it."""
+    registry.scan()
+    try:
+        return registry.load_in_background(version).info()
+    except UnknownModelVersion as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@model_admin_router.post("/models/{version}/activate")
+def activate_model_version(version: str):
+    """Serve predictions from `version`.
+
+    A version that is already loaded is swapped in immediately (200).
+    Otherwise it is loaded and warmed in the background and swapped in when
+    ready (202); poll `GET /models` to follow it.
+    """
+    registry.scan()
+    try:
+        candidate = registry.get(version)
+        if candidate.state == "ready":
+            return registry.activate(version).info()
+        candidate = registry.load_in_background(version, activate=True)
+    except UnknownModelVersion as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ModelNotReady as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return JSONResponse(status_code=202, content=candidate.info())
+
+
+ai_router.include_router(model_admin_router)
+
+
+def _log_prediction(model: str, data: PredictInput, result: Dict[str, Any]) -> None:
+    if prediction_log is not None:
+        prediction_log.record(prediction_entry("/predict", model, data.model_dump(), result))
 
 
 @ai_router.post("/predict")
 def predict(data: PredictInput):
     """Run a model prediction on the provided input."""
 
-    if MODEL is None:
+    current = registry.active
+    if current is None:
         raise HTTPException(status_code=503, detail="No model loaded")
 
-    bmi = data.weight / (data.height ** 2) if data.height > 0 else 0.0
-    lifestyle_risk = "low"
-    if data.smoker and bmi > 30:
-        lifestyle_risk = "high"
-    elif data.smoker or bmi > 27:
-        lifestyle_risk = "medium"
-
-    age_group = "senior"
-    if data.age < 25:
-        age_group = "adult"
-    elif data.age < 60:
-        age_group = "middle_aged"
-
-    df = pd.DataFrame([
-        {
-            "bmi": bmi,
-            "age_group": age_group,
-            "lifestyle_risk": lifestyle_risk,
-            "income_lpa": data.income_lpa,
-            "city": data.city or "",
-            "occupation": data.occupation or "",
-        }
-    ])
+    row = None
+    cache_key = None
+    if config.PREDICT_CACHE_ENABLED:
+        row = _engineer_input(data)
+        cache_key = prediction_cache_key(row, current.model, current.fingerprint)
+        cached = prediction_cache.get(cache_key)
+        if cached is not None:
+            _log_prediction(current.name, data, cached)
+            return FastJSONResponse(cached)
 
     try:
-        if hasattr(MODEL, "predict_proba"):
-            probs = MODEL.predict_proba(df)
-            pred = MODEL.predict(df)[0]
-            return {"prediction": pred, "probabilities": probs.tolist()}
+        if config.PREDICT_BATCHING:
+            record = {name: getattr(data, name) for name in INPUT_FIELDS}
+            result = batcher.predict(record, timeout=config.PREDICT_TIMEOUT)
         else:
-            pred = MODEL.predict(df)[0]
-            return {"prediction": pred}
+            # Single-row fast path: scalar features, no per-row NumPy overhead
+            if row is None:
+                row = _engineer_input(data)
+            result = predict_features(row)[0]
+    except HTTPException:
+        raise
+    except TimeoutError:
+        raise HTTPException(
+            status_code=503, detail="Prediction timed out, please retry", headers={"Retry-After": "1"}
+        )
     except Exception as e:
         logger.exception("Prediction failed: %s", e)
         raise HTTPException(status_code=500, detail=f"Prediction failed: {e}")
+
+    # Skip caching if a swap happened meanwhile: the result may be the new model's
+    if cache_key is not None and registry.active is current:
+        prediction_cache.set(cache_key, result)
+    _log_prediction(current.name, data, result)
+    return FastJSONResponse(result)
+
+
+def _score_chunk(chunk: List[Tuple[int, Any]]) -> bytes:
+    """Validate and score one chunk of uploaded records as NDJSON lines."""
+    results: Dict[int, dict] = {}
+    records: Dict[int, dict] = {}
+    indices: List[int] = []
+    columns: Dict[str, list] = {name: [] for name in INPUT_FIELDS}
+    for index, record in chunk:
+        try:
+            if not isinstance(record, dict):
+                raise ValueError("record must be a JSON object")
+            data = PredictInput(**record)
+        except ValidationError as e:
+            results[index] = {"index": index, "error": "validation failed", "detail": json.loads(e.json())}
+            continue
+        except (ValueError, TypeError) as e:
+            results[index] = {"index": index, "error": str(e)}
+            continue
+        indices.append(index)
+        records[index] = record
+        for name in INPUT_FIELDS:
+            columns[name].append(getattr(data, name))
+
+    if indices:
+        with metrics.stage("features", "batch"):
+            features = engineer_columns(**columns)
+        current = registry.active
+        model_name = current.name if current is not None else None
+        try:
+            scored = predict_features(features)
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.warning("Batch prediction failed, scoring the chunk row by row: %s", e)
+            scored = _score_each(features, len(indices))
+        for index, result in zip(indices, scored):
+            results[index] = {"index": index, **result}
+        if prediction_log is not None:
+            prediction_log.record_many(
+                prediction_entry("/predict/batch", model_name, records[index], result)
+                for index, result in zip(indices, scored) if "error" not in result
+            )
+
+    return b"".join(dumps_line(results[index]) for index, _ in chunk)
+
+
+def _score_each(features: Dict[str, Any], n: int) -> List[Dict[str, Any]]:
+    """Score engineered columns one row at a time, so a failure stays with its row"""
+    scored = []
+    for i in range(n):
+        try:
+            row = {name: column[i:i + 1] for name, column in features.items()}
+            scored.append(predict_features(row)[0])
+        except HTTPException:
+            raise
+        except Exception as e:
+            scored.append({"error": f"Prediction failed: {e}"})
+    return scored
+
+
+def _score_upload(fh, fmt: str, chunk_size: int) -> Iterator[bytes]:
+    """Read records from the spooled upload and yield scored NDJSON chunks."""
+    try:
+        records = iter_records(fh, fmt)
+        chunk: List[Tuple[int, Any]] = []
+        index = 0
+        while True:
+            try:
+                record = next(records)
+            except StopIteration:
+                break
+            except RecordError as e:
+                # Score what was read so far, then report where the input broke
+                if chunk:
+                    yield _score_chunk(chunk)
+                    chunk = []
+                yield dumps_line({"index": index, "error": str(e)})
+                return
+            chunk.append((index, record))
+            index += 1
+            if len(chunk) >= chunk_size:
+                yield _score_chunk(chunk)
+                chunk = []
+        if chunk:
+            yield _score_chunk(chunk)
+    finally:
+        fh.close()
+
+
+@ai_router.post("/predict/batch")
+async def predict_batch(
+    request: Request,
+    chunk_size: int = Query(config.PREDICT_BULK_CHUNK_SIZE, ge=1, le=100_000),
+):
+    """Score many records in one call.
+
+    Accepts a JSON array (`application/json`), NDJSON (`application/x-ndjson`)
+    or CSV with a header row (`text/csv`) of `PredictInput` records, and
+    streams back one NDJSON line per record, in input order:
+    `{"index": i, "prediction": ..., "probabilities": ...}` or
+    `{"index": i, "error": ...}` for records that fail validation.
+    """
+    if registry.active is None:
+        raise HTTPException(status_code=503, detail="No model loaded")
+    fmt = detect_format(request.headers.get("content-type"))
+    if fmt is None:
+        raise HTTPException(
+            status_code=415,
+            detail="Send application/json, application/x-ndjson or text/csv",
+        )
+
+    # Spool the upload (in memory up to a limit, then on disk) so records can
+    # be read back incrementally while the response streams.
+    spool = await spool_request(request, config.PREDICT_BULK_SPOOL_BYTES)
+    return StreamingResponse(
+        _score_upload(spool, fmt, chunk_size), media_type="application/x-ndjson"
+    )
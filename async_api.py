@@ -0,0 +1,371 @@
+"""Asyncio-native user CRUD and auth routes.
+
+Enabled with `API_MODE=async` (see config.py). The routes, request bodies and
+response models are identical to the sync handlers in main.py, but database
+calls go through an async driver and bcrypt is awaited on the password
+hashing executor, so a single worker can keep many requests in flight without
+tying up Starlette's threadpool.
+"""
+
+import time
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from fastapi.security import HTTPAuthorizationCredentials
+from starlette.concurrency import run_in_threadpool
+
+import config
+import http_cache
+import metrics
+from auth.passwords import hash_password_async, hash_passwords_async, verify_password_async
+from auth.principals import principal_cache
+from auth.tokens import (
+    security,
+    decode_access_token,
+    credentials_exception,
+    issue_token_response,
+    principal_from_claims,
+)
+from auth.revocation import revocations
+from db import aio as repo
+from db.errors import DatabaseError, IntegrityError
+from db.pool import PoolTimeout
+from pagination import STREAM_MEDIA_TYPES, aencode_stream, set_page_headers
+from schemas import Token, UserCreate, UserLogin, UserRegister, UserResponse, UserUpdate
+from serialization import FastJSONResponse
+from uploads import detect_format, spool_request
+from user_import import DUPLICATE_EMAIL, BulkImport
+from user_search import user_index
+
+
+async_router = APIRouter()
+
+_pool: Optional[repo.AsyncConnectionPool] = None
+
+
+def get_async_pool() -> repo.AsyncConnectionPool:
+    """Return the process-wide async pool, creating it on first use"""
+    global _pool
+    if _pool is None:
+        _pool = repo.AsyncConnectionPool(
+            repo.connect,
+            size=config.DB_POOL_SIZE,
+            max_overflow=config.DB_POOL_MAX_OVERFLOW,
+            timeout=config.DB_POOL_TIMEOUT,
+            recycle=config.DB_POOL_RECYCLE,
+            pre_ping=config.DB_POOL_PRE_PING,
+            ping_interval=config.DB_POOL_PING_INTERVAL,
+        )
+    return _pool
+
+
+metrics.register_stats(
+    "db_async_pool", "Async connection pool", lambda: _pool.stats() if _pool is not None else None
+)
+
+
+async def close_async_pool():
+    if _pool is not None:
+        await _pool.close()
+
+
+async def get_async_db():
+    """Dependency that checks out one pooled async connection per request"""
+    started = time.perf_counter()
+    try:
+        async with get_async_pool().connection() as connection:
+            metrics.observe_stage("db_checkout", time.perf_counter() - started)
+            yield connection
+    except PoolTimeout as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Database busy: {str(e)}",
+            headers={"Retry-After": "1"},
+        )
+
+
+async def _lookup_principal(email: str):
+    """Load a principal on its own pooled connection (tokens without a user id)"""
+    try:
+        async with get_async_pool().connection() as connection:
+            return await repo.get_principal_by_email(connection, email)
+    except PoolTimeout as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Database busy: {str(e)}",
+            headers={"Retry-After": "1"},
+        )
+    except DatabaseError:
+        return None
+
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    """Get current user from JWT token, from its claims when it carries the user id"""
+    payload = decode_access_token(credentials.credentials)
+    user = principal_from_claims(payload)
+    if user is not None:
+        return user
+    user = principal_cache.get(payload["sub"])
+    if user is not None:
+        return user
+    user = await _lookup_principal(payload["sub"])
+    if user is None:
+        raise credentials_exception()
+    principal_cache.put(payload["sub"], user, payload.get("exp"))
+    return user
+
+
+def _email_taken() -> HTTPException:
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=DUPLICATE_EMAIL)
+
+
+@async_router.post("/register", response_model=Token)
+async def register_user(user: UserRegister, connection=Depends(get_async_db)):
+    """Register a new user account"""
+    hashed_password = await hash_password_async(user.password)
+    try:
+        user_id = await repo.insert_user(connection, user.email, hashed_password)
+    except IntegrityError:
+        raise _email_taken()
+    except DatabaseError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    user_index.put(user_id, user.email)
+    http_cache.versions.bump("users")
+    return issue_token_response(user_id, user.email)
+
+
+@async_router.post("/login", response_model=Token)
+async def login_user(user: UserLogin, connection=Depends(get_async_db)):
+    """Login user and return JWT"""
+    try:
+        db_user = await repo.get_user_by_email(connection, user.email)
+    except DatabaseError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if not db_user or not await verify_password_async(user.password, db_user["password"]):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid email or password"
+        )
+    return issue_token_response(db_user["user_id"], db_user["email"])
+
+
+@async_router.get("/me", response_model=UserResponse)
+async def get_current_user_info(request: Request, response: Response, current_user: dict = Depends(get_current_user)):
+    """Get current user information"""
+    cache = http_cache.cache_headers("users", "me", current_user["user_id"], current_user["email"])
+    if http_cache.is_fresh(request, "users", cache):
+        return http_cache.not_modified_response(cache)
+    http_cache.cacheable(response, cache)
+    return {"user_id": current_user["user_id"], "email": current_user["email"]}
+
+
+def _stream_users(fmt: str, after: int, limit: Optional[int], total: Optional[int]):
+    """Stream users from a server-side cursor on a dedicated pooled connection"""
+    pool = get_async_pool()
+
+    async def rows():
+        connection = await pool.acquire()
+        finished = False
+        try:
+            async for row in repo.iter_users(
+                connection, after, limit, batch_size=config.USERS_STREAM_BATCH_SIZE
+            ):
+                yield {"user_id": int(row["user_id"]), "email": str(row["email"])}
+            finished = True
+        finally:
+            await pool.release(connection, discard=not finished)
+
+    headers = {"X-Total-Count": str(total)} if total is not None else None
+    return StreamingResponse(
+        aencode_stream(rows(), fmt), media_type=STREAM_MEDIA_TYPES[fmt], headers=headers
+    )
+
+
+@async_router.get("/users", response_model=List[UserResponse])
+async def get_users(
+    request: Request,
+    after: int = Query(0, ge=0, description="Keyset cursor: only return users with a larger user_id"),
+    limit: Optional[int] = Query(None, ge=1, le=config.USERS_PAGE_MAX_LIMIT),
+    include_total: bool = False,
+    stream: Optional[str] = Query(None, pattern="^(ndjson|json|csv)$"),
+    current_user: dict = Depends(get_current_user),
+    cache: dict = Depends(http_cache.conditional("users")),
+    connection=Depends(get_async_db),
+):
+    """Get users one keyset page at a time, or stream them (protected endpoint)"""
+    try:
+        total = await repo.count_users(connection) if include_total else None
+        if stream:
+            return _stream_users(stream, after, limit, total)
+        limit = limit or config.USERS_PAGE_DEFAULT_LIMIT
+        rows = await repo.list_users(connection, after, limit)
+    except DatabaseError as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+    # Rows already have the UserResponse shape: encode without re-validating
+    page = FastJSONResponse(rows)
+    set_page_headers(page, request, rows, limit, total)
+    http_cache.cacheable(page, cache)
+    return page
+
+
+@async_router.get("/users/search", response_model=List[UserResponse])
+async def search_users(
+    q: str = Query(..., min_length=1, max_length=255, description="Email prefix, or the start of a word in the email"),
+    limit: int = Query(config.USERS_SEARCH_DEFAULT_LIMIT, ge=1, le=config.USERS_SEARCH_MAX_LIMIT),
+    current_user: dict = Depends(get_current_user),
+):
+    """Find users by email, best matches first (protected endpoint)"""
+    rows = user_index.search(q, limit) if config.USER_SEARCH_INDEX else None
+    if rows is None:
+        substring = 0 < config.USERS_SEARCH_SUBSTRING_MIN <= len(q)
+        try:
+            async with get_async_pool().connection() as connection:
+                rows = await repo.search_users(connection, q, limit, substring)
+        except PoolTimeout as e:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=f"Database busy: {str(e)}",
+                headers={"Retry-After": "1"},
+            )
+        except DatabaseError as e:
+            raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+    return FastJSONResponse(rows)
+
+
+@async_router.get("/users/export")
+async def export_users(
+    format: str = Query("ndjson", pattern="^(ndjson|json|csv)$"),
+    after: int = Query(0, ge=0),
+    current_user: dict = Depends(get_current_user),
+):
+    """Stream every user as NDJSON, a JSON array or CSV (protected endpoint)"""
+    response = _stream_users(format, after, None, None)
+    response.headers["Content-Disposition"] = f'attachment; filename="users.{format}"'
+    return response
+
+
+async def _bulk_import(connection, fh, fmt: str, chunk_size: int) -> dict:
+    """Import users from a spooled upload, one chunked transaction at a time"""
+    job = BulkImport()
+    chunks = job.chunks(fh, fmt, chunk_size)
+    try:
+        while True:
+            # Parsing is synchronous file I/O, so it runs off the event loop
+            chunk = await run_in_threadpool(next, chunks, None)
+            if chunk is None:
+                break
+            try:
+                existing = await repo.find_existing_emails(connection, [email for _, email, _ in chunk])
+                chunk = job.drop_existing(chunk, existing)
+                if not chunk:
+                    continue
+                hashes = await hash_passwords_async([password for _, _, password in chunk])
+                rows = [(email, hashed) for (_, email, _), hashed in zip(chunk, hashes)]
+                try:
+                    job.created += await repo.insert_users(connection, rows)
+                except IntegrityError:
+                    for (index, email, _), row in zip(chunk, rows):
+                        try:
+                            await repo.insert_user(connection, *row)
+                            job.created += 1
+                        except IntegrityError:
+                            job.fail(index, email, DUPLICATE_EMAIL)
+            except DatabaseError as e:
+                job.abort(chunk, f"Database error: {str(e)}")
+                break
+    finally:
+        fh.close()
+    return job.report()
+
+
+@async_router.post("/users/bulk")
+async def bulk_import_users(
+    request: Request,
+    chunk_size: int = Query(config.USERS_BULK_CHUNK_SIZE, ge=1, le=10_000),
+    current_user: dict = Depends(get_current_user),
+    connection=Depends(get_async_db),
+):
+    """Create many users from a JSON array, NDJSON or CSV upload (protected endpoint)"""
+    fmt = detect_format(request.headers.get("content-type"))
+    if fmt is None:
+        raise HTTPException(
+            status_code=415,
+            detail="Send application/json, application/x-ndjson or text/csv",
+        )
+    spool = await spool_request(request, config.USERS_BULK_SPOOL_BYTES)
+    report = await _bulk_import(connection, spool, fmt, chunk_size)
+    if report["created"]:
+        # New ids are not known row by row: rebuild the search index instead
+        user_index.invalidate()
+        http_cache.versions.bump("users")
+    return report
+
+
+@async_router.get("/users/{user_id}", response_model=UserResponse)
+async def get_user(
+    user_id: int,
+    response: Response,
+    current_user: dict = Depends(get_current_user),
+    cache: dict = Depends(http_cache.conditional("users")),
+    connection=Depends(get_async_db),
+):
+    """Get a specific user by ID (protected endpoint)"""
+    try:
+        user = await repo.get_user_by_id(connection, user_id)
+    except DatabaseError as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    http_cache.cacheable(response, cache)
+    return {"user_id": int(user["user_id"]), "email": str(user["email"])}
+
+
+@async_router.post("/users", response_model=UserResponse)
+async def create_user(user: UserCreate, current_user: dict = Depends(get_current_user), connection=Depends(get_async_db)):
+    """Create a new user (protected endpoint)"""
+    hashed_password = await hash_password_async(user.password)
+    try:
+        user_id = await repo.insert_user(connection, user.email, hashed_password)
+    except IntegrityError:
+        raise _email_taken()
+    except DatabaseError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    user_index.put(user_id, user.email)
+    http_cache.versions.bump("users")
+    return {"user_id": user_id, "email": user.email}
+
+
+@async_router.put("/users/{user_id}", response_model=UserResponse)
+async def update_user(user_id: int, user: UserUpdate, current_user: dict = Depends(get_current_user), connection=Depends(get_async_db)):
+    """Update an existing user (protected endpoint)"""
+    hashed_password = await hash_password_async(user.password)
+    try:
+        found = await repo.update_user(connection, user_id, user.email, hashed_password)
+    except IntegrityError:
+        raise _email_taken()
+    except DatabaseError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if not found:
+        raise HTTPException(status_code=404, detail="User not found")
+    user_index.put(user_id, user.email)
+    http_cache.versions.bump("users")
+    principal_cache.invalidate_user(user_id)
+    revocations.revoke_user(user_id)
+    return {"user_id": user_id, "email": user.email}
+
+
+@async_router.delete("/users/{user_id}")
+async def delete_user(user_id: int, current_user: dict = Depends(get_current_user), connection=Depends(get_async_db)):
+    """Delete a user (protected endpoint)"""
+    try:
+        found = await repo.delete_user(connection, user_id)
+    except DatabaseError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if not found:
+        raise HTTPException(status_code=404, detail="User not found")
+    user_index.remove(user_id)
+    http_cache.versions.bump("users")
+    principal_cache.invalidate_user(user_id)
+    revocations.revoke_user(user_id)
+    return {"message": "User deleted successfully"}
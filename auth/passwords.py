@@ -0,0 +1,249 @@
+"""Password hashing helpers (bcrypt).
+
+bcrypt is deliberately expensive (hundreds of milliseconds of CPU at the
+default cost), so hashing and verification run on a dedicated executor sized
+to the machine's cores instead of on the request thread. The executor has a
+bounded backlog: once `workers + queue_size` jobs are outstanding, new
+requests are rejected with `HasherBusy` (mapped to HTTP 503 by the app) rather
+than letting latency grow without limit.
+"""
+
+import asyncio
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+import multiprocessing
+import threading
+import time
+from typing import List, Optional
+
+import bcrypt
+
+import config
+import metrics
+
+
+class HasherBusy(Exception):
+    """Raised when the password hashing backlog is full."""
+
+
+def _bcrypt_hash(password: bytes, rounds: int) -> bytes:
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds=rounds))
+
+
+def _bcrypt_check(password: bytes, hashed: bytes) -> bool:
+    return bcrypt.checkpw(password, hashed)
+
+
+class PasswordHasher:
+    """Bounded executor for bcrypt work with queue-depth accounting."""
+
+    def __init__(self, workers: int, queue_size: int, rounds: int, mode: str = "process"):
+        self.workers = max(1, workers)
+        self.queue_size = max(0, queue_size)
+        self.rounds = rounds
+        self.mode = mode
+        self._executor = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._submitted = 0
+        self._completed = 0
+        self._rejected = 0
+        self._busy_time = 0.0
+
+    @property
+    def capacity(self) -> int:
+        return self.workers + self.queue_size
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    if self.mode == "thread":
+                        self._executor = ThreadPoolExecutor(
+                            max_workers=self.workers, thread_name_prefix="bcrypt"
+                        )
+                    else:
+                        # forkserver/spawn children start from a clean
+                        # interpreter instead of forking a process that
+                        # already runs server threads.
+                        methods = multiprocessing.get_all_start_methods()
+                        if "forkserver" in methods:
+                            ctx = multiprocessing.get_context("forkserver")
+                            ctx.set_forkserver_preload(["bcrypt"])
+                        else:
+                            ctx = multiprocessing.get_context("spawn")
+                        self._executor = ProcessPoolExecutor(
+                            max_workers=self.workers, mp_context=ctx
+                        )
+        return self._executor
+
+    def _submit(self, fn, *args, admit: bool = True) -> Future:
+        if self.mode == "inline":
+            future: Future = Future()
+            future.set_result(fn(*args))
+            with self._lock:
+                self._submitted += 1
+                self._completed += 1
+            return future
+
+        with self._lock:
+            if admit and self._in_flight >= self.capacity:
+                self._rejected += 1
+                raise HasherBusy(
+                    f"password hashing backlog full ({self._in_flight} jobs in flight)"
+                )
+            self._in_flight += 1
+            self._submitted += 1
+        started = time.monotonic()
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            with self._lock:
+                self._in_flight -= 1
+            raise
+
+        def _done(_):
+            with self._lock:
+                self._in_flight -= 1
+                self._completed += 1
+                self._busy_time += time.monotonic() - started
+
+        future.add_done_callback(_done)
+        return future
+
+    # -- public API ---------------------------------------------------------
+
+    def hash(self, password: str) -> str:
+        future = self._submit(_bcrypt_hash, password.encode('utf-8'), self.rounds)
+        return future.result().decode('utf-8')
+
+    def verify(self, plain_password: str, hashed_password: str) -> bool:
+        future = self._submit(
+            _bcrypt_check, plain_password.encode('utf-8'), hashed_password.encode('utf-8')
+        )
+        return future.result()
+
+    async def hash_async(self, password: str) -> str:
+        future = self._submit(_bcrypt_hash, password.encode('utf-8'), self.rounds)
+        return (await asyncio.wrap_future(future)).decode('utf-8')
+
+    async def verify_async(self, plain_password: str, hashed_password: str) -> bool:
+        future = self._submit(
+            _bcrypt_check, plain_password.encode('utf-8'), hashed_password.encode('utf-8')
+        )
+        return await asyncio.wrap_future(future)
+
+    def hash_many(self, passwords: List[str]) -> List[str]:
+        """Hash a batch of passwords on all workers, keeping the results in order.
+
+        At most `workers` batch jobs are in flight at a time and they bypass
+        the backlog limit: a bulk import waits for the workers instead of
+        failing with `HasherBusy`, and leaves the queue slots free for
+        interactive logins.
+        """
+        results: List[Optional[str]] = [None] * len(passwords)
+        pending: deque = deque()
+        for index, password in enumerate(passwords):
+            if len(pending) >= self.workers:
+                done, future = pending.popleft()
+                results[done] = future.result().decode('utf-8')
+            pending.append((index, self._submit(
+                _bcrypt_hash, password.encode('utf-8'), self.rounds, admit=False
+            )))
+        for done, future in pending:
+            results[done] = future.result().decode('utf-8')
+        return results
+
+    async def hash_many_async(self, passwords: List[str]) -> List[str]:
+        """Async counterpart of `hash_many`"""
+        results: List[Optional[str]] = [None] * len(passwords)
+        pending: deque = deque()
+        for index, password in enumerate(passwords):
+            if len(pending) >= self.workers:
+                done, future = pending.popleft()
+                results[done] = (await asyncio.wrap_future(future)).decode('utf-8')
+            pending.append((index, self._submit(
+                _bcrypt_hash, password.encode('utf-8'), self.rounds, admit=False
+            )))
+        for done, future in pending:
+            results[done] = (await asyncio.wrap_future(future)).decode('utf-8')
+        return results
+
+    def stats(self) -> dict:
+        with self._lock:
+            in_flight = self._in_flight
+            return {
+                "mode": self.mode,
+                "workers": self.workers,
+                "rounds": self.rounds,
+                "capacity": self.capacity,
+                "in_flight": in_flight,
+                "queue_depth": max(0, in_flight - self.workers),
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "avg_latency_seconds": round(self._busy_time / self._completed, 6)
+                if self._completed else 0.0,
+            }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+_hasher: Optional[PasswordHasher] = None
+
+
+def get_hasher() -> PasswordHasher:
+    """Return the process-wide password hasher, creating it on first use"""
+    global _hasher
+    if _hasher is None:
+        _hasher = PasswordHasher(
+            workers=config.PASSWORD_HASH_WORKERS,
+            queue_size=config.PASSWORD_HASH_QUEUE_SIZE,
+            rounds=config.BCRYPT_ROUNDS,
+            mode=config.PASSWORD_HASH_EXECUTOR,
+        )
+    return _hasher
+
+
+def shutdown_hasher() -> None:
+    if _hasher is not None:
+        _hasher.shutdown()
+
+
+@metrics.timed("bcrypt")
+def hash_password(password: str) -> str:
+    """Hash a password using bcrypt"""
+    return get_hasher().hash(password)
+
+
+@metrics.timed("bcrypt")
+def hash_passwords(passwords: List[str]) -> List[str]:
+    """Hash many passwords in parallel (bulk imports)"""
+    return get_hasher().hash_many(passwords)
+
+
+@metrics.timed("bcrypt")
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    """Verify a password against its hash"""
+    return get_hasher().verify(plain_password, hashed_password)
+
+
+@metrics.timed("bcrypt")
+async def hash_password_async(password: str) -> str:
+    """Hash a password without blocking the event loop"""
+    return await get_hasher().hash_async(password)
+
+
+@metrics.timed("bcrypt")
+async def hash_passwords_async(passwords: List[str]) -> List[str]:
+    """Hash many passwords in parallel without blocking the event loop"""
+    return await get_hasher().hash_many_async(passwords)
+
+
+@metrics.timed("bcrypt")
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Verify a password without blocking the event loop"""
+    return await get_hasher().verify_async(plain_password, hashed_password)
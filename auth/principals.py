@@ -0,0 +1,53 @@
+"""Cache of verified principals for `get_current_user`.
+
+After a token has been decoded, the user it names still has to exist. Rather
+than looking that up on every protected request, the `{user_id, email}`
+principal is cached by token subject for a short TTL that never outlives the
+token's own `exp` claim. Write paths that change or remove a user call
+`invalidate_user` so the next request goes back to the database.
+"""
+
+import time
+from typing import Optional
+
+import config
+from caching import TTLCache
+
+
+class PrincipalCache:
+    def __init__(self, maxsize: int, ttl: float, enabled: bool = True):
+        self.enabled = enabled
+        self._cache = TTLCache(maxsize, ttl)
+
+    def get(self, subject: str) -> Optional[dict]:
+        if not self.enabled:
+            return None
+        return self._cache.get(subject)
+
+    def put(self, subject: str, principal: dict, exp: Optional[float] = None) -> None:
+        """Cache `principal`; `exp` is the token's expiry as a Unix timestamp."""
+        if not self.enabled:
+            return
+        ttl = None
+        if exp is not None:
+            ttl = float(exp) - time.time()
+        self._cache.set(
+            subject, {"user_id": int(principal["user_id"]), "email": principal["email"]}, ttl
+        )
+
+    def invalidate_user(self, user_id: int) -> None:
+        """Forget every cached principal for `user_id` (after update/delete)."""
+        self._cache.remove_if(lambda _, p: p["user_id"] == user_id)
+
+    def invalidate_subject(self, subject: str) -> None:
+        self._cache.pop(subject)
+
+    def stats(self) -> dict:
+        return {"enabled": self.enabled, **self._cache.stats()}
+
+
+principal_cache = PrincipalCache(
+    maxsize=config.PRINCIPAL_CACHE_SIZE,
+    ttl=config.PRINCIPAL_CACHE_TTL,
+    enabled=config.PRINCIPAL_CACHE_ENABLED,
+)
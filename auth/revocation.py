@@ -0,0 +1,97 @@
+"""In-memory token revocation for stateless verification.
+
+Access tokens carry the user's id and their issue time, so
+`get_current_user` can accept them without a database round-trip. What the
+claims cannot show is that the user was deleted or changed after the token
+was issued. Those write paths call `revoke_user`, which records a
+per-user watermark: every token for that user issued at or before it is
+rejected from then on.
+
+An entry is only needed while a token issued before it could still be
+unexpired, so entries live for the maximum token lifetime and then drop
+out. That keeps the structure small: one float per user changed in the last
+`ACCESS_TOKEN_EXPIRE_MINUTES`, up to `TOKEN_REVOCATION_MAX_USERS`.
+
+Past that bound the oldest entries are evicted, and the store can no longer
+say whether a token issued before the newest evicted watermark is still
+good. It fails closed: `vouches_for` is False for such tokens, so
+`get_current_user` verifies them against the database instead of trusting
+their claims.
+
+Revocations are per process, which is why stateless verification is off by
+default (`AUTH_STATELESS=0`): enable it only where a single process serves
+the API, or where a deletion may take until the token expires to reach the
+other workers.
+"""
+
+import threading
+import time
+from typing import Optional
+
+import config
+from caching import TTLCache
+
+
+class TokenRevocations:
+    def __init__(self, maxsize: int, lifetime: float):
+        self.lifetime = lifetime
+        self._cache = TTLCache(maxsize, lifetime, on_evict=self._evicted)
+        self._lock = threading.Lock()
+        # Newest watermark dropped for lack of room: tokens issued at or
+        # before it may belong to a revoked user this store has forgotten
+        self._evicted_cutoff = 0.0
+        self._revocations = 0
+        self._rejected = 0
+        self._unverifiable = 0
+
+    def _evicted(self, user_id: int, cutoff: float) -> None:
+        # Runs inside revoke_user's cache.set, so self._lock is already held
+        self._evicted_cutoff = max(self._evicted_cutoff, cutoff)
+
+    def revoke_user(self, user_id: int, at: Optional[float] = None) -> None:
+        """Reject every token for `user_id` issued at or before `at` (default: now)."""
+        at = time.time() if at is None else at
+        with self._lock:
+            previous = self._cache.get(user_id)
+            self._cache.set(user_id, max(at, previous or 0.0))
+            self._revocations += 1
+
+    def is_revoked(self, user_id: int, issued_at: Optional[float]) -> bool:
+        cutoff = self._cache.get(user_id)
+        if cutoff is None:
+            return False
+        # A token without an issue time cannot prove it is newer than the cutoff
+        if issued_at is None or float(issued_at) <= cutoff:
+            with self._lock:
+                self._rejected += 1
+            return True
+        return False
+
+    def vouches_for(self, issued_at: Optional[float]) -> bool:
+        """Whether `is_revoked` alone can be trusted for a token issued at `issued_at`.
+
+        False once a watermark that could cover the token has been evicted;
+        the caller must then check the user some other way.
+        """
+        if issued_at is not None and float(issued_at) > self._evicted_cutoff:
+            return True
+        with self._lock:
+            self._unverifiable += 1
+        return False
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "users": len(self._cache),
+                "revocations": self._revocations,
+                "rejected": self._rejected,
+                "evicted": self._cache.evictions,
+                "unverifiable": self._unverifiable,
+                "lifetime_seconds": self.lifetime,
+            }
+
+
+revocations = TokenRevocations(
+    maxsize=config.TOKEN_REVOCATION_MAX_USERS,
+    lifetime=config.ACCESS_TOKEN_EXPIRE_MINUTES * 60.0,
+)
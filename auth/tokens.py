@@ -0,0 +1,170 @@
+"""JWT creation and verification shared by the sync and async routes.
+
+Tokens are signed with one key of a keyring and name it in the `kid`
+header, so verification picks the right key and rotation is a config
+change: add the new key, make it active, and drop the old one once its
+tokens have expired (see `JWT_SECRET_KEYS` in config.py).
+
+Besides `sub` (the email) tokens carry the user id (`uid`) and the issue
+time (`iat`). `principal_from_claims` turns such a token into the
+`{user_id, email}` principal without touching the database. The issue time
+is the token's version: `auth.revocation` rejects tokens issued before a
+user was updated or deleted.
+"""
+
+from datetime import datetime, timedelta, timezone
+import time
+from typing import Dict, Optional, Tuple
+
+from fastapi import Depends, HTTPException, status
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+import jwt
+
+import config
+import metrics
+from auth.revocation import revocations
+
+# Authentication configuration
+SECRET_KEY = "My-secret-key-here-in-development"
+ALGORITHM = "HS256"
+ACCESS_TOKEN_EXPIRE_MINUTES = config.ACCESS_TOKEN_EXPIRE_MINUTES
+
+# Security scheme for JWT token
+security = HTTPBearer()
+
+
+class Keyring:
+    """Signing keys by `kid`; one of them signs, all of them verify."""
+
+    def __init__(self, keys: Dict[str, str], active_kid: Optional[str] = None):
+        if not keys:
+            raise ValueError("keyring needs at least one key")
+        self.keys = dict(keys)
+        self.active_kid = active_kid or next(iter(self.keys))
+        if self.active_kid not in self.keys:
+            raise ValueError(f"active key id {self.active_kid!r} is not in the keyring")
+
+    @classmethod
+    def from_config(cls) -> "Keyring":
+        keys: Dict[str, str] = {}
+        for entry in config.JWT_SECRET_KEYS.split(","):
+            entry = entry.strip()
+            if not entry:
+                continue
+            kid, sep, secret = entry.partition(":")
+            if not sep or not kid or not secret:
+                raise ValueError("JWT_SECRET_KEYS entries must look like kid:secret")
+            keys[kid.strip()] = secret.strip()
+        if not keys:
+            keys = {"default": SECRET_KEY}
+        return cls(keys, config.JWT_ACTIVE_KID)
+
+    def signing_key(self) -> Tuple[str, str]:
+        return self.active_kid, self.keys[self.active_kid]
+
+    def verification_key(self, kid: Optional[str]) -> Optional[str]:
+        # Tokens issued before key ids existed have no `kid`: try the active key
+        return self.keys.get(kid if kid is not None else self.active_kid)
+
+    def stats(self) -> dict:
+        return {"active_kid": self.active_kid, "kids": sorted(self.keys)}
+
+
+keyring = Keyring.from_config()
+
+
+def credentials_exception() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
+def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
+    """Create a JWT access token"""
+    to_encode = data.copy()
+    if expires_delta:
+        expire = datetime.now(timezone.utc) + expires_delta
+    else:
+        expire = datetime.now(timezone.utc) + timedelta(minutes=15)
+    # Sub-second issue time, so a token issued right after a revocation is
+    # still distinguishable from the ones it revoked
+    to_encode.update({"exp": expire, "iat": time.time()})
+    kid, key = keyring.signing_key()
+    encoded_jwt = jwt.encode(to_encode, key, algorithm=ALGORITHM, headers={"kid": kid})
+    return encoded_jwt
+
+
+def issue_token_response(user_id: int, email: str) -> dict:
+    """Build the `Token` response body for a freshly authenticated user"""
+    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    access_token = create_access_token(
+        data={"sub": email, "uid": int(user_id)}, expires_delta=access_token_expires
+    )
+    return {
+        "access_token": access_token,
+        "token_type": "bearer",
+        "user_id": user_id,
+        "email": email
+    }
+
+
+@metrics.timed("jwt")
+def decode_access_token(token: str) -> dict:
+    """Decode and verify a token, returning its claims or raising 401"""
+    try:
+        key = keyring.verification_key(jwt.get_unverified_header(token).get("kid"))
+        if key is None:
+            raise credentials_exception()
+        payload = jwt.decode(token, key, algorithms=[ALGORITHM])
+    except jwt.PyJWTError:
+        raise credentials_exception()
+    if payload.get("sub") is None:
+        raise credentials_exception()
+    uid = payload.get("uid")
+    if uid is not None and revocations.is_revoked(uid, payload.get("iat")):
+        raise credentials_exception()
+    return payload
+
+
+async def require_admin(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+    """Dependency for operator routes: a valid token whose `sub` is in `ADMIN_EMAILS`.
+
+    Returns the token's claims. Verified from the token alone (signature,
+    expiry, revocation), so it needs no database connection.
+    """
+    payload = decode_access_token(credentials.credentials)
+    if payload["sub"].lower() not in config.ADMIN_EMAILS:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin privileges required")
+    return payload
+
+
+def token_subject(token: str) -> Optional[str]:
+    """The `sub` of a correctly signed, unexpired token, or None.
+
+    Cheap identification for rate limiting: unlike `decode_access_token` it
+    does not consult revocations and never raises.
+    """
+    try:
+        key = keyring.verification_key(jwt.get_unverified_header(token).get("kid"))
+        if key is None:
+            return None
+        return jwt.decode(token, key, algorithms=[ALGORITHM]).get("sub")
+    except jwt.PyJWTError:
+        return None
+
+
+def principal_from_claims(payload: dict) -> Optional[dict]:
+    """The `{user_id, email}` principal of a verified token, or None.
+
+    None means the caller has to look the user up: stateless verification
+    is off (`AUTH_STATELESS=0`), the token predates the `uid` claim, or the
+    revocation store has evicted entries that could cover it.
+    """
+    if not config.AUTH_STATELESS:
+        return None
+    uid = payload.get("uid")
+    if not isinstance(uid, int) or not revocations.vouches_for(payload.get("iat")):
+        return None
+    return {"user_id": uid, "email": payload["sub"]}
@@ -0,0 +1,298 @@
+"""Load-test and benchmark suite for the API.
+
+Runs the FastAPI `app` from main.py in-process against a throwaway SQLite
+database and the bundled model, and reports p50/p95/p99 latency and
+throughput for each scenario:
+
+    python -m bench                          # full run, results in bench/results/
+    python -m bench --mode async --quick     # async user routes, small counts
+    python -m bench --sizes 1000 100000 --scenarios users predict
+    python -m bench --compare bench/results/<earlier>.json
+
+Results are written as JSON (environment, configuration and git commit
+included) so runs can be compared over time with `--compare`.
+
+Password hashing is real bcrypt at `--bcrypt-rounds` (default: the
+configured BCRYPT_ROUNDS), so `/login` and the write routes show its cost.
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List, Optional
+
+from bench.harness import (
+    BENCH_PASSWORD,
+    Lifespan,
+    client_for,
+    create_users_table,
+    run_load,
+    seed_users,
+)
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = ROOT / "bench" / "results"
+
+SCENARIOS = ("login", "me", "users", "crud", "predict")
+
+PREDICT_BODY = {
+    "age": 30, "weight": 70, "height": 1.7, "income_lpa": 10,
+    "smoker": False, "city": "Mumbai", "occupation": "private_job",
+}
+PREDICT_CITIES = ("Mumbai", "Jaipur", "Indore", "Delhi", "Kota")
+
+
+def _parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m bench", description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", choices=("sync", "async"), default="sync",
+                        help="API_MODE for the user routes")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1000, 10000, 100000],
+                        help="users table sizes for the /users scenarios")
+    parser.add_argument("--requests", type=int, default=200, help="requests per read scenario")
+    parser.add_argument("--auth-requests", type=int, default=50,
+                        help="requests per bcrypt-bound scenario (login, create, update)")
+    parser.add_argument("--concurrency", type=int, default=16,
+                        help="concurrent clients for the concurrent scenarios")
+    parser.add_argument("--bcrypt-rounds", type=int, default=None)
+    parser.add_argument("--quick", action="store_true",
+                        help="small counts and sizes for a smoke run")
+    parser.add_argument("--db", default=None, help="SQLite file to use (default: a temp file)")
+    parser.add_argument("--out", default=None, help="results file (default: bench/results/<time>-<mode>.json)")
+    parser.add_argument("--compare", default=None, help="earlier results file to diff against")
+    args = parser.parse_args(argv)
+    if args.quick:
+        args.sizes = [min(s, 5000) for s in args.sizes]
+        args.requests = min(args.requests, 50)
+        args.auth_requests = min(args.auth_requests, 10)
+    args.sizes = sorted(set(args.sizes))
+    return args
+
+
+def _configure_environment(args: argparse.Namespace, db_path: str) -> None:
+    """Point config.py at the bench database; must run before main is imported."""
+    os.environ["DB_BACKEND"] = "sqlite"
+    os.environ["SQLITE_PATH"] = db_path
+    os.environ["API_MODE"] = args.mode
+    if args.bcrypt_rounds is not None:
+        os.environ["BCRYPT_ROUNDS"] = str(args.bcrypt_rounds)
+    os.chdir(ROOT)  # MODEL_DIR is relative to the repository root
+    if str(ROOT) not in sys.path:
+        sys.path.insert(0, str(ROOT))
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+            capture_output=True, text=True, timeout=10,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def _meta(args: argparse.Namespace) -> dict:
+    import config
+
+    return {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "args": {k: v for k, v in vars(args).items() if k not in ("out", "compare", "db")},
+        "config": {
+            key: getattr(config, key) for key in (
+                "API_MODE", "DB_BACKEND", "DB_POOL_SIZE", "DB_POOL_MAX_OVERFLOW",
+                "BCRYPT_ROUNDS", "PASSWORD_HASH_EXECUTOR", "PASSWORD_HASH_WORKERS",
+                "PRINCIPAL_CACHE_ENABLED", "USERS_PAGE_DEFAULT_LIMIT",
+                "PREDICT_BATCHING", "PREDICT_CACHE_ENABLED", "INFERENCE_WORKERS",
+                "COMPILED_SCORER", "METRICS_ENABLED",
+            ) if hasattr(config, key)
+        },
+    }
+
+
+def _predict_body(i: int) -> dict:
+    # Vary the input so a prediction cache (when enabled) does not turn the
+    # scenario into a cache benchmark
+    body = dict(PREDICT_BODY)
+    body["age"] = 18 + (i % 60)
+    body["income_lpa"] = 1 + (i % 40)
+    body["city"] = PREDICT_CITIES[i % len(PREDICT_CITIES)]
+    return body
+
+
+async def _run(args: argparse.Namespace, db_path: str) -> List[dict]:
+    import bcrypt
+
+    import config
+    import main
+
+    results: List[dict] = []
+
+    def report(result: dict) -> None:
+        latency = result["latency_ms"]
+        errors = f"  errors={result['errors']}" if result["errors"] else ""
+        print(
+            f"{result['name']:<34} n={result['ok']:<6} c={result['concurrency']:<3} "
+            f"p50={latency['p50']:>9.2f}ms p95={latency['p95']:>9.2f}ms "
+            f"p99={latency['p99']:>9.2f}ms rps={result['rps']:>9.1f}{errors}",
+            flush=True,
+        )
+        results.append(result)
+
+    # One hash shared by every seeded row: seeding 100k users must not take
+    # 100k bcrypt rounds, and /login only ever verifies one of them
+    password_hash = bcrypt.hashpw(
+        BENCH_PASSWORD.encode(), bcrypt.gensalt(rounds=config.BCRYPT_ROUNDS)
+    ).decode()
+    create_users_table(db_path)
+    seed_users(db_path, 1, password_hash)
+    login_body = {"email": "user0@bench.local", "password": BENCH_PASSWORD}
+    n, c = args.requests, args.concurrency
+
+    async with Lifespan(main.app), client_for(main.app) as client:
+        response = await client.post("/login", json=login_body)
+        response.raise_for_status()
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        if "login" in args.scenarios:
+            login = lambda i: client.post("/login", json=login_body)
+            report(await run_load("login", login, args.auth_requests, warmup=1))
+            report(await run_load("login concurrent", login, args.auth_requests, c))
+
+        if "me" in args.scenarios:
+            me = lambda i: client.get("/me", headers=headers)
+            report(await run_load("me", me, n, warmup=5))
+            report(await run_load("me concurrent", me, n, c))
+
+        if "users" in args.scenarios:
+            for size in args.sizes:
+                seed_users(db_path, size, password_hash)
+                page = lambda i: client.get("/users", params={"limit": 100}, headers=headers)
+                report(await run_load(f"users page size={size}", page, n, warmup=2, table_size=size))
+                etag = (await page(-1)).headers.get("etag")
+                if etag:
+                    revalidated = lambda i: client.get(
+                        "/users", params={"limit": 100}, headers={**headers, "If-None-Match": etag}
+                    )
+                    report(await run_load(
+                        f"users page revalidated size={size}", revalidated, n, expect=304, table_size=size,
+                    ))
+                large = lambda i: client.get("/users", params={"limit": 1000}, headers=headers)
+                report(await run_load(
+                    f"users page limit=1000 size={size}", large, max(10, n // 4), warmup=2, table_size=size,
+                ))
+                deep = lambda i: client.get(
+                    "/users", params={"limit": 100, "after": (i * 7919) % size}, headers=headers
+                )
+                report(await run_load(f"users deep page size={size}", deep, n, c, table_size=size))
+                total = lambda i: client.get(
+                    "/users", params={"limit": 100, "include_total": "true"}, headers=headers
+                )
+                report(await run_load(f"users with total size={size}", total, n, table_size=size))
+                stream = lambda i: client.get("/users", params={"stream": "ndjson"}, headers=headers)
+                report(await run_load(
+                    f"users stream size={size}", stream, max(3, n // 50), table_size=size,
+                ))
+
+        if "crud" in args.scenarios:
+            stamp = int(time.time() * 1000)
+            created: List[int] = []
+
+            async def create(i):
+                response = await client.post(
+                    "/users", headers=headers,
+                    json={"email": f"bench{stamp}-{i}@bench.local", "password": BENCH_PASSWORD},
+                )
+                if response.status_code == 200 and i >= 0:
+                    created.append(response.json()["user_id"])
+                return response
+
+            report(await run_load("create user", create, args.auth_requests, c))
+            get_one = lambda i: client.get(f"/users/{created[i % len(created)]}", headers=headers)
+            report(await run_load("get user", get_one, n, c))
+            update = lambda i: client.put(
+                f"/users/{created[i % len(created)]}", headers=headers,
+                json={"email": f"bench{stamp}-{i}-u@bench.local", "password": BENCH_PASSWORD},
+            )
+            report(await run_load("update user", update, min(args.auth_requests, len(created)), c))
+            delete = lambda i: client.delete(f"/users/{created[i]}", headers=headers)
+            report(await run_load("delete user", delete, len(created), c))
+
+        if "predict" in args.scenarios:
+            predict = lambda i: client.post("/predict", json=_predict_body(i))
+            report(await run_load("predict", predict, n, warmup=5))
+            report(await run_load("predict concurrent", predict, n, c))
+            report(await run_load("predict concurrent x4", predict, n, c * 4))
+            batch = json.dumps([_predict_body(i) for i in range(1000)])
+            predict_batch = lambda i: client.post(
+                "/predict/batch", content=batch, headers={"content-type": "application/json"}
+            )
+            report(await run_load("predict batch rows=1000", predict_batch, max(5, n // 20), warmup=1))
+
+    return results
+
+
+def _compare(results: List[dict], baseline_path: str) -> None:
+    with open(baseline_path) as f:
+        baseline = {r["name"]: r for r in json.load(f)["results"]}
+    print(f"\nCompared with {baseline_path} (negative latency / positive rps is better):")
+    for result in results:
+        old = baseline.get(result["name"])
+        if old is None:
+            continue
+        deltas = []
+        for key in ("p50", "p95", "p99"):
+            before, after = old["latency_ms"][key], result["latency_ms"][key]
+            if before:
+                deltas.append(f"{key} {100.0 * (after - before) / before:+6.1f}%")
+        if old["rps"]:
+            deltas.append(f"rps {100.0 * (result['rps'] - old['rps']) / old['rps']:+6.1f}%")
+        print(f"{result['name']:<34} " + "  ".join(deltas))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = _parse_args(argv)
+    tmpdir = None
+    if args.db:
+        db_path = os.path.abspath(args.db)
+    else:
+        tmpdir = tempfile.TemporaryDirectory(prefix="fastapi-bench-")
+        db_path = os.path.join(tmpdir.name, "bench.sqlite3")
+    _configure_environment(args, db_path)
+
+    try:
+        meta = _meta(args)
+        print(f"bench: mode={args.mode} commit={meta['git_commit']} "
+              f"bcrypt_rounds={meta['config'].get('BCRYPT_ROUNDS')} db={db_path}", flush=True)
+        results = asyncio.run(_run(args, db_path))
+    finally:
+        if tmpdir is not None:
+            tmpdir.cleanup()
+
+    out = Path(args.out) if args.out else RESULTS_DIR / (
+        datetime.datetime.now().strftime("%Y%m%d-%H%M%S") + f"-{args.mode}.json"
+    )
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, "w") as f:
+        json.dump({"meta": meta, "results": results}, f, indent=2)
+    print(f"\nResults written to {out}")
+
+    if args.compare:
+        _compare(results, args.compare)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
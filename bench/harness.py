@@ -0,0 +1,176 @@
+"""Building blocks for the benchmark suite: database seeding, in-process ASGI
+client, load generation and latency statistics.
+
+Requests go straight into the ASGI app through `httpx.ASGITransport`, so a
+run measures the application (routing, validation, pool, bcrypt, model)
+without a socket or a separate server process in the way. Sync endpoints
+still run on Starlette's threadpool exactly as they do under uvicorn.
+"""
+
+import asyncio
+import math
+import sqlite3
+import statistics
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+BENCH_PASSWORD = "bench-password"
+
+
+def create_users_table(path: str) -> None:
+    """Create an empty `users` table in a fresh SQLite database file.
+
+    The DDL comes from `db.schema`, so config must already point at SQLite.
+    """
+    from db import schema
+
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("DROP TABLE IF EXISTS users")
+        conn.execute("DROP TABLE IF EXISTS schema_migrations")
+        schema.migrate(conn)
+    finally:
+        conn.close()
+
+
+def seed_users(path: str, count: int, password_hash: str, batch: int = 10000) -> int:
+    """Grow the table to `count` users (all sharing `password_hash`); return the row count."""
+    conn = sqlite3.connect(path)
+    try:
+        (existing,) = conn.execute("SELECT COUNT(*) FROM users").fetchone()
+        start = existing
+        while start < count:
+            stop = min(count, start + batch)
+            conn.executemany(
+                "INSERT INTO users (email, password) VALUES (?, ?)",
+                ((f"user{i}@bench.local", password_hash) for i in range(start, stop)),
+            )
+            start = stop
+        conn.commit()
+        (total,) = conn.execute("SELECT COUNT(*) FROM users").fetchone()
+        return total
+    finally:
+        conn.close()
+
+
+class Lifespan:
+    """Run an ASGI app's startup/shutdown handlers around a block.
+
+    `httpx.ASGITransport` only sends HTTP requests, so the model load and
+    other `startup` hooks have to be triggered through the lifespan protocol.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._inbox: "asyncio.Queue[dict]" = asyncio.Queue()
+        self._events: Dict[str, asyncio.Event] = {}
+        self._failure: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def _receive(self) -> dict:
+        return await self._inbox.get()
+
+    async def _send(self, message: dict) -> None:
+        kind = message["type"]
+        if kind.endswith(".failed"):
+            self._failure = message.get("message", kind)
+        phase = kind.split(".")[1]  # lifespan.startup.complete -> startup
+        self._events.setdefault(phase, asyncio.Event()).set()
+
+    async def _wait(self, phase: str) -> None:
+        await self._events.setdefault(phase, asyncio.Event()).wait()
+        if self._failure:
+            raise RuntimeError(f"lifespan {phase} failed: {self._failure}")
+
+    async def __aenter__(self):
+        scope = {"type": "lifespan", "asgi": {"version": "3.0"}, "state": {}}
+        self._task = asyncio.create_task(self.app(scope, self._receive, self._send))
+        await self._inbox.put({"type": "lifespan.startup"})
+        await self._wait("startup")
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._inbox.put({"type": "lifespan.shutdown"})
+        await self._wait("shutdown")
+        await self._task
+        return False
+
+
+def client_for(app) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60.0
+    )
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(q / 100.0 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(name: str, latencies: List[float], errors: Dict[str, int],
+              wall: float, concurrency: int, **extra: Any) -> Dict[str, Any]:
+    ordered = sorted(latencies)
+    ms = lambda v: round(v * 1000.0, 3)
+    return {
+        "name": name,
+        "requests": len(latencies) + sum(errors.values()),
+        "ok": len(latencies),
+        "errors": errors,
+        "concurrency": concurrency,
+        "wall_seconds": round(wall, 4),
+        "rps": round(len(latencies) / wall, 2) if wall > 0 else 0.0,
+        "latency_ms": {
+            "p50": ms(percentile(ordered, 50)),
+            "p95": ms(percentile(ordered, 95)),
+            "p99": ms(percentile(ordered, 99)),
+            "mean": ms(statistics.fmean(ordered)) if ordered else 0.0,
+            "min": ms(ordered[0]) if ordered else 0.0,
+            "max": ms(ordered[-1]) if ordered else 0.0,
+        },
+        **extra,
+    }
+
+
+async def run_load(name: str, call: Callable[[int], Awaitable[httpx.Response]],
+                   requests: int, concurrency: int = 1, expect: int = 200,
+                   warmup: int = 0, **extra: Any) -> Dict[str, Any]:
+    """Issue `requests` calls from `concurrency` concurrent loops.
+
+    `call(i)` sends request number `i`. A response whose status is not
+    `expect` counts as an error (keyed by status code) and its latency is
+    not included.
+    """
+    for i in range(warmup):
+        await call(-1 - i)
+
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    next_index = 0
+
+    async def loop():
+        nonlocal next_index
+        while next_index < requests:
+            i = next_index
+            next_index += 1
+            started = time.perf_counter()
+            try:
+                response = await call(i)
+            except Exception as e:
+                key = type(e).__name__
+                errors[key] = errors.get(key, 0) + 1
+                continue
+            elapsed = time.perf_counter() - started
+            if response.status_code == expect:
+                latencies.append(elapsed)
+            else:
+                key = str(response.status_code)
+                errors[key] = errors.get(key, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(loop() for _ in range(max(1, concurrency))))
+    return summarize(name, latencies, errors, time.perf_counter() - started, concurrency, **extra)
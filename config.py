@@ -0,0 +1,200 @@
+"""Runtime configuration for the API.
+
+Every setting can be overridden with an environment variable of the same name
+so deployments can be tuned without code changes. The defaults match the local
+development setup (MySQL on localhost with the `fastapidb` database).
+"""
+
+import os
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value not in (None, "") else default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value in (None, ""):
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# Database connection
+DB_HOST = os.getenv("DB_HOST", "localhost")
+DB_PORT = _env_int("DB_PORT", 3306)
+DB_USER = os.getenv("DB_USER", "root")
+DB_PASSWORD = os.getenv("DB_PASSWORD", "")
+DB_NAME = os.getenv("DB_NAME", "fastapidb")
+
+# Connection pool
+DB_POOL_SIZE = _env_int("DB_POOL_SIZE", 5)              # connections kept open
+DB_POOL_MAX_OVERFLOW = _env_int("DB_POOL_MAX_OVERFLOW", 10)  # extra connections under burst
+DB_POOL_TIMEOUT = _env_float("DB_POOL_TIMEOUT", 10.0)   # seconds to wait for a free connection
+DB_POOL_RECYCLE = _env_float("DB_POOL_RECYCLE", 3600.0)  # close connections older than this (seconds)
+DB_POOL_PRE_PING = _env_bool("DB_POOL_PRE_PING", True)  # validate connections on checkout
+# Only validate connections that sat idle longer than this (seconds); 0 pings every checkout
+DB_POOL_PING_INTERVAL = _env_float("DB_POOL_PING_INTERVAL", 5.0)
+
+# Database backend: "mysql" for production, "sqlite" for a local stand-in used
+# by tests and benchmarks (no server required).
+DB_BACKEND = os.getenv("DB_BACKEND", "mysql").lower()
+SQLITE_PATH = os.getenv("SQLITE_PATH", "fastapidb.sqlite3")
+# Apply pending users table migrations (db/schema.py) when the app starts
+DB_MIGRATE_ON_STARTUP = _env_bool("DB_MIGRATE_ON_STARTUP", True)
+# How long a process waits for another one's migrations to finish (seconds)
+DB_MIGRATE_LOCK_TIMEOUT = _env_float("DB_MIGRATE_LOCK_TIMEOUT", 60.0)
+
+# Request handling mode for the user CRUD and auth routes: "sync" runs the
+# classic `def` handlers on Starlette's threadpool, "async" serves them from
+# `async def` handlers on an async driver (aiomysql / aiosqlite).
+API_MODE = os.getenv("API_MODE", "sync").lower()
+
+# Startup. LAZY_STARTUP defers importing the AI routes (app.py, NumPy, the
+# model's sklearn dependencies) and loading the startup model to a background
+# thread, so workers start serving user routes at once; /predict and the
+# /models endpoints answer 503 until they are ready (see ai_startup.py).
+LAZY_STARTUP = _env_bool("LAZY_STARTUP", False)
+LOG_ROUTES = _env_bool("LOG_ROUTES", False)  # log every registered route once startup finishes
+
+# Password hashing
+BCRYPT_ROUNDS = _env_int("BCRYPT_ROUNDS", 12)           # bcrypt cost factor (2^rounds iterations)
+# "process" hashes in a dedicated process pool, "thread" in a thread pool
+# (bcrypt releases the GIL), "inline" on the calling thread (tests only).
+PASSWORD_HASH_EXECUTOR = os.getenv("PASSWORD_HASH_EXECUTOR", "process").lower()
+PASSWORD_HASH_WORKERS = _env_int("PASSWORD_HASH_WORKERS", os.cpu_count() or 1)
+# Jobs allowed to wait behind the busy workers before new ones are rejected
+PASSWORD_HASH_QUEUE_SIZE = _env_int("PASSWORD_HASH_QUEUE_SIZE", 4 * (os.cpu_count() or 1))
+
+# Access tokens (auth/tokens.py). JWT_SECRET_KEYS lists "kid:secret" pairs
+# separated by commas; JWT_ACTIVE_KID (default: the first) signs new tokens
+# and the others still verify, so a key can be rotated in and out without
+# logging everyone out. Unset, the development key is used.
+JWT_SECRET_KEYS = os.getenv("JWT_SECRET_KEYS", "")
+JWT_ACTIVE_KID = os.getenv("JWT_ACTIVE_KID") or None
+ACCESS_TOKEN_EXPIRE_MINUTES = _env_int("ACCESS_TOKEN_EXPIRE_MINUTES", 30)
+# Trust the user id in a verified token instead of looking the user up.
+# Revocations (auth/revocation.py) are per process, so only enable this when
+# one process serves the API
+AUTH_STATELESS = _env_bool("AUTH_STATELESS", False)
+TOKEN_REVOCATION_MAX_USERS = _env_int("TOKEN_REVOCATION_MAX_USERS", 100000)  # users revoked within one token lifetime
+# Emails (comma-separated) allowed to load, activate, roll back and rescan
+# models through POST /models/...; unset, nobody is
+ADMIN_EMAILS = frozenset(
+    email.strip().lower() for email in os.getenv("ADMIN_EMAILS", "").split(",") if email.strip()
+)
+
+# Verified-principal cache used by get_current_user
+PRINCIPAL_CACHE_ENABLED = _env_bool("PRINCIPAL_CACHE_ENABLED", True)
+PRINCIPAL_CACHE_SIZE = _env_int("PRINCIPAL_CACHE_SIZE", 10000)
+PRINCIPAL_CACHE_TTL = _env_float("PRINCIPAL_CACHE_TTL", 60.0)  # seconds, never beyond the token's exp
+
+# GET /users pagination
+USERS_PAGE_DEFAULT_LIMIT = _env_int("USERS_PAGE_DEFAULT_LIMIT", 100)
+USERS_PAGE_MAX_LIMIT = _env_int("USERS_PAGE_MAX_LIMIT", 1000)
+USERS_STREAM_BATCH_SIZE = _env_int("USERS_STREAM_BATCH_SIZE", 1000)  # rows fetched per round-trip when streaming
+
+# GET /users/search
+USERS_SEARCH_DEFAULT_LIMIT = _env_int("USERS_SEARCH_DEFAULT_LIMIT", 20)
+USERS_SEARCH_MAX_LIMIT = _env_int("USERS_SEARCH_MAX_LIMIT", 100)
+# Top up short prefix results from the database with substring matches (a
+# table scan) once the query is at least this long; 0 turns them off
+USERS_SEARCH_SUBSTRING_MIN = _env_int("USERS_SEARCH_SUBSTRING_MIN", 3)
+# Serve searches from an in-process index built at startup (user_search.py)
+USER_SEARCH_INDEX = _env_bool("USER_SEARCH_INDEX", False)
+
+# Conditional GET (http_cache.py): ETag/Last-Modified from per-table version
+# counters on GET /users, /users/{id}, /me and /models, answering 304 when
+# the client's copy is current. Counters are per process, so only enable this
+# when one process serves the API and all writes go through it
+HTTP_CACHE_ENABLED = _env_bool("HTTP_CACHE_ENABLED", False)
+HTTP_CACHE_MAX_AGE = _env_int("HTTP_CACHE_MAX_AGE", 0)  # seconds clients may reuse a response unchecked
+
+# POST /users/bulk
+USERS_BULK_CHUNK_SIZE = _env_int("USERS_BULK_CHUNK_SIZE", 500)              # rows hashed and inserted per transaction
+USERS_BULK_SPOOL_BYTES = _env_int("USERS_BULK_SPOOL_BYTES", 1024 * 1024)    # upload bytes kept in memory before spilling to disk
+
+# /predict micro-batching
+PREDICT_BATCHING = _env_bool("PREDICT_BATCHING", True)
+PREDICT_BATCH_MAX_SIZE = _env_int("PREDICT_BATCH_MAX_SIZE", 32)      # rows per model call
+PREDICT_BATCH_MAX_WAIT_MS = _env_float("PREDICT_BATCH_MAX_WAIT_MS", 2.0)  # how long to wait for more rows
+PREDICT_TIMEOUT = _env_float("PREDICT_TIMEOUT", 30.0)               # seconds a request waits for its result
+
+# POST /predict/batch
+PREDICT_BULK_CHUNK_SIZE = _env_int("PREDICT_BULK_CHUNK_SIZE", 1024)        # records scored per model call
+PREDICT_BULK_SPOOL_BYTES = _env_int("PREDICT_BULK_SPOOL_BYTES", 1024 * 1024)  # upload bytes kept in memory before spilling to disk
+
+# /predict result cache (off by default; enable where traffic has many repeats)
+PREDICT_CACHE_ENABLED = _env_bool("PREDICT_CACHE_ENABLED", False)
+PREDICT_CACHE_SIZE = _env_int("PREDICT_CACHE_SIZE", 10000)
+PREDICT_CACHE_TTL = _env_float("PREDICT_CACHE_TTL", 300.0)  # seconds
+
+# Model registry: versions are the .pkl files (or subdirectories) in MODEL_DIR.
+# MODEL_VERSION picks the version served at startup (default: the MODEL_FILE
+# version if set, else the last version name in natural order, "v10" > "v2").
+MODEL_DIR = os.getenv("MODEL_DIR", "models")
+MODEL_VERSION = os.getenv("MODEL_VERSION") or None
+# A model file outside MODEL_DIR to register as one more version (opt-in)
+MODEL_FILE = os.getenv("MODEL_FILE") or None
+
+# Dedicated inference worker processes (0 = score in the web process)
+INFERENCE_WORKERS = _env_int("INFERENCE_WORKERS", 0)
+INFERENCE_WORKER_MAX_ROWS = _env_int("INFERENCE_WORKER_MAX_ROWS", 1024)            # rows per worker call (sizes the shared memory)
+INFERENCE_WORKER_HEALTH_INTERVAL = _env_float("INFERENCE_WORKER_HEALTH_INTERVAL", 5.0)  # seconds between idle-worker pings
+
+# Compiled fast-path scorer (checked against the pipeline at load; falls back when unsupported)
+COMPILED_SCORER = _env_bool("COMPILED_SCORER", True)
+COMPILED_SCORER_MAX_ROWS = _env_int("COMPILED_SCORER_MAX_ROWS", 256)  # larger batches run through sklearn
+
+# Audit log of /predict and /predict/batch inputs and outputs (ai/audit.py),
+# written as NDJSON by a background thread; requests never wait on the disk
+AUDIT_LOG_ENABLED = _env_bool("AUDIT_LOG_ENABLED", False)
+AUDIT_LOG_PATH = os.getenv("AUDIT_LOG_PATH", "logs/predictions.jsonl")
+AUDIT_LOG_CAPACITY = _env_int("AUDIT_LOG_CAPACITY", 10000)                 # entries buffered in memory
+AUDIT_LOG_BATCH_SIZE = _env_int("AUDIT_LOG_BATCH_SIZE", 512)               # entries per write
+AUDIT_LOG_FLUSH_INTERVAL = _env_float("AUDIT_LOG_FLUSH_INTERVAL", 1.0)     # seconds a partial batch waits
+AUDIT_LOG_MAX_BYTES = _env_int("AUDIT_LOG_MAX_BYTES", 100 * 1024 * 1024)   # rotate past this size
+AUDIT_LOG_BACKUPS = _env_int("AUDIT_LOG_BACKUPS", 5)                       # rotated files kept
+AUDIT_LOG_COMPRESS = _env_bool("AUDIT_LOG_COMPRESS", True)                 # gzip rotated files
+# "drop" discards (and counts) entries while the buffer is full; "block"
+# waits up to AUDIT_LOG_BLOCK_TIMEOUT seconds for room first
+AUDIT_LOG_OVERFLOW = os.getenv("AUDIT_LOG_OVERFLOW", "drop").lower()
+AUDIT_LOG_BLOCK_TIMEOUT = _env_float("AUDIT_LOG_BLOCK_TIMEOUT", 0.05)
+AUDIT_LOG_FSYNC = _env_bool("AUDIT_LOG_FSYNC", False)                      # fsync after every batch
+
+# Encode list and prediction responses with orjson when it is installed (serialization.py)
+FAST_JSON = _env_bool("FAST_JSON", True)
+
+# Admission control (admission.py): per-route-class concurrency limits and
+# per-client token buckets, shedding with 503/429 and Retry-After. /health,
+# /me, /metrics and /ai/health are never limited. In sync mode keep the sum of
+# the concurrency limits below Starlette's threadpool size (40) so exempt
+# routes always find a free thread.
+ADMISSION_ENABLED = _env_bool("ADMISSION_ENABLED", False)
+# Rate-limit key: "subject" (the verified token's sub, else the IP) or "ip"
+ADMISSION_KEY = os.getenv("ADMISSION_KEY", "subject").lower()
+ADMISSION_TRUST_FORWARDED = _env_bool("ADMISSION_TRUST_FORWARDED", False)  # client IP from X-Forwarded-For
+ADMISSION_MAX_CLIENTS = _env_int("ADMISSION_MAX_CLIENTS", 100000)  # buckets kept per route class (LRU)
+ADMISSION_IDLE_SECONDS = _env_float("ADMISSION_IDLE_SECONDS", 300.0)  # drop buckets idle this long
+# Per route class: requests in flight (0 = unlimited), and per-client rate
+# (requests/second, 0 = unlimited) with its burst
+ADMISSION_AUTH_CONCURRENCY = _env_int("ADMISSION_AUTH_CONCURRENCY", 8)  # POST /login, /register
+ADMISSION_AUTH_RATE = _env_float("ADMISSION_AUTH_RATE", 1.0)
+ADMISSION_AUTH_BURST = _env_int("ADMISSION_AUTH_BURST", 10)
+ADMISSION_PREDICT_CONCURRENCY = _env_int("ADMISSION_PREDICT_CONCURRENCY", 16)  # /predict, /predict/batch
+ADMISSION_PREDICT_RATE = _env_float("ADMISSION_PREDICT_RATE", 20.0)
+ADMISSION_PREDICT_BURST = _env_int("ADMISSION_PREDICT_BURST", 40)
+ADMISSION_USERS_CONCURRENCY = _env_int("ADMISSION_USERS_CONCURRENCY", 8)  # GET /users, /users/export, POST /users/bulk
+ADMISSION_USERS_RATE = _env_float("ADMISSION_USERS_RATE", 10.0)
+ADMISSION_USERS_BURST = _env_int("ADMISSION_USERS_BURST", 20)
+ADMISSION_DEFAULT_CONCURRENCY = _env_int("ADMISSION_DEFAULT_CONCURRENCY", 0)  # everything else
+ADMISSION_DEFAULT_RATE = _env_float("ADMISSION_DEFAULT_RATE", 50.0)
+ADMISSION_DEFAULT_BURST = _env_int("ADMISSION_DEFAULT_BURST", 100)
+
+# Request/stage metrics served on GET /metrics
+METRICS_ENABLED = _env_bool("METRICS_ENABLED", True)
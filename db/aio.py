@@ -0,0 +1,474 @@
+"""Asyncio connection pool and repository functions for the `users` table.
+
+This mirrors `db.pool` and `db.users` for the async API mode. Connections come
+from aiomysql in production or aiosqlite as a local stand-in; both expose the
+same awaitable cursor interface, so the queries below are shared.
+"""
+
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+import inspect
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import config
+import metrics
+from db.pool import PoolTimeout
+from db.users import (
+    COUNT_USERS_QUERY,
+    IN_LIST_CHUNK,
+    LIST_USERS_PAGE_QUERY,
+    SEARCH_PREFIX_QUERY,
+    SEARCH_SUBSTRING_QUERY,
+    STREAM_USERS_QUERY,
+    like_contains,
+    prefix_range,
+    sql,
+)
+
+
+async def connect_mysql():
+    """Open a new aiomysql connection using the settings in `config`."""
+    import aiomysql
+    from pymysql.constants import CLIENT
+
+    return await aiomysql.connect(
+        host=config.DB_HOST,
+        port=config.DB_PORT,
+        user=config.DB_USER,
+        password=config.DB_PASSWORD,
+        db=config.DB_NAME,
+        charset="utf8mb4",
+        autocommit=False,
+        # Matched instead of changed rows for UPDATE (see db.users.update_user)
+        client_flag=CLIENT.FOUND_ROWS,
+    )
+
+
+async def connect_sqlite():
+    """Open a new aiosqlite connection (local stand-in for MySQL)."""
+    import aiosqlite
+
+    return await aiosqlite.connect(config.SQLITE_PATH)
+
+
+async def connect():
+    """Open a new async connection for `config.DB_BACKEND`."""
+    if config.DB_BACKEND == "sqlite":
+        return await connect_sqlite()
+    return await connect_mysql()
+
+
+async def _maybe_await(result):
+    if inspect.isawaitable(result):
+        return await result
+    return result
+
+
+async def _default_validate(conn: Any) -> bool:
+    ping = getattr(conn, "ping", None)
+    if ping is not None:
+        # aiomysql: a protocol-level ping without reconnecting
+        await ping(reconnect=False)
+        return True
+    cursor = await conn.cursor()
+    try:
+        await cursor.execute("SELECT 1")
+        await cursor.fetchall()
+    finally:
+        await _maybe_await(cursor.close())
+    return True
+
+
+# SERVER_STATUS_IN_TRANS from pymysql.constants.SERVER_STATUS
+_MYSQL_STATUS_IN_TRANS = 1
+
+
+def _in_transaction(conn: Any) -> bool:
+    in_transaction = getattr(conn, "in_transaction", None)
+    if in_transaction is not None:
+        # aiosqlite
+        return bool(in_transaction)
+    server_status = getattr(conn, "server_status", None)
+    if server_status is not None:
+        # aiomysql: the status flags of the last reply; never set in autocommit mode
+        return bool(server_status & _MYSQL_STATUS_IN_TRANS)
+    return True
+
+
+async def _default_reset(conn: Any) -> None:
+    """Discard any transaction left open by the previous borrower."""
+    # Skip the round-trip when the driver can tell us nothing is pending.
+    if _in_transaction(conn):
+        await conn.rollback()
+
+
+class AsyncConnectionPool:
+    """asyncio counterpart of `db.pool.ConnectionPool`.
+
+    Same sizing semantics (`size` kept idle, up to `max_overflow` extra under
+    burst, `timeout` for checkout) and the same `stats()` keys.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], Awaitable[Any]],
+        size: int = 5,
+        max_overflow: int = 10,
+        timeout: float = 10.0,
+        recycle: Optional[float] = None,
+        pre_ping: bool = True,
+        ping_interval: float = 0.0,
+        validate: Callable[[Any], Awaitable[bool]] = _default_validate,
+        reset: Callable[[Any], Awaitable[None]] = _default_reset,
+    ):
+        if size < 1:
+            raise ValueError("pool size must be at least 1")
+        if max_overflow < 0:
+            raise ValueError("max_overflow must not be negative")
+        self._factory = factory
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self.pre_ping = pre_ping
+        self.ping_interval = ping_interval
+        self._validate = validate
+        self._reset = reset
+
+        self._idle: deque = deque()
+        self._created_at: Dict[int, float] = {}
+        self._last_used: Dict[int, float] = {}
+        self._cond = asyncio.Condition()
+        self._open = 0
+        self._checked_out = 0
+        self._closed = False
+
+        self._checkouts = 0
+        self._created = 0
+        self._discarded = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._wait_time = 0.0
+
+    async def acquire(self, timeout: Optional[float] = None) -> Any:
+        """Check out a connection, waiting up to `timeout` seconds."""
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        waited = False
+        while True:
+            async with self._cond:
+                if self._closed:
+                    raise PoolTimeout("connection pool is closed")
+                conn = None
+                create = False
+                if self._idle:
+                    conn = self._idle.pop()
+                elif self._open < self.size + self.max_overflow:
+                    self._open += 1
+                    create = True
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeout(
+                            f"no database connection available within {timeout:.1f}s "
+                            f"(size={self.size}, max_overflow={self.max_overflow})"
+                        )
+                    if not waited:
+                        waited = True
+                        self._waits += 1
+                    started = time.monotonic()
+                    try:
+                        await asyncio.wait_for(self._cond.wait(), remaining)
+                    except asyncio.TimeoutError:
+                        pass
+                    self._wait_time += time.monotonic() - started
+                    continue
+                self._checked_out += 1
+                self._checkouts += 1
+
+            if create:
+                try:
+                    conn = await self._factory()
+                except BaseException:
+                    async with self._cond:
+                        self._open -= 1
+                        self._checked_out -= 1
+                        self._cond.notify()
+                    raise
+                self._created += 1
+                self._created_at[id(conn)] = time.monotonic()
+                return conn
+
+            if await self._is_usable(conn):
+                return conn
+
+            await self._close_raw(conn)
+            async with self._cond:
+                self._open -= 1
+                self._checked_out -= 1
+                self._discarded += 1
+                self._cond.notify()
+
+    async def release(self, conn: Any, discard: bool = False) -> None:
+        """Return a connection to the pool (or close it if `discard` is set)."""
+        if not discard:
+            try:
+                await self._reset(conn)
+            except Exception:
+                discard = True
+        async with self._cond:
+            self._checked_out -= 1
+            keep = not discard and not self._closed and len(self._idle) < self.size
+            if keep:
+                self._last_used[id(conn)] = time.monotonic()
+                self._idle.append(conn)
+            else:
+                self._open -= 1
+                if discard:
+                    self._discarded += 1
+            self._cond.notify()
+        if not keep:
+            await self._close_raw(conn)
+
+    @asynccontextmanager
+    async def connection(self, timeout: Optional[float] = None):
+        conn = await self.acquire(timeout)
+        discard = False
+        try:
+            yield conn
+        except BaseException:
+            discard = not await self._check(conn)
+            raise
+        finally:
+            await self.release(conn, discard=discard)
+
+    async def close(self) -> None:
+        async with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._open -= len(idle)
+            self._cond.notify_all()
+        for conn in idle:
+            await self._close_raw(conn)
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "max_overflow": self.max_overflow,
+            "timeout": self.timeout,
+            "open": self._open,
+            "idle": len(self._idle),
+            "checked_out": self._checked_out,
+            "overflow": max(0, self._open - self.size),
+            "checkouts": self._checkouts,
+            "created": self._created,
+            "discarded": self._discarded,
+            "waits": self._waits,
+            "timeouts": self._timeouts,
+            "wait_time_seconds": round(self._wait_time, 6),
+        }
+
+    async def _is_usable(self, conn: Any) -> bool:
+        created = self._created_at.get(id(conn), time.monotonic())
+        if self.recycle is not None and time.monotonic() - created > self.recycle:
+            return False
+        if not self.pre_ping:
+            return True
+        if time.monotonic() - self._last_used.get(id(conn), 0.0) < self.ping_interval:
+            return True
+        return await self._check(conn)
+
+    async def _check(self, conn: Any) -> bool:
+        try:
+            return await self._validate(conn)
+        except Exception:
+            return False
+
+    async def _close_raw(self, conn: Any) -> None:
+        self._created_at.pop(id(conn), None)
+        self._last_used.pop(id(conn), None)
+        try:
+            await _maybe_await(conn.close())
+        except Exception:
+            pass
+
+
+# -- repository -------------------------------------------------------------
+
+def _rows_as_dicts(cursor, rows) -> List[Dict[str, Any]]:
+    columns = [d[0] for d in cursor.description]
+    return [dict(zip(columns, row)) for row in rows]
+
+
+async def _execute(conn, query: str, params: tuple = (), server_side: bool = False):
+    if server_side and type(conn).__module__.startswith("aiomysql"):
+        # aiomysql's default cursor buffers the whole result set client-side
+        import aiomysql
+        cursor = await conn.cursor(aiomysql.SSCursor)
+    else:
+        cursor = await conn.cursor()
+    await cursor.execute(query, params)
+    return cursor
+
+
+async def _fetchone(conn, query: str, params: tuple = ()) -> Optional[Dict[str, Any]]:
+    cursor = await _execute(conn, sql(query), params)
+    try:
+        row = await cursor.fetchone()
+        return _rows_as_dicts(cursor, [row])[0] if row is not None else None
+    finally:
+        await _maybe_await(cursor.close())
+
+
+@metrics.timed("db_query")
+async def get_user_by_email(conn, email: str) -> Optional[Dict[str, Any]]:
+    return await _fetchone(
+        conn, "SELECT user_id, email, password FROM users WHERE email = %s", (email,)
+    )
+
+
+@metrics.timed("db_query")
+async def get_principal_by_email(conn, email: str) -> Optional[Dict[str, Any]]:
+    return await _fetchone(
+        conn, "SELECT user_id, email FROM users WHERE email = %s", (email,)
+    )
+
+
+@metrics.timed("db_query")
+async def get_user_by_id(conn, user_id: int) -> Optional[Dict[str, Any]]:
+    return await _fetchone(
+        conn, "SELECT user_id, email FROM users WHERE user_id = %s", (user_id,)
+    )
+
+
+@metrics.timed("db_query")
+async def list_users(conn, after: int = 0, limit: int = 100) -> List[Dict[str, Any]]:
+    cursor = await _execute(conn, sql(LIST_USERS_PAGE_QUERY), (after, limit))
+    try:
+        return _rows_as_dicts(cursor, await cursor.fetchall())
+    finally:
+        await _maybe_await(cursor.close())
+
+
+@metrics.timed("db_query")
+async def count_users(conn) -> int:
+    cursor = await _execute(conn, COUNT_USERS_QUERY)
+    try:
+        return int((await cursor.fetchone())[0])
+    finally:
+        await _maybe_await(cursor.close())
+
+
+async def iter_users(conn, after: int = 0, limit: Optional[int] = None,
+                     batch_size: int = 1000) -> AsyncIterator[Dict[str, Any]]:
+    """Yield users with `user_id > after` from a server-side cursor."""
+    if limit is None:
+        query, params = STREAM_USERS_QUERY, (after,)
+    else:
+        query, params = LIST_USERS_PAGE_QUERY, (after, limit)
+    cursor = await _execute(conn, sql(query), params, server_side=True)
+    try:
+        columns = [d[0] for d in cursor.description]
+        while True:
+            rows = await cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield dict(zip(columns, row))
+    finally:
+        await _maybe_await(cursor.close())
+
+
+@metrics.timed("db_query")
+async def search_users(conn, q: str, limit: int, substring: bool = False) -> List[Dict[str, Any]]:
+    lo, hi = prefix_range(q)
+    cursor = await _execute(conn, sql(SEARCH_PREFIX_QUERY), (lo, hi, limit))
+    try:
+        rows = _rows_as_dicts(cursor, await cursor.fetchall())
+    finally:
+        await _maybe_await(cursor.close())
+    if substring and len(rows) < limit:
+        cursor = await _execute(
+            conn, sql(SEARCH_SUBSTRING_QUERY), (like_contains(q), lo, hi, limit - len(rows))
+        )
+        try:
+            rows += _rows_as_dicts(cursor, await cursor.fetchall())
+        finally:
+            await _maybe_await(cursor.close())
+    return rows
+
+
+async def _write(conn, query: str, params: tuple) -> Tuple[int, Any]:
+    """Run one write statement in its own transaction; return `(rowcount, lastrowid)`."""
+    try:
+        cursor = await _execute(conn, sql(query), params)
+    except Exception:
+        await conn.rollback()
+        raise
+    try:
+        await conn.commit()
+        return cursor.rowcount, cursor.lastrowid
+    finally:
+        await _maybe_await(cursor.close())
+
+
+@metrics.timed("db_query")
+async def insert_user(conn, email: str, password_hash: str) -> int:
+    _, user_id = await _write(
+        conn, "INSERT INTO users (email, password) VALUES (%s, %s)", (email, password_hash)
+    )
+    return user_id
+
+
+@metrics.timed("db_query")
+async def find_existing_emails(conn, emails: Sequence[str]) -> Set[str]:
+    found: Set[str] = set()
+    for start in range(0, len(emails), IN_LIST_CHUNK):
+        batch = emails[start:start + IN_LIST_CHUNK]
+        placeholders = ", ".join(["%s"] * len(batch))
+        cursor = await _execute(
+            conn, sql(f"SELECT email FROM users WHERE email IN ({placeholders})"), tuple(batch)
+        )
+        try:
+            found.update(row[0] for row in await cursor.fetchall())
+        finally:
+            await _maybe_await(cursor.close())
+    return found
+
+
+@metrics.timed("db_query")
+async def insert_users(conn, rows: Iterable[Tuple[str, str]]) -> int:
+    """Insert `(email, password_hash)` rows in one transaction (see `db.users.insert_users`)."""
+    rows = list(rows)
+    if not rows:
+        return 0
+    cursor = await conn.cursor()
+    try:
+        await cursor.executemany(sql("INSERT INTO users (email, password) VALUES (%s, %s)"), rows)
+        await conn.commit()
+        return len(rows)
+    except Exception:
+        await conn.rollback()
+        raise
+    finally:
+        await _maybe_await(cursor.close())
+
+
+@metrics.timed("db_query")
+async def update_user(conn, user_id: int, email: str, password_hash: str) -> bool:
+    rowcount, _ = await _write(
+        conn,
+        "UPDATE users SET email = %s, password = %s WHERE user_id = %s",
+        (email, password_hash, user_id),
+    )
+    return rowcount > 0
+
+
+@metrics.timed("db_query")
+async def delete_user(conn, user_id: int) -> bool:
+    rowcount, _ = await _write(conn, "DELETE FROM users WHERE user_id = %s", (user_id,))
+    return rowcount > 0
@@ -0,0 +1,39 @@
+"""Connection factories for the configured database backend."""
+
+import sqlite3
+
+import config
+
+
+def connect_mysql():
+    """Open a new MySQL connection using the settings in `config`."""
+    import mysql.connector
+    from mysql.connector.constants import ClientFlag
+
+    return mysql.connector.connect(
+        host=config.DB_HOST,
+        port=config.DB_PORT,
+        user=config.DB_USER,
+        password=config.DB_PASSWORD,
+        database=config.DB_NAME,
+        charset='utf8mb4',
+        collation='utf8mb4_unicode_ci',
+        autocommit=False,
+        # UPDATE reports matched rather than changed rows, so rewriting a
+        # user with identical values still counts as found (see db.users)
+        client_flags=[ClientFlag.FOUND_ROWS],
+    )
+
+
+def connect_sqlite():
+    """Open a new SQLite connection (local stand-in for MySQL)."""
+    # Pooled connections are handed to whichever threadpool worker serves the
+    # request, so the same-thread check has to be disabled.
+    return sqlite3.connect(config.SQLITE_PATH, check_same_thread=False)
+
+
+def connect():
+    """Open a new connection for `config.DB_BACKEND`."""
+    if config.DB_BACKEND == "sqlite":
+        return connect_sqlite()
+    return connect_mysql()
@@ -0,0 +1,28 @@
+"""Driver-independent database exception types.
+
+Handlers catch these tuples instead of a single driver's `Error` so the same
+code works on MySQL (mysql.connector or aiomysql) and on SQLite.
+"""
+
+import sqlite3
+
+_errors = [sqlite3.Error]
+_integrity_errors = [sqlite3.IntegrityError]
+
+try:
+    from mysql.connector import Error as _MySQLError, IntegrityError as _MySQLIntegrityError
+    _errors.append(_MySQLError)
+    _integrity_errors.append(_MySQLIntegrityError)
+except ImportError:  # mysql-connector is optional when running on SQLite
+    pass
+
+try:
+    # aiomysql raises PyMySQL's exception hierarchy
+    from pymysql.err import MySQLError as _PyMySQLError, IntegrityError as _PyMySQLIntegrityError
+    _errors.append(_PyMySQLError)
+    _integrity_errors.append(_PyMySQLIntegrityError)
+except ImportError:
+    pass
+
+DatabaseError = tuple(_errors)
+IntegrityError = tuple(_integrity_errors)
@@ -0,0 +1,265 @@
+"""Thread-safe database connection pool.
+
+The pool keeps up to `size` idle connections open and hands them out to
+request handlers. Under burst load it may open up to `max_overflow` extra
+connections, which are closed again when returned instead of being kept idle.
+A checkout that cannot be satisfied within `timeout` seconds raises
+`PoolTimeout` so callers can shed load instead of queueing forever.
+
+The pool is driver agnostic: it only needs a zero-argument `factory` that
+returns a new DB-API connection, so the same code backs MySQL in production
+and SQLite in local tests.
+"""
+
+from collections import deque
+from contextlib import contextmanager
+import threading
+import time
+from typing import Any, Callable, Optional
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available within the checkout timeout."""
+
+
+class _PooledConnection:
+    """Book-keeping wrapper around a raw connection."""
+
+    __slots__ = ("raw", "created_at", "last_used")
+
+    def __init__(self, raw: Any):
+        self.raw = raw
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+def _default_validate(conn: Any) -> bool:
+    """Return True if the connection is still usable."""
+    # mysql.connector exposes is_connected() which pings the server. Other
+    # drivers get a trivial round-trip instead.
+    is_connected = getattr(conn, "is_connected", None)
+    if callable(is_connected):
+        return bool(is_connected())
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT 1")
+        cursor.fetchall()
+    finally:
+        cursor.close()
+    return True
+
+
+def _default_reset(conn: Any) -> None:
+    """Discard any transaction left open by the previous borrower."""
+    # Skip the round-trip when the driver can tell us nothing is pending.
+    if getattr(conn, "in_transaction", True):
+        conn.rollback()
+
+
+class ConnectionPool:
+    """Fixed-size pool with bounded overflow, checkout timeout and validation."""
+
+    def __init__(
+        self,
+        factory: Callable[[], Any],
+        size: int = 5,
+        max_overflow: int = 10,
+        timeout: float = 10.0,
+        recycle: Optional[float] = None,
+        pre_ping: bool = True,
+        ping_interval: float = 0.0,
+        validate: Callable[[Any], bool] = _default_validate,
+        reset: Callable[[Any], None] = _default_reset,
+    ):
+        if size < 1:
+            raise ValueError("pool size must be at least 1")
+        if max_overflow < 0:
+            raise ValueError("max_overflow must not be negative")
+        self._factory = factory
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self.pre_ping = pre_ping
+        self.ping_interval = ping_interval
+        self._validate = validate
+        self._reset = reset
+
+        self._idle: deque = deque()
+        self._leases: dict = {}  # id(raw connection) -> _PooledConnection
+        self._cond = threading.Condition(threading.Lock())
+        self._open = 0          # connections currently open (idle + checked out)
+        self._checked_out = 0
+        self._closed = False
+
+        # Counters exposed through stats()
+        self._checkouts = 0
+        self._created = 0
+        self._discarded = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._wait_time = 0.0
+
+    # -- checkout / checkin -------------------------------------------------
+
+    def acquire(self, timeout: Optional[float] = None) -> Any:
+        """Check out a connection, blocking up to `timeout` seconds."""
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        waited = False
+        while True:
+            with self._cond:
+                if self._closed:
+                    raise PoolTimeout("connection pool is closed")
+                entry = None
+                create = False
+                if self._idle:
+                    entry = self._idle.pop()
+                elif self._open < self.size + self.max_overflow:
+                    # Reserve the slot before leaving the lock so concurrent
+                    # callers cannot exceed the limit while we connect.
+                    self._open += 1
+                    create = True
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeout(
+                            f"no database connection available within {timeout:.1f}s "
+                            f"(size={self.size}, max_overflow={self.max_overflow})"
+                        )
+                    if not waited:
+                        waited = True
+                        self._waits += 1
+                    started = time.monotonic()
+                    self._cond.wait(remaining)
+                    self._wait_time += time.monotonic() - started
+                    continue
+                self._checked_out += 1
+                self._checkouts += 1
+
+            if create:
+                try:
+                    entry = _PooledConnection(self._factory())
+                except BaseException:
+                    with self._cond:
+                        self._open -= 1
+                        self._checked_out -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._created += 1
+                self._leases[id(entry.raw)] = entry
+                return entry.raw
+
+            if self._is_usable(entry):
+                entry.last_used = time.monotonic()
+                self._leases[id(entry.raw)] = entry
+                return entry.raw
+
+            # Stale connection: drop it and try again with the freed slot.
+            self._close_raw(entry.raw)
+            with self._cond:
+                self._open -= 1
+                self._checked_out -= 1
+                self._discarded += 1
+                self._cond.notify()
+
+    def release(self, conn: Any, discard: bool = False) -> None:
+        """Return a connection to the pool (or close it if `discard` is set)."""
+        entry = self._leases.pop(id(conn), None) or _PooledConnection(conn)
+        if not discard:
+            try:
+                self._reset(conn)
+            except Exception:
+                discard = True
+        with self._cond:
+            self._checked_out -= 1
+            keep = (
+                not discard
+                and not self._closed
+                and len(self._idle) < self.size
+            )
+            if keep:
+                entry.last_used = time.monotonic()
+                self._idle.append(entry)
+            else:
+                self._open -= 1
+                if discard:
+                    self._discarded += 1
+            self._cond.notify()
+        if not keep:
+            self._close_raw(conn)
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None):
+        """Context manager that checks a connection out and always returns it."""
+        conn = self.acquire(timeout)
+        discard = False
+        try:
+            yield conn
+        except BaseException:
+            # A broken connection must not go back into the pool. Errors are
+            # the slow path, so paying for one validation round-trip is fine.
+            discard = not self._check(conn)
+            raise
+        finally:
+            self.release(conn, discard=discard)
+
+    # -- maintenance --------------------------------------------------------
+
+    def close(self) -> None:
+        """Close all idle connections and refuse further checkouts."""
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._open -= len(idle)
+            self._cond.notify_all()
+        for entry in idle:
+            self._close_raw(entry.raw)
+
+    def stats(self) -> dict:
+        """Snapshot of pool usage, suitable for health endpoints."""
+        with self._cond:
+            return {
+                "size": self.size,
+                "max_overflow": self.max_overflow,
+                "timeout": self.timeout,
+                "open": self._open,
+                "idle": len(self._idle),
+                "checked_out": self._checked_out,
+                "overflow": max(0, self._open - self.size),
+                "checkouts": self._checkouts,
+                "created": self._created,
+                "discarded": self._discarded,
+                "waits": self._waits,
+                "timeouts": self._timeouts,
+                "wait_time_seconds": round(self._wait_time, 6),
+            }
+
+    # -- helpers ------------------------------------------------------------
+
+    def _is_usable(self, entry: _PooledConnection) -> bool:
+        if self.recycle is not None and time.monotonic() - entry.created_at > self.recycle:
+            return False
+        if not self.pre_ping:
+            return True
+        # A connection that was in use moments ago is almost certainly still
+        # alive; skip the extra round-trip for hot connections.
+        if time.monotonic() - entry.last_used < self.ping_interval:
+            return True
+        return self._check(entry.raw)
+
+    def _check(self, conn: Any) -> bool:
+        try:
+            return self._validate(conn)
+        except Exception:
+            return False
+
+    @staticmethod
+    def _close_raw(conn: Any) -> None:
+        try:
+            conn.close()
+        except Exception:
+            pass
@@ -0,0 +1,350 @@
+"""DDL and migrations for the `users` table.
+
+Migrations are numbered and recorded in `schema_migrations`, so each one
+runs once per database. They are written to be safe on databases created
+before this module existed: creation steps use `IF NOT EXISTS` and
+alterations look at the live schema first.
+
+    python -m db.schema            # apply pending migrations
+    python -m db.schema --status   # show applied / pending
+
+The app applies pending migrations at startup (`DB_MIGRATE_ON_STARTUP`);
+concurrent runs are serialised by a lock (see `migrate`).
+
+Resulting `users` table: integer auto-increment `user_id` primary key,
+`email` with a unique index (so registration and updates rely on the
+constraint instead of a prior lookup), and `password` holding the bcrypt
+hash.
+"""
+
+import argparse
+import logging
+import sys
+import time
+from contextlib import contextmanager
+from typing import Callable, List, Optional, Sequence, Set, Tuple
+
+import config
+
+logger = logging.getLogger("uvicorn.error")
+
+EMAIL_INDEX = "users_email_unique"
+# MySQL named lock (GET_LOCK) held while migrations run
+MIGRATION_LOCK = "users_schema_migrations"
+
+
+class MigrationError(RuntimeError):
+    """A migration cannot be applied to the data as it stands."""
+
+
+def _backend() -> str:
+    return "sqlite" if config.DB_BACKEND == "sqlite" else "mysql"
+
+
+def _execute(conn, query: str, params: tuple = ()) -> list:
+    cursor = conn.cursor()
+    try:
+        cursor.execute(query, params)
+        return cursor.fetchall() if cursor.description else []
+    finally:
+        cursor.close()
+
+
+# -- migrations ---------------------------------------------------------------
+
+def _create_users(conn) -> None:
+    if _backend() == "sqlite":
+        _execute(conn, """
+            CREATE TABLE IF NOT EXISTS users (
+                user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                email TEXT NOT NULL,
+                password TEXT NOT NULL
+            )
+        """)
+    else:
+        _execute(conn, """
+            CREATE TABLE IF NOT EXISTS users (
+                user_id INT UNSIGNED NOT NULL AUTO_INCREMENT PRIMARY KEY,
+                email VARCHAR(255) NOT NULL,
+                password VARCHAR(255) NOT NULL
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """)
+
+
+def _sqlite_user_id_is_integer_pk(conn) -> bool:
+    for _, name, type_, _, _, pk in _execute(conn, "PRAGMA table_info(users)"):
+        if name == "user_id":
+            return pk == 1 and type_.upper() == "INTEGER"
+    return False
+
+
+# Shown in MigrationError messages; the count says how many there are in all
+_SAMPLE_IDS = 10
+
+
+def _bad_ids_error(problem: str, count: int, sample: list) -> MigrationError:
+    listed = ", ".join(repr(row[0]) for row in sample)
+    if count > len(sample):
+        listed += ", ..."
+    return MigrationError(f"{problem}: {listed}; fix them first")
+
+
+def _check_user_ids(conn, text: str, integer: str, non_numeric: str) -> None:
+    """Abort unless every `user_id` converts to a distinct positive integer.
+
+    Both backends run the same checks, in the backend's SQL for `user_id` as
+    text, as an integer, and "not all digits". A NULL, empty or zero id is
+    rejected rather than renumbered: MySQL's AUTO_INCREMENT would silently
+    give such rows new ids.
+    """
+    empty = f"user_id IS NULL OR {text} = ''"
+    bad = f"NOT ({empty}) AND {non_numeric}"
+    count = _execute(conn, f"SELECT COUNT(*) FROM users WHERE {bad}")[0][0]
+    if count:
+        sample = _execute(conn, f"SELECT user_id FROM users WHERE {bad} LIMIT {_SAMPLE_IDS}")
+        raise _bad_ids_error(f"{count} users have a non-numeric user_id", count, sample)
+    # Only digits are left, so a zero integer value really is a zero id
+    missing = f"{empty} OR {integer} = 0"
+    count = _execute(conn, f"SELECT COUNT(*) FROM users WHERE {missing}")[0][0]
+    if count:
+        sample = _execute(conn, f"SELECT email FROM users WHERE {missing} LIMIT {_SAMPLE_IDS}")
+        raise _bad_ids_error(
+            f"{count} users have a NULL, empty or zero user_id (listed by email)", count, sample,
+        )
+    duplicates = _execute(conn, f"""
+        SELECT {integer} FROM users
+        GROUP BY {integer} HAVING COUNT(*) > 1 LIMIT {_SAMPLE_IDS + 1}
+    """)
+    if duplicates:
+        raise _bad_ids_error(
+            "users share a user_id once it is converted (e.g. '7' and '07')",
+            len(duplicates), duplicates[:_SAMPLE_IDS],
+        )
+
+
+def _integer_primary_key(conn) -> None:
+    """Convert a legacy textual `user_id` to an integer auto-increment key.
+
+    Ids that would not survive the conversion unchanged (non-numeric, NULL,
+    empty or zero ones, or several spellings of one number such as '7' and
+    '07') abort the migration with the offending rows listed, instead of
+    colliding or being silently renumbered.
+    """
+    if _backend() == "sqlite":
+        if _sqlite_user_id_is_integer_pk(conn):
+            return
+        _check_user_ids(
+            conn,
+            text="CAST(user_id AS TEXT)",
+            integer="CAST(user_id AS INTEGER)",
+            non_numeric="CAST(user_id AS TEXT) GLOB '*[^0-9]*'",
+        )
+        # SQLite cannot change a column type in place: rebuild the table
+        _execute(conn, "DROP TABLE IF EXISTS users_migrated")
+        _execute(conn, """
+            CREATE TABLE users_migrated (
+                user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                email TEXT NOT NULL,
+                password TEXT NOT NULL
+            )
+        """)
+        _execute(conn, """
+            INSERT INTO users_migrated (user_id, email, password)
+            SELECT CAST(user_id AS INTEGER), COALESCE(email, ''), COALESCE(password, '')
+            FROM users
+        """)
+        _execute(conn, "DROP TABLE users")
+        _execute(conn, "ALTER TABLE users_migrated RENAME TO users")
+        return
+
+    rows = _execute(conn, """
+        SELECT DATA_TYPE, COLUMN_KEY, EXTRA FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'users' AND COLUMN_NAME = 'user_id'
+    """)
+    if not rows:
+        raise MigrationError("users.user_id column not found")
+    data_type, key, extra = (str(v).lower() for v in rows[0])
+    if data_type in ("int", "bigint") and key == "pri" and "auto_increment" in extra:
+        return
+    _check_user_ids(
+        conn,
+        text="CAST(user_id AS CHAR)",
+        integer="CAST(user_id AS UNSIGNED)",
+        non_numeric="CAST(user_id AS CHAR) NOT REGEXP '^[0-9]+$'",
+    )
+    if key != "pri":
+        _execute(conn, "ALTER TABLE users ADD PRIMARY KEY (user_id)")
+    _execute(conn, "ALTER TABLE users MODIFY user_id INT UNSIGNED NOT NULL AUTO_INCREMENT")
+
+
+def _has_unique_email_index(conn) -> bool:
+    if _backend() == "sqlite":
+        for _, name, unique, *_ in _execute(conn, "PRAGMA index_list(users)"):
+            if unique:
+                columns = [row[2] for row in _execute(conn, f'PRAGMA index_info("{name}")')]
+                if columns == ["email"]:
+                    return True
+        return False
+    rows = _execute(conn, """
+        SELECT INDEX_NAME FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'users' AND NON_UNIQUE = 0
+        GROUP BY INDEX_NAME
+        HAVING COUNT(*) = 1 AND MAX(COLUMN_NAME) = 'email'
+    """)
+    return bool(rows)
+
+
+def _unique_email(conn) -> None:
+    """Add the unique index on `email` once the existing data allows it."""
+    if _has_unique_email_index(conn):
+        return
+    duplicates = _execute(conn, """
+        SELECT email, COUNT(*) FROM users GROUP BY email HAVING COUNT(*) > 1 LIMIT 5
+    """)
+    if duplicates:
+        listed = ", ".join(f"{email!r} x{count}" for email, count in duplicates)
+        raise MigrationError(f"duplicate emails must be resolved before adding the unique index: {listed}")
+    if _backend() == "sqlite":
+        _execute(conn, f"CREATE UNIQUE INDEX {EMAIL_INDEX} ON users (email)")
+    else:
+        # TEXT columns cannot carry a full unique index in MySQL
+        _execute(conn, "ALTER TABLE users MODIFY email VARCHAR(255) NOT NULL")
+        _execute(conn, f"ALTER TABLE users ADD UNIQUE INDEX {EMAIL_INDEX} (email)")
+
+
+MIGRATIONS: Sequence[Tuple[int, str, Callable]] = (
+    (1, "create users table", _create_users),
+    (2, "integer auto-increment user_id primary key", _integer_primary_key),
+    (3, "unique index on users.email", _unique_email),
+)
+
+
+# -- runner -------------------------------------------------------------------
+
+def _ensure_migrations_table(conn) -> None:
+    _execute(conn, """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER NOT NULL PRIMARY KEY,
+            description VARCHAR(255) NOT NULL,
+            applied_at DOUBLE NOT NULL
+        )
+    """)
+    conn.commit()
+
+
+def _applied(conn) -> Set[int]:
+    return {int(row[0]) for row in _execute(conn, "SELECT version FROM schema_migrations")}
+
+
+def applied_versions(conn) -> Set[int]:
+    _ensure_migrations_table(conn)
+    return _applied(conn)
+
+
+def pending_migrations(conn) -> List[Tuple[int, str, Callable]]:
+    done = applied_versions(conn)
+    return [m for m in MIGRATIONS if m[0] not in done]
+
+
+@contextmanager
+def _migration_lock(conn, timeout: float):
+    """Hold MySQL's named migration lock; on SQLite, wait `timeout` for locks.
+
+    SQLite takes its write lock per step (see `migrate`); this only sets how
+    long `BEGIN IMMEDIATE` waits for another process to release it.
+    """
+    if _backend() == "sqlite":
+        (previous,) = _execute(conn, "PRAGMA busy_timeout")[0]
+        _execute(conn, f"PRAGMA busy_timeout = {int(timeout * 1000)}")
+        try:
+            yield
+        finally:
+            _execute(conn, f"PRAGMA busy_timeout = {int(previous)}")
+        return
+    (got,) = _execute(conn, "SELECT GET_LOCK(%s, %s)", (MIGRATION_LOCK, int(timeout)))[0]
+    if got != 1:
+        raise MigrationError(
+            f"another process has held the migration lock for over {timeout:g}s; not migrating"
+        )
+    try:
+        yield
+    finally:
+        _execute(conn, "SELECT RELEASE_LOCK(%s)", (MIGRATION_LOCK,))
+
+
+def migrate(conn, target: Optional[int] = None,
+            lock_timeout: Optional[float] = None) -> List[int]:
+    """Apply pending migrations (up to `target`) in order; return the versions applied.
+
+    Processes starting together (several app workers, or the CLI next to a
+    running app) are serialised, and each version is checked again under
+    the lock, so every migration runs once. On MySQL that is the named lock
+    `MIGRATION_LOCK`, held for the whole run, waiting up to `lock_timeout`
+    seconds (`DB_MIGRATE_LOCK_TIMEOUT`). On SQLite every step runs in a
+    `BEGIN IMMEDIATE` transaction, which holds the database write lock from
+    the version check to the commit of the migration and its
+    `schema_migrations` row. MySQL commits DDL implicitly, which is why
+    every step checks the live schema before changing it and can safely
+    run again.
+    """
+    if lock_timeout is None:
+        lock_timeout = config.DB_MIGRATE_LOCK_TIMEOUT
+    sqlite = _backend() == "sqlite"
+    placeholder = "?" if sqlite else "%s"
+    applied = []
+    _ensure_migrations_table(conn)
+    with _migration_lock(conn, lock_timeout):
+        for version, description, step in MIGRATIONS:
+            if target is not None and version > target:
+                break
+            try:
+                if sqlite:
+                    _execute(conn, "BEGIN IMMEDIATE")
+                if version in _applied(conn):
+                    conn.rollback()
+                    continue
+                logger.info("Applying schema migration %d: %s", version, description)
+                step(conn)
+                _execute(
+                    conn,
+                    f"INSERT INTO schema_migrations (version, description, applied_at) "
+                    f"VALUES ({placeholder}, {placeholder}, {placeholder})",
+                    (version, description, time.time()),
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            applied.append(version)
+    return applied
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m db.schema", description="Apply users table migrations")
+    parser.add_argument("--status", action="store_true", help="list migrations without applying them")
+    parser.add_argument("--target", type=int, default=None, help="stop after this version")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    from db.connect import connect
+
+    conn = connect()
+    try:
+        if args.status:
+            done = applied_versions(conn)
+            for version, description, _ in MIGRATIONS:
+                print(f"{version:>3}  {'applied' if version in done else 'pending':<8} {description}")
+            return 0
+        try:
+            applied = migrate(conn, args.target)
+        except MigrationError as e:
+            print(f"Migration failed: {e}", file=sys.stderr)
+            return 1
+        print(f"Applied {applied}" if applied else "Schema is up to date")
+        return 0
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
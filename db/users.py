@@ -0,0 +1,281 @@
+"""Repository functions for the `users` table.
+
+All functions take an open connection (normally checked out from the pool for
+the duration of one request) so a handler and its auth dependency share a
+single connection instead of opening one each. Functions that write commit
+their own transaction.
+"""
+
+import logging
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+import config
+import metrics
+
+logger = logging.getLogger("uvicorn.error")
+
+
+def sql(query: str) -> str:
+    """Adapt a query written with `%s` placeholders to the configured backend."""
+    if config.DB_BACKEND == "sqlite":
+        return query.replace("%s", "?")
+    return query
+
+
+def _rows_as_dicts(cursor, rows) -> List[Dict[str, Any]]:
+    """Map positional rows to dicts using the cursor description."""
+    columns = [d[0] for d in cursor.description]
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def _fetchone(conn, query: str, params: tuple = ()) -> Optional[Dict[str, Any]]:
+    cursor = conn.cursor()
+    try:
+        cursor.execute(sql(query), params)
+        row = cursor.fetchone()
+        return _rows_as_dicts(cursor, [row])[0] if row is not None else None
+    finally:
+        cursor.close()
+
+
+@metrics.timed("db_query")
+def get_user_by_email(conn, email: str) -> Optional[Dict[str, Any]]:
+    """Return the user row (including the password hash) for `email`."""
+    return _fetchone(
+        conn, "SELECT user_id, email, password FROM users WHERE email = %s", (email,)
+    )
+
+
+@metrics.timed("db_query")
+def get_principal_by_email(conn, email: str) -> Optional[Dict[str, Any]]:
+    """Return only `user_id` and `email` for `email` (no password hash)."""
+    return _fetchone(
+        conn, "SELECT user_id, email FROM users WHERE email = %s", (email,)
+    )
+
+
+@metrics.timed("db_query")
+def get_user_by_id(conn, user_id: int) -> Optional[Dict[str, Any]]:
+    """Return `user_id` and `email` for a user, or None if it does not exist."""
+    return _fetchone(
+        conn, "SELECT user_id, email FROM users WHERE user_id = %s", (user_id,)
+    )
+
+
+# Keyset pagination over the primary key: `user_id > %s ORDER BY user_id`
+# walks the PK index directly, so every page costs the same regardless of how
+# deep into the table it is. Rows with an empty email are not listed.
+VALID_USERS_FILTER = "email IS NOT NULL AND email != ''"
+
+LIST_USERS_PAGE_QUERY = f"""
+    SELECT user_id, email FROM users
+    WHERE user_id > %s AND {VALID_USERS_FILTER}
+    ORDER BY user_id
+    LIMIT %s
+"""
+
+STREAM_USERS_QUERY = f"""
+    SELECT user_id, email FROM users
+    WHERE user_id > %s AND {VALID_USERS_FILTER}
+    ORDER BY user_id
+"""
+
+COUNT_USERS_QUERY = f"SELECT COUNT(*) FROM users WHERE {VALID_USERS_FILTER}"
+
+
+@metrics.timed("db_query")
+def list_users(conn, after: int = 0, limit: int = 100) -> List[Dict[str, Any]]:
+    """Return up to `limit` users with `user_id > after`, ordered by id."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(sql(LIST_USERS_PAGE_QUERY), (after, limit))
+        return _rows_as_dicts(cursor, cursor.fetchall())
+    finally:
+        cursor.close()
+
+
+@metrics.timed("db_query")
+def count_users(conn) -> int:
+    cursor = conn.cursor()
+    try:
+        cursor.execute(COUNT_USERS_QUERY)
+        return int(cursor.fetchone()[0])
+    finally:
+        cursor.close()
+
+
+def iter_users(conn, after: int = 0, limit: Optional[int] = None,
+               batch_size: int = 1000) -> Iterator[Dict[str, Any]]:
+    """Yield users with `user_id > after` without loading them all at once.
+
+    mysql.connector cursors are unbuffered by default, so rows are pulled
+    from the server in `batch_size` chunks as the caller consumes them.
+    """
+    query = STREAM_USERS_QUERY
+    params: tuple = (after,)
+    if limit is not None:
+        query = LIST_USERS_PAGE_QUERY
+        params = (after, limit)
+    cursor = conn.cursor()
+    try:
+        cursor.execute(sql(query), params)
+        columns = [d[0] for d in cursor.description]
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield dict(zip(columns, row))
+    finally:
+        cursor.close()
+
+
+# Email search. Prefix matches are a range scan on the unique email index
+# (`email >= q AND email < q-with-its-last-character-incremented`), which
+# both MySQL and SQLite answer from the B-tree whatever the LIKE settings.
+# Substring matches need a scan and only top up a short prefix result.
+SEARCH_PREFIX_QUERY = f"""
+    SELECT user_id, email FROM users
+    WHERE email >= %s AND email < %s AND {VALID_USERS_FILTER}
+    ORDER BY email
+    LIMIT %s
+"""
+
+SEARCH_SUBSTRING_QUERY = f"""
+    SELECT user_id, email FROM users
+    WHERE email LIKE %s ESCAPE '!' AND NOT (email >= %s AND email < %s) AND {VALID_USERS_FILTER}
+    ORDER BY email
+    LIMIT %s
+"""
+
+
+def prefix_range(prefix: str) -> Tuple[str, str]:
+    """Bounds `(lo, hi)` such that `lo <= s < hi` exactly when `s` starts with `prefix`"""
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def like_contains(text: str) -> str:
+    """A LIKE pattern (escape character `!`) matching values containing `text`"""
+    escaped = text.replace("!", "!!").replace("%", "!%").replace("_", "!_")
+    return f"%{escaped}%"
+
+
+@metrics.timed("db_query")
+def search_users(conn, q: str, limit: int, substring: bool = False) -> List[Dict[str, Any]]:
+    """Users whose email starts with `q`, topped up with ones containing it."""
+    lo, hi = prefix_range(q)
+    cursor = conn.cursor()
+    try:
+        cursor.execute(sql(SEARCH_PREFIX_QUERY), (lo, hi, limit))
+        rows = _rows_as_dicts(cursor, cursor.fetchall())
+        if substring and len(rows) < limit:
+            cursor.execute(sql(SEARCH_SUBSTRING_QUERY), (like_contains(q), lo, hi, limit - len(rows)))
+            rows += _rows_as_dicts(cursor, cursor.fetchall())
+        return rows
+    finally:
+        cursor.close()
+
+
+def _write(conn, query: str, params: tuple) -> Tuple[int, Any]:
+    """Run one write statement in its own transaction; return `(rowcount, lastrowid)`.
+
+    The unique index on `email` (db/schema.py) turns a duplicate into an
+    `IntegrityError` here, after which the transaction is rolled back.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute(sql(query), params)
+        conn.commit()
+        return cursor.rowcount, cursor.lastrowid
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+@metrics.timed("db_query")
+def insert_user(conn, email: str, password_hash: str) -> int:
+    """Insert a user and return its new id (`IntegrityError` if the email is taken)."""
+    _, user_id = _write(
+        conn, "INSERT INTO users (email, password) VALUES (%s, %s)", (email, password_hash)
+    )
+    return user_id
+
+
+# Bound on `IN (...)` lists, well under SQLite's and MySQL's parameter limits
+IN_LIST_CHUNK = 500
+
+
+@metrics.timed("db_query")
+def find_existing_emails(conn, emails: Sequence[str]) -> Set[str]:
+    """Return the subset of `emails` that already belong to a user."""
+    found: Set[str] = set()
+    cursor = conn.cursor()
+    try:
+        for start in range(0, len(emails), IN_LIST_CHUNK):
+            batch = emails[start:start + IN_LIST_CHUNK]
+            placeholders = ", ".join(["%s"] * len(batch))
+            cursor.execute(
+                sql(f"SELECT email FROM users WHERE email IN ({placeholders})"), tuple(batch)
+            )
+            found.update(row[0] for row in cursor.fetchall())
+        return found
+    finally:
+        cursor.close()
+
+
+@metrics.timed("db_query")
+def insert_users(conn, rows: Iterable[Tuple[str, str]]) -> int:
+    """Insert `(email, password_hash)` rows in one transaction; return the count.
+
+    Uses `executemany`, which mysql.connector sends as a multi-row INSERT. On
+    any error the transaction is rolled back and the error re-raised, so the
+    caller can retry the rows one by one.
+    """
+    rows = list(rows)
+    if not rows:
+        return 0
+    cursor = conn.cursor()
+    try:
+        cursor.executemany(sql("INSERT INTO users (email, password) VALUES (%s, %s)"), rows)
+        conn.commit()
+        return len(rows)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+@metrics.timed("db_query")
+def update_user(conn, user_id: int, email: str, password_hash: str) -> bool:
+    """Update a user; False if it does not exist (`IntegrityError` if the email is taken).
+
+    Relies on the affected-row count, so MySQL connections are opened with
+    FOUND_ROWS (db/connect.py) to count matched rather than changed rows.
+    """
+    rowcount, _ = _write(
+        conn,
+        "UPDATE users SET email = %s, password = %s WHERE user_id = %s",
+        (email, password_hash, user_id),
+    )
+    return rowcount > 0
+
+
+@metrics.timed("db_query")
+def delete_user(conn, user_id: int) -> bool:
+    """Delete a user; False if it did not exist."""
+    rowcount, _ = _write(conn, "DELETE FROM users WHERE user_id = %s", (user_id,))
+    return rowcount > 0
+
+
+@metrics.timed("db_query")
+def ping(conn) -> None:
+    """Run a trivial query to prove the connection works."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT 1")
+        cursor.fetchone()
+    finally:
+        cursor.close()
@@ -0,0 +1,137 @@
+"""Startup diagnostics.
+
+    python -m diagnostics importtime [--module main] [--top 25] [--by package]
+                                     [--env LAZY_STARTUP=1] [--budget-ms 800] [--json]
+
+Imports the module in a fresh interpreter under `python -X importtime` and
+reports what the import cost, per module or per top-level package, sorted by
+self time. The interpreter's own start-up imports (`site` and what it pulls
+in) are left out, so the total is the cost of importing the module itself.
+
+With `--budget-ms` the command exits with status 1 when the total exceeds
+the budget, so it can run in CI to catch startup regressions (for example a
+module-level import of pandas on the user-only path).
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+from typing import Dict, List, Optional
+
+_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( *)(\S+)\s*$")
+
+
+def import_times(module: str, env: Optional[Dict[str, str]] = None) -> List[dict]:
+    """Per-module import cost of `import <module>` in a fresh interpreter.
+
+    Returns one entry per imported module, in import order, with its self
+    and cumulative time in milliseconds and its nesting depth.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        env={**os.environ, **(env or {})},
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr.strip()}")
+    entries = []
+    for line in result.stderr.splitlines():
+        match = _LINE.match(line)
+        if match is None:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        entries.append({
+            "module": name,
+            "self_ms": int(self_us) / 1000.0,
+            "cumulative_ms": int(cumulative_us) / 1000.0,
+            "depth": (len(indent) - 1) // 2,
+        })
+    # -X importtime prints children before their parent. Everything up to and
+    # including the top-level `site` entry is interpreter start-up.
+    for index, entry in enumerate(entries):
+        if entry["module"] == "site" and entry["depth"] == 0:
+            return entries[index + 1:]
+    return entries
+
+
+def by_package(entries: List[dict]) -> List[dict]:
+    """Sum self time per top-level package (`fastapi.routing` -> `fastapi`)"""
+    totals: Dict[str, dict] = {}
+    for entry in entries:
+        package = entry["module"].split(".", 1)[0]
+        total = totals.setdefault(package, {"module": package, "self_ms": 0.0, "modules": 0})
+        total["self_ms"] += entry["self_ms"]
+        total["modules"] += 1
+    return list(totals.values())
+
+
+def report(module: str, env: Optional[Dict[str, str]] = None, by: str = "package") -> dict:
+    entries = import_times(module, env)
+    rows = by_package(entries) if by == "package" else entries
+    rows = sorted(rows, key=lambda row: row["self_ms"], reverse=True)
+    return {
+        "module": module,
+        "env": env or {},
+        "total_ms": sum(entry["self_ms"] for entry in entries),
+        "modules": len(entries),
+        "by": by,
+        "rows": rows,
+    }
+
+
+def _print_report(result: dict, top: int) -> None:
+    env = " ".join(f"{key}={value}" for key, value in result["env"].items())
+    print(f"import {result['module']}{' with ' + env if env else ''}: "
+          f"{result['total_ms']:.1f}ms across {result['modules']} modules")
+    print(f"{'self ms':>10}  {'share':>6}  {result['by']}")
+    total = result["total_ms"] or 1.0
+    for row in result["rows"][:top]:
+        count = row.get("modules")
+        suffix = f" ({count} module{'' if count == 1 else 's'})" if count is not None else ""
+        print(f"{row['self_ms']:>10.1f}  {row['self_ms'] / total:>6.1%}  {row['module']}{suffix}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m diagnostics", description="Startup diagnostics")
+    commands = parser.add_subparsers(dest="command", required=True)
+    importtime = commands.add_parser("importtime", help="per-module import cost of the app")
+    importtime.add_argument("--module", default="main", help="module to import (default: main)")
+    importtime.add_argument("--top", type=int, default=25, help="rows to print")
+    importtime.add_argument("--by", choices=("package", "module"), default="package",
+                            help="group self time by top-level package or list every module")
+    importtime.add_argument("--env", action="append", default=[], metavar="NAME=VALUE",
+                            help="extra environment for the import (repeatable)")
+    importtime.add_argument("--budget-ms", type=float, default=None,
+                            help="exit with status 1 when the total exceeds this")
+    importtime.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    env = {}
+    for item in args.env:
+        name, sep, value = item.partition("=")
+        if not sep or not name:
+            parser.error(f"--env expects NAME=VALUE, got {item!r}")
+        env[name] = value
+
+    try:
+        result = report(args.module, env, args.by)
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        return 2
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        _print_report(result, args.top)
+    if args.budget_ms is not None and result["total_ms"] > args.budget_ms:
+        print(f"import-time budget exceeded: {result['total_ms']:.1f}ms > {args.budget_ms:.1f}ms",
+              file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -92,8 +92,17 @@ const api = {
 
   // Protected CRUD endpoints (require authentication)
   getUsers: async (): Promise<UserResponse[]> => {
-    const response = await apiClient.get('/users');
-    return response.data;
+    // /users is keyset-paginated; follow X-Next-Cursor until the last page
+    const users: UserResponse[] = [];
+    let after: string | undefined;
+    do {
+      const response = await apiClient.get('/users', {
+        params: { limit: 1000, ...(after ? { after } : {}) },
+      });
+      users.push(...response.data);
+      after = response.headers['x-next-cursor'];
+    } while (after);
+    return users;
   },
 
   getUser: async (user_id: number): Promise<UserResponse> => {
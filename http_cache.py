@@ -0,0 +1,172 @@
+"""Conditional GET support driven by per-table version counters.
+
+Read endpoints whose body only changes when a table is written (`users`)
+or when the model registry changes (`models`) tag their responses with an
+`ETag` derived from the table's current version and the request's own
+parameters, plus a `Last-Modified` of the table's last write. A client
+revalidating with `If-None-Match` (or `If-Modified-Since`) gets a bodiless
+304 before the handler queries the database or encodes anything.
+
+The write paths call `versions.bump(table)` after they commit. The version
+is read before the query that builds a response, so a write racing with it
+can only make the tag older than the body, which costs the client one
+extra full response later, never a stale 304.
+
+Versions are per process, with a random boot id in every tag so validators
+issued by another worker or a previous run never match. A write handled by
+one worker is not seen by the others, though, so a client revalidating
+there could get a 304 for changed data. That is why the feature is off by
+default: set `HTTP_CACHE_ENABLED=1` only where a single process serves the
+API and every write to `users` goes through it.
+
+304s are counted per table next to the full responses; together with the
+`db_query` stage timings in /metrics they show the load taken off MySQL.
+"""
+
+from email.utils import formatdate, parsedate_to_datetime
+import hashlib
+import threading
+import time
+import uuid
+from typing import Callable, Dict
+
+from fastapi import HTTPException, Request, Response
+
+import config
+
+# Random per process: workers started in the same instant still differ
+_BOOT_ID = uuid.uuid4().hex[:12]
+
+
+class TableVersions:
+    """A version counter and last-write time per table."""
+
+    def __init__(self, tables):
+        started = time.time()
+        self._lock = threading.Lock()
+        self._versions: Dict[str, list] = {table: [0, started] for table in tables}
+        self._stats: Dict[str, list] = {table: [0, 0] for table in tables}  # [full, not_modified]
+
+    def bump(self, table: str) -> None:
+        with self._lock:
+            entry = self._versions[table]
+            entry[0] += 1
+            entry[1] = time.time()
+
+    def get(self, table: str):
+        """`(version, modified_at)` of `table`"""
+        with self._lock:
+            version, modified_at = self._versions[table]
+            return version, modified_at
+
+    def count(self, table: str, not_modified: bool) -> None:
+        with self._lock:
+            self._stats[table][1 if not_modified else 0] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            values = {}
+            for table, (version, _) in self._versions.items():
+                full, not_modified = self._stats[table]
+                values[f"{table}_version"] = version
+                values[f"{table}_full"] = full
+                values[f"{table}_not_modified"] = not_modified
+            return values
+
+
+versions = TableVersions(["users", "models"])
+
+
+def cache_headers(table: str, *parts) -> Dict[str, str]:
+    """Validators for a response built from `table`, varying with `parts`.
+
+    `parts` are whatever else the body depends on (query string, path id,
+    principal), so two different resources never share a tag.
+    """
+    version, modified_at = versions.get(table)
+    digest = hashlib.blake2b(repr(parts).encode("utf-8"), digest_size=6).hexdigest()
+    if config.HTTP_CACHE_MAX_AGE > 0:
+        cache_control = f"private, max-age={config.HTTP_CACHE_MAX_AGE}"
+    else:
+        cache_control = "private, no-cache"
+    headers = {
+        "ETag": f'"{table}-{_BOOT_ID}-{version}-{digest}"',
+        "Cache-Control": cache_control,
+    }
+    # Last-Modified has one-second resolution: only send it once that second
+    # is over, so a later write can never share the timestamp a client holds
+    if int(time.time()) > int(modified_at):
+        headers["Last-Modified"] = formatdate(modified_at, usegmt=True)
+    return headers
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        # Weak comparison, as GET revalidation allows
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def _not_modified_since(header: str, last_modified: str) -> bool:
+    try:
+        since = parsedate_to_datetime(header)
+        modified = parsedate_to_datetime(last_modified)
+    except (TypeError, ValueError):
+        return False
+    return modified <= since
+
+
+def is_fresh(request: Request, table: str, headers: Dict[str, str]) -> bool:
+    """Whether the client's copy (per its validators) matches `headers`.
+
+    Also counts the outcome, so the share of revalidated responses shows in
+    /metrics. With `HTTP_CACHE_ENABLED=0` it is always False.
+    """
+    if not config.HTTP_CACHE_ENABLED:
+        return False
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        fresh = _etag_matches(if_none_match, headers["ETag"])
+    else:
+        if_modified_since = request.headers.get("if-modified-since")
+        last_modified = headers.get("Last-Modified")
+        fresh = (
+            if_modified_since is not None and last_modified is not None
+            and _not_modified_since(if_modified_since, last_modified)
+        )
+    versions.count(table, fresh)
+    return fresh
+
+
+def not_modified_response(headers: Dict[str, str]) -> Response:
+    return Response(status_code=304, headers=headers)
+
+
+def conditional(table: str) -> Callable[[Request], Dict[str, str]]:
+    """Dependency answering 304 when the client's copy of the resource is current.
+
+    Declare it after the auth dependency and before the database one, so the
+    304 is only sent to authenticated callers and never checks out a
+    connection. It returns the validators for the handler to attach with
+    `cacheable`.
+    """
+    def revalidate(request: Request) -> Dict[str, str]:
+        headers = cache_headers(table, request.url.path, request.url.query)
+        if is_fresh(request, table, headers):
+            # Raised rather than returned: FastAPI sends bodiless 304s as is
+            raise HTTPException(status_code=304, headers=headers)
+        return headers
+    return revalidate
+
+
+def cacheable(response: Response, headers: Dict[str, str]) -> Response:
+    """Attach the validators to a full response"""
+    if config.HTTP_CACHE_ENABLED:
+        response.headers.update(headers)
+    return response
@@ -1,53 +1,113 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Query, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from pydantic import BaseModel
-import mysql.connector
-from mysql.connector import Error
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from fastapi.security import HTTPAuthorizationCredentials
+from starlette.concurrency import run_in_threadpool
 import uvicorn
-import jwt
-import bcrypt
-from datetime import datetime, timedelta, timezone
+import logging
+import time
 from typing import Optional, List
 
+import admission
+import config
+import http_cache
+import metrics
+from ai_startup import AILoader
+from auth.passwords import (
+    HasherBusy,
+    get_hasher,
+    hash_password,
+    hash_passwords,
+    shutdown_hasher,
+    verify_password,
+)
+from auth.principals import principal_cache
+from auth.tokens import (
+    security,
+    decode_access_token,
+    credentials_exception,
+    issue_token_response,
+    keyring,
+    principal_from_claims,
+)
+from auth.revocation import revocations
+from db import schema
+from db.connect import connect
+from db.errors import DatabaseError, IntegrityError
+from db.pool import ConnectionPool, PoolTimeout
+from db import users as users_repo
+from pagination import PAGE_HEADERS, STREAM_MEDIA_TYPES, encode_stream, set_page_headers
+from schemas import (
+    UserRegister,
+    UserLogin,
+    Token,
+    TokenData,
+    UserCreate,
+    UserUpdate,
+    UserResponse,
+)
+from serialization import FastJSONResponse
+from uploads import detect_format, spool_request
+from user_import import DUPLICATE_EMAIL, BulkImport
+from user_search import user_index
+
+logger = logging.getLogger("uvicorn.error")
+
 app = FastAPI()
 
-# Include AI router if present
-try:
-    from app import ai_router, init_model
-    app.include_router(ai_router)
-    # call init_model at startup to load any available model
+ai_loader: Optional[AILoader] = None
+
+if config.LAZY_STARTUP:
+    # Import app.py and load the model in the background (see ai_startup.py)
+    ai_loader = AILoader(app)
+    ai_loader.install_placeholders()
+
     @app.on_event("startup")
-    def _init_ai_model():
-        try:
-            init_model()
-        except Exception as e:
-            print(f"AI model init failed: {e}")
-except Exception as e:
-    # Not fatal if app.py/ai isn't present or has import errors, but surface the
-    # exception so it's visible in the server logs (previously it was swallowed).
-    import traceback
-    print("Failed to include ai_router from app.py:", e)
-    traceback.print_exc()
+    def _start_ai_loader():
+        ai_loader.start()
+
+    @app.on_event("shutdown")
+    def _shutdown_ai_model():
+        ai_loader.shutdown()
+
+    metrics.register_stats("ai_startup", "Deferred AI startup", ai_loader.stats)
 else:
-    # Print registered routes (helpful for debugging 404s)
+    # Include AI router if present
     try:
-        print("Registered routes:")
-        for r in app.routes:
-            # route.path exists for Starlette routes
-            path = getattr(r, 'path', None)
-            if path is not None:
-                print(" ", path)
-    except Exception:
-        pass
-
-# Authentication configuration
-SECRET_KEY = "My-secret-key-here-in-development"  
-ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
-
-# Security scheme for JWT token
-security = HTTPBearer()
+        from app import ai_router, init_model, shutdown_model
+        app.include_router(ai_router)
+        # call init_model at startup to load any available model
+        @app.on_event("startup")
+        def _init_ai_model():
+            try:
+                init_model()
+            except Exception as e:
+                logger.exception("AI model init failed: %s", e)
+
+        @app.on_event("shutdown")
+        def _shutdown_ai_model():
+            shutdown_model()
+    except Exception as e:
+        # Not fatal if app.py/ai isn't present or has import errors, but surface the
+        # exception so it's visible in the server logs (previously it was swallowed).
+        logger.exception("Failed to include ai_router from app.py: %s", e)
+
+@app.on_event("startup")
+def _log_routes():
+    """Log registered routes (helpful for debugging 404s, off by default)"""
+    if not config.LOG_ROUTES:
+        return
+    logger.info("Registered routes:")
+    for r in app.routes:
+        # route.path exists for Starlette routes
+        path = getattr(r, 'path', None)
+        if path is not None:
+            logger.info("  %s", path)
+
+# Per-route concurrency limits and per-client rate limits (see admission.py);
+# added first so CORS headers and metrics also cover the requests it sheds
+app.add_middleware(admission.AdmissionMiddleware)
+metrics.register_stats("admission", "Admission control", admission.flat_stats)
 
 # React CORS middleware
 app.add_middleware(
@@ -59,130 +119,170 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Let the React client read the pagination cursor and total count
+    expose_headers=PAGE_HEADERS,
 )
 
-# Authentication Models
-class UserRegister(BaseModel):
-    """Model for user registration"""
-    email: str
-    password: str
-
-class UserLogin(BaseModel):
-    """Model for user login"""
-    email: str
-    password: str
-
-class Token(BaseModel):
-    """Model for JWT token response"""
-    access_token: str
-    token_type: str
-    user_id: int
-    email: str
-
-class TokenData(BaseModel):
-    """Model for token data"""
-    email: Optional[str] = None
-
-# CRUD Models
-class UserCreate(BaseModel):
-    """Model for creating a new user"""
-    email: str
-    password: str  
-
-class UserUpdate(BaseModel):
-    """Model for updating user information"""
-    email: str
-    password: str  
-
-class User(BaseModel):
-    """Model for user data"""
-    user_id: int  
-    email: str
-    password: str
-
-class UserResponse(BaseModel):
-    """Model for user response (without password)"""
-    user_id: int
-    email: str
+# Per-route request count, latency and in-flight metrics (see GET /metrics)
+app.add_middleware(metrics.MetricsMiddleware)
+
+# User CRUD and auth routes for the sync API mode (see config.API_MODE)
+users_router = APIRouter()
 
 
 # Database connection
 def get_db_connection():
-    """Establish connection to MySQL database"""
+    """Establish a new database connection (used by the pool)"""
     try:
-        connection = mysql.connector.connect(
-            host="localhost",
-            user="root",
-            password="",
-            database="fastapidb",
-            charset='utf8mb4',
-            collation='utf8mb4_unicode_ci',
-            autocommit=False
-        )
-        return connection
-    except Error as e:
-        print(f"Database connection error: {e}")
+        return connect()
+    except DatabaseError as e:
+        logger.error("Database connection error: %s", e)
         raise HTTPException(
-            status_code=500, 
+            status_code=500,
             detail=f"Database connection failed: {str(e)}"
         )
 
+_pool: Optional[ConnectionPool] = None
+
+def get_pool() -> ConnectionPool:
+    """Return the process-wide connection pool, creating it on first use"""
+    global _pool
+    if _pool is None:
+        _pool = ConnectionPool(
+            get_db_connection,
+            size=config.DB_POOL_SIZE,
+            max_overflow=config.DB_POOL_MAX_OVERFLOW,
+            timeout=config.DB_POOL_TIMEOUT,
+            recycle=config.DB_POOL_RECYCLE,
+            pre_ping=config.DB_POOL_PRE_PING,
+            ping_interval=config.DB_POOL_PING_INTERVAL,
+        )
+    return _pool
+
+def get_db():
+    """Dependency that checks out one pooled connection per request.
+
+    FastAPI caches dependencies per request, so the handler and
+    `get_current_user` receive the same connection.
+    """
+    started = time.perf_counter()
+    try:
+        with get_pool().connection() as connection:
+            metrics.observe_stage("db_checkout", time.perf_counter() - started)
+            yield connection
+    except PoolTimeout as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Database busy: {str(e)}",
+            headers={"Retry-After": "1"},
+        )
+
+metrics.register_stats("db_pool", "Sync connection pool", lambda: _pool.stats() if _pool is not None else None)
+metrics.register_stats("password_hasher", "Password hashing executor", lambda: get_hasher().stats())
+metrics.register_stats("principal_cache", "Verified principal cache", principal_cache.stats)
+metrics.register_stats("token_revocations", "Revoked access tokens", revocations.stats)
+metrics.register_stats("http_cache", "Conditional GET", http_cache.versions.stats)
+
+@app.on_event("shutdown")
+def _close_db_pool():
+    if _pool is not None:
+        _pool.close()
+
+@app.on_event("startup")
+def _migrate_schema():
+    """Bring the users table up to date (see db/schema.py) before serving"""
+    if not config.DB_MIGRATE_ON_STARTUP:
+        return
+    try:
+        connection = connect()
+    except Exception as e:
+        # Same as before migrations existed: start anyway, /health reports it
+        logger.error("Skipping schema migrations, database unavailable: %s", e)
+        return
+    try:
+        applied = schema.migrate(connection)
+        if applied:
+            logger.info("Applied schema migrations %s", applied)
+    except (schema.MigrationError,) + DatabaseError as e:
+        logger.error("Schema migration failed: %s", e)
+    finally:
+        connection.close()
+
+def _all_users():
+    """Every user, streamed on a dedicated connection (builds the search index)"""
+    connection = connect()
+    try:
+        yield from users_repo.iter_users(connection, batch_size=config.USERS_STREAM_BATCH_SIZE)
+    finally:
+        connection.close()
+
+@app.on_event("startup")
+def _start_user_search_index():
+    """Load the in-process email search index in the background (see user_search.py)"""
+    if config.USER_SEARCH_INDEX:
+        user_index.start(_all_users)
+
+metrics.register_stats(
+    "user_search_index", "User search index",
+    lambda: user_index.stats() if config.USER_SEARCH_INDEX else None,
+)
+
+@app.exception_handler(HasherBusy)
+def _hasher_busy_handler(request: Request, exc: HasherBusy):
+    """Shed load when the bcrypt executor is saturated instead of queueing"""
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Server busy, please retry shortly"},
+        headers={"Retry-After": "1"},
+    )
+
+@app.on_event("shutdown")
+def _shutdown_hasher():
+    shutdown_hasher()
+
 # Authentication helper functions
-def hash_password(password: str) -> str:
-    """Hash a password using bcrypt"""
-    salt = bcrypt.gensalt()
-    hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
-    return hashed.decode('utf-8')
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verify a password against its hash"""
-    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
-
-def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
-    """Create a JWT access token"""
-    to_encode = data.copy()
-    if expires_delta:
-        expire = datetime.now(timezone.utc) + expires_delta
-    else:
-        expire = datetime.now(timezone.utc) + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
-
-def get_user_by_email(email: str):
+def get_user_by_email(connection, email: str):
     """Get user from database by email"""
     try:
-        connection = get_db_connection()
-        cursor = connection.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM users WHERE email = %s", (email,))
-        user = cursor.fetchone()
-        cursor.close()
-        connection.close()
-        return user
-    except Error:
+        return users_repo.get_user_by_email(connection, email)
+    except DatabaseError:
         return None
 
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    """Get current user from JWT token"""
-    token = credentials.credentials
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    
+def _lookup_principal(email: str):
+    """Load a principal on its own pooled connection (tokens without a user id)"""
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
-        token_data = TokenData(email=email)
-    except jwt.PyJWTError:
-        raise credentials_exception
-    
-    user = get_user_by_email(email=token_data.email)
+        with get_pool().connection() as connection:
+            return users_repo.get_principal_by_email(connection, email)
+    except PoolTimeout as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Database busy: {str(e)}",
+            headers={"Retry-After": "1"},
+        )
+    except DatabaseError:
+        return None
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    """Get current user from JWT token.
+
+    Async so the common case (a token carrying the user id) is verified on
+    the event loop without a threadpool hop or a database connection.
+    """
+    payload = decode_access_token(credentials.credentials)
+    user = principal_from_claims(payload)
+    if user is not None:
+        return user
+    token_data = TokenData(email=payload["sub"])
+
+    # Serve repeat requests from the same session without touching MySQL
+    user = principal_cache.get(token_data.email)
+    if user is not None:
+        return user
+
+    user = await run_in_threadpool(_lookup_principal, token_data.email)
     if user is None:
-        raise credentials_exception
+        raise credentials_exception()
+    principal_cache.put(token_data.email, user, payload.get("exp"))
     return user
 
 # Root endpoint
@@ -191,271 +291,366 @@ def read_root():
     """Root endpoint - welcome message"""
     return {"message": "Welcome to FastAPI with MySQL CRUD and Authentication!"}
 
+# Prometheus scrape endpoint
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    """Request, stage and component metrics in the Prometheus text format"""
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 # Health check endpoint
 @app.get("/health")
 def health_check():
     """Health check endpoint to test database connectivity"""
+    pool = get_pool()
     try:
-        connection = get_db_connection()
-        cursor = connection.cursor()
-        cursor.execute("SELECT 1")
-        result = cursor.fetchone()
-        cursor.close()
-        connection.close()
-        
+        with pool.connection() as connection:
+            users_repo.ping(connection)
+
         return {
             "status": "healthy",
             "database": "connected",
-            "message": "All systems operational"
+            "message": "All systems operational",
+            "pool": pool.stats(),
+            "password_hasher": get_hasher().stats(),
+            "principal_cache": principal_cache.stats(),
+            "tokens": {**keyring.stats(), "revocations": revocations.stats()},
+            "ai_startup": ai_loader.stats() if ai_loader is not None else None,
+            "admission": admission.stats(),
+            "user_search_index": user_index.stats() if config.USER_SEARCH_INDEX else None,
         }
     except Exception as e:
         return {
             "status": "unhealthy",
             "database": "disconnected",
-            "error": str(e)
+            "error": str(e),
+            "pool": pool.stats(),
+            "password_hasher": get_hasher().stats(),
+            "principal_cache": principal_cache.stats(),
+            "tokens": {**keyring.stats(), "revocations": revocations.stats()},
+            "ai_startup": ai_loader.stats() if ai_loader is not None else None,
+            "admission": admission.stats(),
+            "user_search_index": user_index.stats() if config.USER_SEARCH_INDEX else None,
         }
 
+def _email_taken() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail=DUPLICATE_EMAIL
+    )
+
 # Authentication reg/login and others
-@app.post("/register", response_model=Token)
-def register_user(user: UserRegister):
+@users_router.post("/register", response_model=Token)
+def register_user(user: UserRegister, connection=Depends(get_db)):
     """Register a new user account"""
     try:
-        # Check if user already exists
-        existing_user = get_user_by_email(user.email)
-        if existing_user:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Email already registered"
-            )
-        
         # Hashing password
         hashed_password = hash_password(user.password)
-        
-        # Create new user in database
-        connection = get_db_connection()
-        cursor = connection.cursor()
-        cursor.execute(
-            "INSERT INTO users (email, password) VALUES (%s, %s)",
-            (user.email, hashed_password)
-        )
-        connection.commit()
-        user_id = cursor.lastrowid
-        cursor.close()
-        connection.close()
-        
+
+        # Create new user in database; the unique index on email rejects
+        # duplicates in the same statement, with no lookup beforehand
+        user_id = users_repo.insert_user(connection, user.email, hashed_password)
+        user_index.put(user_id, user.email)
+        http_cache.versions.bump("users")
+
         # Create new jwt access token
-        access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-        access_token = create_access_token(
-            data={"sub": user.email}, expires_delta=access_token_expires
-        )
-        
-        return {
-            "access_token": access_token,
-            "token_type": "bearer",
-            "user_id": user_id,
-            "email": user.email
-        }
-        
-    except Error as e:
+        return issue_token_response(user_id, user.email)
+
+    except IntegrityError:
+        raise _email_taken()
+    except DatabaseError as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/login", response_model=Token)
-def login_user(user: UserLogin):
+@users_router.post("/login", response_model=Token)
+def login_user(user: UserLogin, connection=Depends(get_db)):
     """Login user and return JWT"""
     try:
         # Get user from db
-        db_user = get_user_by_email(user.email)
+        db_user = get_user_by_email(connection, user.email)
         if not db_user:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid email or password"
             )
-        
+
         # Verify password
         if not verify_password(user.password, db_user["password"]):
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid email or password"
             )
-        
+
         # Create access token
-        access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-        access_token = create_access_token(
-            data={"sub": user.email}, expires_delta=access_token_expires
-        )
-        
-        return {
-            "access_token": access_token,
-            "token_type": "bearer",
-            "user_id": db_user["user_id"],
-            "email": db_user["email"]
-        }
-        
+        return issue_token_response(db_user["user_id"], db_user["email"])
+
     except HTTPException:
         raise
-    except Error as e:
+    except DatabaseError as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/me", response_model=UserResponse)
-def get_current_user_info(current_user: dict = Depends(get_current_user)):
+@users_router.get("/me", response_model=UserResponse)
+def get_current_user_info(request: Request, response: Response, current_user: dict = Depends(get_current_user)):
     """Get current user information"""
+    cache = http_cache.cache_headers("users", "me", current_user["user_id"], current_user["email"])
+    if http_cache.is_fresh(request, "users", cache):
+        return http_cache.not_modified_response(cache)
+    http_cache.cacheable(response, cache)
     return {
         "user_id": current_user["user_id"],
         "email": current_user["email"]
-    }    
+    }
+
+# Protected CRUD endpoints
+def _stream_users(fmt: str, after: int, limit: Optional[int], total: Optional[int]):
+    """Stream users from a server-side cursor on a dedicated pooled connection"""
+    pool = get_pool()
+
+    def rows():
+        # The connection is checked out once the body starts streaming, so it
+        # is always returned even if the client never reads the response.
+        connection = pool.acquire()
+        finished = False
+        try:
+            for row in users_repo.iter_users(
+                connection, after, limit, batch_size=config.USERS_STREAM_BATCH_SIZE
+            ):
+                yield {"user_id": int(row["user_id"]), "email": str(row["email"])}
+            finished = True
+        finally:
+            # A half-read server-side cursor would poison the connection for
+            # the next borrower, so abandoned streams close it instead.
+            pool.release(connection, discard=not finished)
+
+    headers = {"X-Total-Count": str(total)} if total is not None else None
+    return StreamingResponse(
+        encode_stream(rows(), fmt), media_type=STREAM_MEDIA_TYPES[fmt], headers=headers
+    )
 
-# Protected CRUD endpoints 
-@app.get("/users", response_model=List[UserResponse])
-def get_users(current_user: dict = Depends(get_current_user)):
-    """Get all users (protected endpoint)"""
+@users_router.get("/users", response_model=List[UserResponse])
+def get_users(
+    request: Request,
+    after: int = Query(0, ge=0, description="Keyset cursor: only return users with a larger user_id"),
+    limit: Optional[int] = Query(None, ge=1, le=config.USERS_PAGE_MAX_LIMIT),
+    include_total: bool = False,
+    stream: Optional[str] = Query(None, pattern="^(ndjson|json|csv)$"),
+    current_user: dict = Depends(get_current_user),
+    cache: dict = Depends(http_cache.conditional("users")),
+    connection=Depends(get_db),
+):
+    """Get users one keyset page at a time, or stream them (protected endpoint)"""
     try:
-        connection = get_db_connection()
-        cursor = connection.cursor(dictionary=True)
-        # Query to get valid users only, filtering out empty or invalid user_ids
-        cursor.execute("""
-            SELECT user_id, email FROM users 
-            WHERE user_id IS NOT NULL 
-            AND user_id != '' 
-            AND user_id != '0'
-            AND email IS NOT NULL 
-            AND email != ''
-            ORDER BY CAST(user_id AS UNSIGNED)
-        """)
-        rows = cursor.fetchall()
-        cursor.close()
-        connection.close()
-        
-        # Convert to proper response format, filtering out invalid entries
-        users = []
-        for row in rows:
-            try:
-                # Skip rows with empty or invalid user_id
-                if row['user_id'] is None or row['user_id'] == '' or row['user_id'] == 0:
-                    continue
-                    
-                user_id = int(row['user_id'])
-                email = str(row['email'])
-                
-                # Skip if email is empty
-                if not email or email.strip() == '':
-                    continue
-                    
-                users.append({
-                    'user_id': user_id,
-                    'email': email
-                })
-            except (ValueError, TypeError) as e:
-                # Skip invalid entries and log them
-                print(f"Skipping invalid user entry: {row}, Error: {e}")
-                continue
-        
-        return users
-    except Error as e:
-        print(f"Database error in get_users: {e}")
+        total = users_repo.count_users(connection) if include_total else None
+        if stream:
+            return _stream_users(stream, after, limit, total)
+
+        limit = limit or config.USERS_PAGE_DEFAULT_LIMIT
+        rows = users_repo.list_users(connection, after, limit)
+
+        # The query guarantees the UserResponse shape (integer key, non-empty
+        # email), so rows are encoded as they come instead of re-validated
+        page = FastJSONResponse(rows)
+        set_page_headers(page, request, rows, limit, total)
+        http_cache.cacheable(page, cache)
+        return page
+    except DatabaseError as e:
+        logger.error("Database error in get_users: %s", e)
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
     except Exception as e:
-        print(f"Server error in get_users: {e}")
+        logger.exception("Server error in get_users: %s", e)
         raise HTTPException(status_code=500, detail=f"Server error: {str(e)}")
 
-@app.get("/users/{user_id}", response_model=UserResponse)
-def get_user(user_id: int, current_user: dict = Depends(get_current_user)):
+def _search_database(q: str, limit: int) -> List[dict]:
+    substring = 0 < config.USERS_SEARCH_SUBSTRING_MIN <= len(q)
+    try:
+        with get_pool().connection() as connection:
+            return users_repo.search_users(connection, q, limit, substring)
+    except PoolTimeout as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Database busy: {str(e)}",
+            headers={"Retry-After": "1"},
+        )
+
+@users_router.get("/users/search", response_model=List[UserResponse])
+async def search_users(
+    q: str = Query(..., min_length=1, max_length=255, description="Email prefix, or the start of a word in the email"),
+    limit: int = Query(config.USERS_SEARCH_DEFAULT_LIMIT, ge=1, le=config.USERS_SEARCH_MAX_LIMIT),
+    current_user: dict = Depends(get_current_user),
+):
+    """Find users by email, best matches first (protected endpoint).
+
+    Served from the in-process index when it is enabled and loaded, on the
+    event loop; otherwise from the database on the threadpool.
+    """
+    rows = user_index.search(q, limit) if config.USER_SEARCH_INDEX else None
+    if rows is None:
+        try:
+            rows = await run_in_threadpool(_search_database, q, limit)
+        except DatabaseError as e:
+            logger.error("Database error in search_users: %s", e)
+            raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+    return FastJSONResponse(rows)
+
+@users_router.get("/users/export")
+def export_users(
+    format: str = Query("ndjson", pattern="^(ndjson|json|csv)$"),
+    after: int = Query(0, ge=0),
+    current_user: dict = Depends(get_current_user),
+):
+    """Stream every user as NDJSON, a JSON array or CSV (protected endpoint)"""
+    response = _stream_users(format, after, None, None)
+    response.headers["Content-Disposition"] = f'attachment; filename="users.{format}"'
+    return response
+
+def _bulk_import(connection, fh, fmt: str, chunk_size: int) -> dict:
+    """Import users from a spooled upload, one chunked transaction at a time"""
+    job = BulkImport()
+    try:
+        for chunk in job.chunks(fh, fmt, chunk_size):
+            try:
+                existing = users_repo.find_existing_emails(connection, [email for _, email, _ in chunk])
+                chunk = job.drop_existing(chunk, existing)
+                if not chunk:
+                    continue
+                hashes = hash_passwords([password for _, _, password in chunk])
+                rows = [(email, hashed) for (_, email, _), hashed in zip(chunk, hashes)]
+                try:
+                    job.created += users_repo.insert_users(connection, rows)
+                except IntegrityError:
+                    # Another request registered one of the emails meanwhile:
+                    # retry the chunk row by row so only that row fails
+                    for (index, email, _), row in zip(chunk, rows):
+                        try:
+                            users_repo.insert_user(connection, *row)
+                            job.created += 1
+                        except IntegrityError:
+                            job.fail(index, email, DUPLICATE_EMAIL)
+            except DatabaseError as e:
+                logger.error("Database error in bulk import: %s", e)
+                job.abort(chunk, f"Database error: {str(e)}")
+                break
+    finally:
+        fh.close()
+    return job.report()
+
+@users_router.post("/users/bulk")
+async def bulk_import_users(
+    request: Request,
+    chunk_size: int = Query(config.USERS_BULK_CHUNK_SIZE, ge=1, le=10_000),
+    current_user: dict = Depends(get_current_user),
+    connection=Depends(get_db),
+):
+    """Create many users from a JSON array, NDJSON or CSV upload (protected endpoint).
+
+    Each record needs `email` and `password`. Rows that fail (invalid record,
+    email already registered or repeated in the upload) are listed in
+    `errors` and do not stop the import.
+    """
+    fmt = detect_format(request.headers.get("content-type"))
+    if fmt is None:
+        raise HTTPException(
+            status_code=415,
+            detail="Send application/json, application/x-ndjson or text/csv",
+        )
+    spool = await spool_request(request, config.USERS_BULK_SPOOL_BYTES)
+    report = await run_in_threadpool(_bulk_import, connection, spool, fmt, chunk_size)
+    if report["created"]:
+        # New ids are not known row by row: rebuild the search index instead
+        user_index.invalidate()
+        http_cache.versions.bump("users")
+    return report
+
+@users_router.get("/users/{user_id}", response_model=UserResponse)
+def get_user(
+    user_id: int,
+    response: Response,
+    current_user: dict = Depends(get_current_user),
+    cache: dict = Depends(http_cache.conditional("users")),
+    connection=Depends(get_db),
+):
     """Get a specific user by ID (protected endpoint)"""
     try:
-        connection = get_db_connection()
-        cursor = connection.cursor(dictionary=True)
-        cursor.execute("SELECT user_id, email FROM users WHERE user_id = %s", (user_id,))
-        user = cursor.fetchone()
-        cursor.close()
-        connection.close()
-        
+        user = users_repo.get_user_by_id(connection, user_id)
+
         if user is None:
             raise HTTPException(status_code=404, detail="User not found")
-        
+
+        http_cache.cacheable(response, cache)
         return {
             'user_id': int(user['user_id']),
             'email': str(user['email'])
         }
-            
-    except Error as e:
-        print(f"Database error in get_user: {e}")
+
+    except DatabaseError as e:
+        logger.error("Database error in get_user: %s", e)
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
     except Exception as e:
-        print(f"Server error in get_user: {e}")
+        logger.exception("Server error in get_user: %s", e)
         raise HTTPException(status_code=500, detail=f"Server error: {str(e)}")
 
-@app.post("/users", response_model=UserResponse)
-def create_user(user: UserCreate, current_user: dict = Depends(get_current_user)):
+@users_router.post("/users", response_model=UserResponse)
+def create_user(user: UserCreate, current_user: dict = Depends(get_current_user), connection=Depends(get_db)):
     """Create a new user (protected endpoint)"""
     try:
         # Hash the password before storing
         hashed_password = hash_password(user.password)
-        
-        connection = get_db_connection()
-        cursor = connection.cursor()
-        cursor.execute(
-            "INSERT INTO users (email, password) VALUES (%s, %s)",
-            (user.email, hashed_password)
-        )
-        connection.commit()
-        user_id = cursor.lastrowid 
-        cursor.close()
-        connection.close()
-        
+
+        user_id = users_repo.insert_user(connection, user.email, hashed_password)
+        user_index.put(user_id, user.email)
+        http_cache.versions.bump("users")
+
         return {"user_id": user_id, "email": user.email}  # Don't return password
-    except Error as e:
+    except IntegrityError:
+        raise _email_taken()
+    except DatabaseError as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.put("/users/{user_id}", response_model=UserResponse)
-def update_user(user_id: int, user: UserUpdate, current_user: dict = Depends(get_current_user)):
+@users_router.put("/users/{user_id}", response_model=UserResponse)
+def update_user(user_id: int, user: UserUpdate, current_user: dict = Depends(get_current_user), connection=Depends(get_db)):
     """Update an existing user (protected endpoint)"""
     try:
-        connection = get_db_connection()
-        cursor = connection.cursor()
-        
-        cursor.execute("SELECT user_id FROM users WHERE user_id = %s", (user_id,))
-        if cursor.fetchone() is None:
-            cursor.close()
-            connection.close()
-            raise HTTPException(status_code=404, detail="User not found")
-        
         # Hash the password before updating
         hashed_password = hash_password(user.password)
-        
-        cursor.execute(
-            "UPDATE users SET email = %s, password = %s WHERE user_id = %s",
-            (user.email, hashed_password, user_id)
-        )
-        connection.commit()
-        cursor.close()
-        connection.close()
-        
+
+        # One UPDATE: the affected-row count tells whether the user exists
+        if not users_repo.update_user(connection, user_id, user.email, hashed_password):
+            raise HTTPException(status_code=404, detail="User not found")
+        user_index.put(user_id, user.email)
+        http_cache.versions.bump("users")
+        principal_cache.invalidate_user(user_id)
+        revocations.revoke_user(user_id)
+
         return {"user_id": user_id, "email": user.email}  # Don't return password
-    except Error as e:
+    except IntegrityError:
+        raise _email_taken()
+    except DatabaseError as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.delete("/users/{user_id}")
-def delete_user(user_id: int, current_user: dict = Depends(get_current_user)):
+@users_router.delete("/users/{user_id}")
+def delete_user(user_id: int, current_user: dict = Depends(get_current_user), connection=Depends(get_db)):
     """Delete a user (protected endpoint)"""
     try:
-        connection = get_db_connection()
-        cursor = connection.cursor()
-        
-        cursor.execute("SELECT user_id FROM users WHERE user_id = %s", (user_id,))
-        if cursor.fetchone() is None:
-            cursor.close()
-            connection.close()
+        if not users_repo.delete_user(connection, user_id):
             raise HTTPException(status_code=404, detail="User not found")
-        
-        cursor.execute("DELETE FROM users WHERE user_id = %s", (user_id,))
-        connection.commit()
-        cursor.close()
-        connection.close()
-        
+        user_index.remove(user_id)
+        http_cache.versions.bump("users")
+        principal_cache.invalidate_user(user_id)
+        revocations.revoke_user(user_id)
+
         return {"message": "User deleted successfully"}
-    except Error as e:
+    except DatabaseError as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# Serve the user routes from the sync handlers above or from their asyncio
+# counterparts in async_api.py, depending on the configured mode.
+if config.API_MODE == "async":
+    from async_api import async_router, close_async_pool
+    app.include_router(async_router)
+    app.on_event("shutdown")(close_async_pool)
+else:
+    app.include_router(users_router)
+
+
 # Start the application
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,336 @@
+"""In-process metrics with a Prometheus text exposition.
+
+Everything is kept in plain counters and fixed-bucket histograms guarded by
+short per-series locks, so recording costs a dict lookup, a `bisect` and a
+few additions. `render()` produces the text format Prometheus scrapes from
+`GET /metrics`.
+
+What is recorded:
+
+* `http_requests_total`, `http_request_duration_seconds` per method, route
+  template (e.g. `/users/{user_id}`) and status, plus `http_requests_in_flight`,
+  by `MetricsMiddleware`.
+* `stage_duration_seconds` per internal stage (`db_checkout`, `db_query`,
+  `bcrypt`, `jwt`, `features`, `inference`) and operation, through the
+  `timed` decorator and the `stage` context manager.
+* Gauges read from the existing `stats()` methods (connection pool, password
+  hasher, caches, batcher) at scrape time, registered with `register_stats`.
+
+Set `METRICS_ENABLED=0` to turn recording off entirely.
+"""
+
+import asyncio
+from bisect import bisect_left
+import functools
+import math
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import config
+
+# Seconds; spans a cached JWT check (~µs) up to a slow bcrypt or bulk request
+DEFAULT_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values: str):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+
+class _Value:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def _samples(self):
+        for values, child in list(self._children.items()):
+            yield f"{self.name}{_labels(self.labelnames, values)} {_format(child.value)}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.labels().dec(amount)
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+
+_INF_LE = 'le="+Inf"'
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "_lock")
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def _samples(self):
+        for values, child in list(self._children.items()):
+            with child._lock:
+                counts = list(child.counts)
+                total = child.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = 'le="' + _format(bound) + '"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, values, le)} {cumulative}"
+            cumulative += counts[-1]
+            yield f"{self.name}_bucket{_labels(self.labelnames, values, _INF_LE)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, values)} {_format(total)}"
+            yield f"{self.name}_count{_labels(self.labelnames, values)} {cumulative}"
+
+
+# -- registry ---------------------------------------------------------------
+
+_metrics: List[_Metric] = []
+_stats_sources: List[Tuple[str, str, Callable[[], Optional[dict]]]] = []
+
+
+def _register(metric: _Metric) -> _Metric:
+    _metrics.append(metric)
+    return metric
+
+
+def register_stats(prefix: str, help: str, stats: Callable[[], Optional[dict]]) -> None:
+    """Export the numeric values of `stats()` as `<prefix>_<key>` gauges at scrape time.
+
+    `stats` may return None (e.g. the component has not been created yet).
+    """
+    _stats_sources.append((prefix, help, stats))
+
+
+def _stats_lines() -> List[str]:
+    lines = []
+    for prefix, help, stats in _stats_sources:
+        try:
+            values = stats()
+        except Exception:
+            continue
+        if not values:
+            continue
+        for key, value in values.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            name = f"{prefix}_{key}"
+            lines.append(f"# HELP {name} {help}: {key}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {_format(value)}")
+    return lines
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format (0.0.4)."""
+    lines: List[str] = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    lines.extend(_stats_lines())
+    return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+HTTP_REQUESTS = _register(Counter(
+    "http_requests_total", "HTTP requests by route template and status",
+    ("method", "route", "status"),
+))
+HTTP_LATENCY = _register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency, until the response body is sent",
+    ("method", "route"),
+))
+HTTP_IN_FLIGHT = _register(Gauge("http_requests_in_flight", "HTTP requests being handled"))
+STAGE_LATENCY = _register(Histogram(
+    "stage_duration_seconds", "Time spent in internal request stages",
+    ("stage", "op"),
+))
+
+
+# -- recording helpers ------------------------------------------------------
+
+class stage:
+    """Context manager timing one stage: `with metrics.stage("features"): ...`"""
+
+    __slots__ = ("child", "started")
+
+    def __init__(self, name: str, op: str = ""):
+        self.child = STAGE_LATENCY.labels(name, op) if config.METRICS_ENABLED else None
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.child is not None:
+            self.child.observe(time.perf_counter() - self.started)
+        return False
+
+
+def observe_stage(name: str, seconds: float, op: str = "") -> None:
+    if config.METRICS_ENABLED:
+        STAGE_LATENCY.labels(name, op).observe(seconds)
+
+
+def timed(stage_name: str):
+    """Decorator timing every call as `stage_name`, with the function name as op.
+
+    Works for plain and `async def` functions. Returns the function unchanged
+    when metrics are disabled.
+    """
+    def decorate(fn):
+        if not config.METRICS_ENABLED:
+            return fn
+        child = STAGE_LATENCY.labels(stage_name, fn.__name__)
+
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    child.observe(time.perf_counter() - started)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                child.observe(time.perf_counter() - started)
+        return wrapper
+
+    return decorate
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording per-route request counts, latency and in-flight.
+
+    Routes are labelled by their template (FastAPI stores the matched route
+    in the scope), so `/users/1` and `/users/2` share a series; requests that
+    match no route are grouped under `<unmatched>`.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not config.METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            route = getattr(scope.get("route"), "path", None) or "<unmatched>"
+            method = scope.get("method", "")
+            HTTP_REQUESTS.labels(method, route, str(status_code)).inc()
+            HTTP_LATENCY.labels(method, route).observe(time.perf_counter() - started)
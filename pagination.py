@@ -0,0 +1,114 @@
+"""Helpers for keyset-paginated and streamed list responses.
+
+Paged responses keep their JSON body unchanged (a plain list) and describe
+the next page in headers: `X-Next-Cursor` carries the last id of the page and
+`Link: <...>; rel="next"` the ready-made URL. `X-Total-Count` is set when the
+client asked for the total.
+
+Streamed responses are encoded incrementally as NDJSON, a JSON array or CSV
+(header taken from the first row's keys), batching many rows into each chunk
+so the per-write overhead stays small.
+"""
+
+import csv
+import io
+from typing import Any, AsyncIterable, AsyncIterator, Dict, Iterable, Iterator, List, Optional
+
+from fastapi import Request, Response
+
+from serialization import dumps, dumps_line
+
+PAGE_HEADERS = ["X-Next-Cursor", "X-Total-Count", "Link"]
+
+STREAM_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "json": "application/json",
+    "csv": "text/csv",
+}
+
+_CHUNK_BYTES = 64 * 1024
+
+
+def set_page_headers(response: Response, request: Request, rows: List[Dict[str, Any]],
+                     limit: int, total: Optional[int] = None, key: str = "user_id") -> None:
+    """Describe the next page of a keyset-paginated response in its headers"""
+    if total is not None:
+        response.headers["X-Total-Count"] = str(total)
+    if rows and len(rows) >= limit:
+        cursor = rows[-1][key]
+        response.headers["X-Next-Cursor"] = str(cursor)
+        next_url = request.url.include_query_params(after=cursor, limit=limit)
+        response.headers["Link"] = f'<{next_url}>; rel="next"'
+
+
+class _Encoder:
+    """Accumulates encoded rows and hands out chunks of roughly _CHUNK_BYTES."""
+
+    def __init__(self, fmt: str):
+        self.fmt = fmt
+        self.parts: List[bytes] = [b"["] if fmt == "json" else []
+        self.size = 0
+        self.first = True
+        if fmt == "csv":
+            self._csv_buffer = io.StringIO()
+            self._csv_writer = csv.writer(self._csv_buffer, lineterminator="\n")
+
+    def _csv(self, row: Dict[str, Any]) -> bytes:
+        if self.first:
+            self._csv_writer.writerow(row.keys())
+        self._csv_writer.writerow(row.values())
+        text = self._csv_buffer.getvalue()
+        self._csv_buffer.seek(0)
+        self._csv_buffer.truncate()
+        return text.encode("utf-8")
+
+    def add(self, row: Dict[str, Any]) -> Optional[bytes]:
+        if self.fmt == "csv":
+            data = self._csv(row)
+        elif self.fmt == "json":
+            data = dumps(row)
+            if not self.first:
+                data = b"," + data
+        else:
+            data = dumps_line(row)
+        self.first = False
+        self.parts.append(data)
+        self.size += len(data)
+        if self.size >= _CHUNK_BYTES:
+            return self.flush()
+        return None
+
+    def flush(self) -> bytes:
+        chunk = b"".join(self.parts)
+        self.parts = []
+        self.size = 0
+        return chunk
+
+    def finish(self) -> bytes:
+        if self.fmt == "json":
+            self.parts.append(b"]")
+        return self.flush()
+
+
+def encode_stream(rows: Iterable[Dict[str, Any]], fmt: str) -> Iterator[bytes]:
+    """Encode `rows` as NDJSON (`fmt="ndjson"`), a JSON array (`fmt="json"`) or CSV"""
+    encoder = _Encoder(fmt)
+    for row in rows:
+        chunk = encoder.add(row)
+        if chunk:
+            yield chunk
+    tail = encoder.finish()
+    if tail:
+        yield tail
+
+
+async def aencode_stream(rows: AsyncIterable[Dict[str, Any]], fmt: str) -> AsyncIterator[bytes]:
+    """Async counterpart of `encode_stream`"""
+    encoder = _Encoder(fmt)
+    async for row in rows:
+        chunk = encoder.add(row)
+        if chunk:
+            yield chunk
+    tail = encoder.finish()
+    if tail:
+        yield tail
@@ -0,0 +1,59 @@
+"""Pydantic request and response models shared by the sync and async routes."""
+
+from typing import Annotated, Optional
+
+from pydantic import AfterValidator, BaseModel
+
+
+def normalize_email(email: str) -> str:
+    """The normalisation every route applies to client-supplied emails"""
+    return email.strip()
+
+
+# An email as sent by a client: normalised the same way on every route
+# (register, login, create, update, bulk import)
+Email = Annotated[str, AfterValidator(normalize_email)]
+
+# Authentication Models
+class UserRegister(BaseModel):
+    """Model for user registration"""
+    email: Email
+    password: str
+
+class UserLogin(BaseModel):
+    """Model for user login"""
+    email: Email
+    password: str
+
+class Token(BaseModel):
+    """Model for JWT token response"""
+    access_token: str
+    token_type: str
+    user_id: int
+    email: str
+
+class TokenData(BaseModel):
+    """Model for token data"""
+    email: Optional[str] = None
+
+# CRUD Models
+class UserCreate(BaseModel):
+    """Model for creating a new user"""
+    email: Email
+    password: str  
+
+class UserUpdate(BaseModel):
+    """Model for updating user information"""
+    email: Email
+    password: str  
+
+class User(BaseModel):
+    """Model for user data"""
+    user_id: int  
+    email: str
+    password: str
+
+class UserResponse(BaseModel):
+    """Model for user response (without password)"""
+    user_id: int
+    email: str
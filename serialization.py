@@ -0,0 +1,59 @@
+"""Fast JSON encoding for hot responses.
+
+`dumps` uses orjson when it is installed (and `FAST_JSON` is on), which
+encodes dicts, lists and NumPy arrays directly in native code. Otherwise it
+falls back to the standard library, converting NumPy values on the way, so
+callers can hand it model output either way.
+
+`FastJSONResponse` is returned directly from handlers whose output shape is
+already guaranteed (rows straight from a known query, model results built
+in app.py). That skips FastAPI's `jsonable_encoder` walk and response-model
+validation, which dominate the cost of large list responses.
+"""
+
+import json
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+import config
+
+try:
+    import orjson
+except ImportError:  # optional: the standard library encoder is used instead
+    orjson = None
+
+_ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY if orjson is not None else 0
+
+FAST = orjson is not None and config.FAST_JSON
+
+
+def _default(obj: Any) -> Any:
+    # NumPy is only imported by the AI routes; user-only workers never load it
+    import numpy as np
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj: Any) -> bytes:
+    """Compact JSON as UTF-8 bytes; NumPy arrays and scalars are allowed."""
+    if FAST:
+        return orjson.dumps(obj, option=_ORJSON_OPTIONS)
+    return json.dumps(obj, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+def dumps_line(obj: Any) -> bytes:
+    """`dumps` plus a trailing newline (one NDJSON record)."""
+    if FAST:
+        return orjson.dumps(obj, option=_ORJSON_OPTIONS | orjson.OPT_APPEND_NEWLINE)
+    return dumps(obj) + b"\n"
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with `dumps`, bypassing response-model validation."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
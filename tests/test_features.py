@@ -0,0 +1,154 @@
+"""Parity of the shared feature stage with the original per-row logic.
+
+`reference_row` follows the per-row feature logic of the original `/predict`
+handler, plus the `city_tier` column added for bulk scoring (the bundled
+model reads it). It is kept here as a fixed copy so later changes to the
+module are checked against it rather than against themselves.
+"""
+
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from ai.features import (
+    INPUT_FIELDS,
+    TIER_1_CITIES,
+    TIER_2_CITIES,
+    engineer_columns,
+    engineer_records,
+    engineer_row,
+    to_model_input,
+)
+
+
+def reference_city_tier(city):
+    if city in TIER_1_CITIES:
+        return 1
+    if city in TIER_2_CITIES:
+        return 2
+    return 3
+
+
+def reference_row(age, weight, height, income_lpa, smoker, city, occupation):
+    bmi = weight / (height ** 2) if height > 0 else 0.0
+    lifestyle_risk = "low"
+    if smoker and bmi > 30:
+        lifestyle_risk = "high"
+    elif smoker or bmi > 27:
+        lifestyle_risk = "medium"
+
+    age_group = "senior"
+    if age < 25:
+        age_group = "adult"
+    elif age < 60:
+        age_group = "middle_aged"
+
+    return {
+        "bmi": bmi,
+        "age_group": age_group,
+        "lifestyle_risk": lifestyle_risk,
+        "income_lpa": income_lpa,
+        "city": city or "",
+        "city_tier": reference_city_tier(city),
+        "occupation": occupation or "",
+    }
+
+
+CITIES = [None, "", "Mumbai", "Jaipur", "Noida", "Springfield", "mumbai", " Pune"]
+OCCUPATIONS = [None, "", "private_job", "retired", "student"]
+
+# Every branch boundary: ages around 25 and 60, BMI exactly at and just over
+# 27 and 30 (height 1.0 keeps them exact), and a zero height
+BOUNDARY_ROWS = [
+    (age, weight, height, 10.0, smoker, city, "private_job")
+    for age in (1, 24, 25, 26, 59, 60, 61, 120)
+    for weight, height in ((27.0, 1.0), (27.000001, 1.0), (30.0, 1.0), (30.000001, 1.0), (70.0, 0.0))
+    for smoker in (False, True)
+    for city in CITIES
+]
+
+
+def random_rows(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return [
+        (
+            int(rng.integers(1, 100)),
+            float(rng.uniform(30, 150)),
+            float(rng.uniform(1.2, 2.1)),
+            float(rng.uniform(0.5, 50)),
+            bool(rng.integers(0, 2)),
+            CITIES[rng.integers(0, len(CITIES))],
+            OCCUPATIONS[rng.integers(0, len(OCCUPATIONS))],
+        )
+        for _ in range(n)
+    ]
+
+
+def assert_same(expected, actual):
+    assert set(actual) == set(expected)
+    for name, value in expected.items():
+        if isinstance(value, float):
+            assert actual[name] == pytest.approx(value), name
+        else:
+            assert actual[name] == value, name
+
+
+@pytest.mark.parametrize("rows", [BOUNDARY_ROWS, random_rows(2000)], ids=["boundaries", "random"])
+def test_columns_match_reference(rows):
+    got = engineer_columns(*zip(*rows))
+    for i, row in enumerate(rows):
+        assert_same(reference_row(*row), {name: column[i] for name, column in got.items()})
+
+
+@pytest.mark.parametrize("row", BOUNDARY_ROWS[:40] + random_rows(50, seed=1))
+def test_row_matches_reference(row):
+    assert_same(reference_row(*row), engineer_row(*row))
+
+
+def test_records_with_missing_optional_fields():
+    records = [
+        {"age": 30, "weight": 70.0, "height": 1.75, "income_lpa": 8.0, "smoker": False},
+        {"age": 70, "weight": 95.0, "height": 1.6, "income_lpa": 3.0, "smoker": True, "city": None},
+        {"age": 20, "weight": 60.0, "height": 1.8, "income_lpa": 1.0, "smoker": True,
+         "city": "Delhi", "occupation": "student"},
+    ]
+    got = engineer_records(records)
+    for i, record in enumerate(records):
+        expected = reference_row(*(record.get(name) for name in INPUT_FIELDS))
+        assert_same(expected, {name: column[i] for name, column in got.items()})
+    assert list(got["city"]) == ["", "", "Delhi"]
+    assert list(got["occupation"]) == ["", "", "student"]
+    assert list(got["city_tier"]) == [3, 3, 1]
+
+
+def test_unknown_and_miscased_cities_are_tier_3():
+    cities = ["Springfield", "mumbai", " Pune", "", None]
+    rows = [(30, 70.0, 1.75, 5.0, False, city, None) for city in cities]
+    assert list(engineer_columns(*zip(*rows))["city_tier"]) == [3] * len(cities)
+    assert [engineer_row(*row)["city_tier"] for row in rows] == [3] * len(cities)
+
+
+def test_empty_batch():
+    got = engineer_records([])
+    assert all(len(column) == 0 for column in got.values())
+
+
+MODEL_PATH = Path(__file__).resolve().parent.parent / "models" / "model.pkl"
+
+
+@pytest.mark.skipif(not MODEL_PATH.exists(), reason="no bundled model")
+def test_model_predictions_match_one_row_frames():
+    pd = pytest.importorskip("pandas")
+    from ai.loader import load_model
+
+    model = load_model(MODEL_PATH)
+    # The encoder rejects occupations it was not fitted on, so keep to those
+    rows = [
+        row for row in BOUNDARY_ROWS + random_rows(300, seed=2)
+        if row[6] in ("private_job", "retired", "student")
+    ]
+    batch = model.predict(to_model_input(engineer_columns(*zip(*rows)), model))
+    # What /predict used to send the model: one single-row DataFrame per request
+    expected = [model.predict(pd.DataFrame([reference_row(*row)]))[0] for row in rows]
+    assert list(batch) == expected
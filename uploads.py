@@ -0,0 +1,142 @@
+"""Spooling and incremental record readers for bulk uploads.
+
+Used by `POST /predict/batch` and `POST /users/bulk`. The request body is
+spooled to a temporary file, then read back record by record, so memory use
+does not depend on how many records were sent. Supported formats: a JSON
+array, NDJSON (one JSON object per line) and CSV with a header row.
+"""
+
+import codecs
+import csv
+import io
+import json
+import tempfile
+from typing import Any, Dict, IO, Iterator, Optional
+
+from fastapi import Request
+
+FORMATS = {
+    "application/json": "json",
+    "application/x-ndjson": "ndjson",
+    "application/ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+    "text/csv": "csv",
+}
+
+_READ_SIZE = 64 * 1024
+
+
+class RecordError(ValueError):
+    """The upload is malformed and cannot be read any further."""
+
+
+def detect_format(content_type: Optional[str]) -> Optional[str]:
+    """Map a Content-Type header to one of "json", "ndjson" or "csv"."""
+    if not content_type:
+        return None
+    return FORMATS.get(content_type.split(";")[0].strip().lower())
+
+
+async def spool_request(request: Request, max_size: int) -> IO[bytes]:
+    """Copy the request body to a spooled temporary file (memory, then disk)."""
+    spool = tempfile.SpooledTemporaryFile(max_size=max_size)
+    try:
+        async for chunk in request.stream():
+            spool.write(chunk)
+        spool.seek(0)
+    except BaseException:
+        spool.close()
+        raise
+    return spool
+
+
+def _iter_json_array(fh: IO[bytes]) -> Iterator[Any]:
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    buf = ""
+    pos = 0
+    eof = False
+    started = False
+
+    def fill() -> bool:
+        nonlocal buf, pos, eof
+        data = fh.read(_READ_SIZE)
+        if not data:
+            eof = True
+            buf = buf[pos:] + text_decoder.decode(b"", final=True)
+        else:
+            buf = buf[pos:] + text_decoder.decode(data)
+        pos = 0
+        return not eof
+
+    need_value = False  # a comma was just consumed
+    while True:
+        # Skip whitespace, refilling the buffer as needed
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n":
+                pos += 1
+            if pos < len(buf) or not fill():
+                break
+        if pos >= len(buf):
+            raise RecordError("unexpected end of JSON array")
+        if not started:
+            if buf[pos] != "[":
+                raise RecordError("expected a JSON array")
+            started = True
+            first = True
+            pos += 1
+            continue
+        if buf[pos] == "]" and not need_value:
+            return
+        if not first and not need_value:
+            if buf[pos] != ",":
+                raise RecordError("expected ',' or ']' between array items")
+            need_value = True
+            pos += 1
+            continue
+        while True:
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+                break
+            except json.JSONDecodeError as exc:
+                if eof:
+                    raise RecordError(f"invalid JSON: {exc.msg}") from None
+                fill()
+        if end == len(buf) and not eof:
+            # A number at the end of the buffer may continue in the next read
+            fill()
+            continue
+        pos = end
+        first = False
+        need_value = False
+        yield obj
+
+
+def _iter_ndjson(fh: IO[bytes]) -> Iterator[Any]:
+    for lineno, line in enumerate(io.TextIOWrapper(fh, encoding="utf-8", newline=""), 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as exc:
+            raise RecordError(f"invalid JSON on line {lineno}: {exc.msg}") from None
+
+
+def _iter_csv(fh: IO[bytes]) -> Iterator[Dict[str, str]]:
+    reader = csv.DictReader(io.TextIOWrapper(fh, encoding="utf-8", newline=""))
+    for row in reader:
+        # Empty cells mean "not provided" (e.g. the optional city and occupation)
+        yield {k: v for k, v in row.items() if k is not None and v != ""}
+
+
+def iter_records(fh: IO[bytes], fmt: str) -> Iterator[Any]:
+    """Yield the records of an upload one at a time."""
+    if fmt == "json":
+        return _iter_json_array(fh)
+    if fmt == "ndjson":
+        return _iter_ndjson(fh)
+    if fmt == "csv":
+        return _iter_csv(fh)
+    raise ValueError(f"unsupported format: {fmt}")
+
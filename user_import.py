@@ -0,0 +1,117 @@
+"""Shared parsing and bookkeeping for `POST /users/bulk`.
+
+The sync (main.py) and async (async_api.py) routes drive the same steps per
+chunk of records: validate, drop emails that are already taken, hash the
+remaining passwords in parallel, then insert the chunk with one
+`executemany` in one transaction. A bad row is reported in the response and
+never aborts the rest of the upload.
+
+Uploads are spooled and read with `uploads` (JSON array, NDJSON or CSV with
+an `email,password` header), like `POST /predict/batch`, so a 50k-row file is
+never held in memory as parsed objects. Emails are normalised by the
+`UserCreate` schema, exactly as for `POST /users`.
+"""
+
+from typing import Any, Dict, IO, Iterator, List, Optional, Set, Tuple
+
+from pydantic import ValidationError
+
+from schemas import UserCreate
+from uploads import RecordError, iter_records
+
+# (index in the upload, email, plain password)
+ImportRow = Tuple[int, str, str]
+
+DUPLICATE_EMAIL = "Email already registered"
+
+
+class BulkImport:
+    """Progress and per-row errors of one bulk import."""
+
+    def __init__(self):
+        self.received = 0
+        self.created = 0
+        self.errors: List[Dict[str, Any]] = []
+        self.aborted: Optional[str] = None
+        self._seen: Set[str] = set()
+
+    def fail(self, index: int, email: Optional[str], error: str, detail: Any = None) -> None:
+        entry: Dict[str, Any] = {"index": index, "email": email, "error": error}
+        if detail is not None:
+            entry["detail"] = detail
+        self.errors.append(entry)
+
+    def _validate(self, index: int, record: Any) -> Optional[ImportRow]:
+        if not isinstance(record, dict):
+            self.fail(index, None, "record must be an object with email and password")
+            return None
+        try:
+            user = UserCreate(**record)
+        except ValidationError as e:
+            self.fail(index, record.get("email"), "validation failed",
+                      [{"loc": err["loc"], "msg": err["msg"]} for err in e.errors()])
+            return None
+        email = user.email
+        if not email or not user.password:
+            self.fail(index, email or None, "email and password must not be empty")
+            return None
+        if email in self._seen:
+            self.fail(index, email, "duplicate email in upload")
+            return None
+        self._seen.add(email)
+        return index, email, user.password
+
+    def chunks(self, fh: IO[bytes], fmt: str, chunk_size: int) -> Iterator[List[ImportRow]]:
+        """Yield validated rows `chunk_size` records at a time.
+
+        Invalid records are recorded as errors. A malformed upload ends the
+        import after the rows read so far.
+        """
+        records = iter_records(fh, fmt)
+        chunk: List[ImportRow] = []
+        while True:
+            try:
+                record = next(records)
+            except StopIteration:
+                break
+            except RecordError as e:
+                self.fail(self.received, None, str(e))
+                self.aborted = f"upload unreadable after {self.received} records"
+                break
+            index = self.received
+            self.received += 1
+            row = self._validate(index, record)
+            if row is not None:
+                chunk.append(row)
+            if self.received % chunk_size == 0 and chunk:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def drop_existing(self, chunk: List[ImportRow], existing: Set[str]) -> List[ImportRow]:
+        """Report rows whose email is already registered and return the rest."""
+        if not existing:
+            return chunk
+        kept = []
+        for row in chunk:
+            if row[1] in existing:
+                self.fail(row[0], row[1], DUPLICATE_EMAIL)
+            else:
+                kept.append(row)
+        return kept
+
+    def abort(self, chunk: List[ImportRow], error: str) -> None:
+        """Stop after a database failure, reporting the rows of the failed chunk."""
+        for index, email, _ in chunk:
+            self.fail(index, email, error)
+        self.aborted = error
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "received": self.received,
+            "created": self.created,
+            "failed": len(self.errors),
+            "aborted": self.aborted,
+            "errors": sorted(self.errors, key=lambda e: e["index"]),
+        }
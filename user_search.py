@@ -0,0 +1,233 @@
+"""In-process email search index for `GET /users/search` (`USER_SEARCH_INDEX=1`).
+
+Two sorted arrays of user ids answer a query with a binary search and a
+short forward scan, so a lookup costs O(log n + limit) however many users
+there are:
+
+* `emails` is ordered by lower-cased email: matches are the emails that
+  start with the query;
+* `words` holds one entry per word boundary inside an email (after `.`,
+  `_`, `+`, `-` or `@`), ordered by the rest of the email from there:
+  `smith@gmail.com` and `gmail.com` for `john.smith@gmail.com`. Matches
+  are the emails with a word starting with the query, which covers
+  searches by last name or domain without a trigram index's memory cost.
+
+The arrays store packed integers (`array('q')`), 8 bytes per entry, and
+compare through the email map, so a million users cost the emails
+themselves plus a few tens of megabytes. The index is loaded from the
+database on a background thread at startup and then kept current by the
+user write routes. Until it is ready, and after `invalidate` (a bulk
+import), searches fall back to the database.
+
+The index is per process: with several workers, writes handled by one are
+not seen by the others until their next rebuild, so run it where one
+process serves the user routes or where slightly stale results are fine.
+"""
+
+from array import array
+import logging
+import re
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger("uvicorn.error")
+
+_WORD_BREAK = re.compile(r"[._+\-@]+")
+# Word entries pack the user id and the word's offset into the email
+_OFFSET_BITS = 8
+_OFFSET_MASK = (1 << _OFFSET_BITS) - 1
+
+
+def _word_offsets(email: str) -> List[int]:
+    return [
+        m.end() for m in _WORD_BREAK.finditer(email)
+        if 0 < m.end() < min(len(email), _OFFSET_MASK + 1)
+    ]
+
+
+class UserSearchIndex:
+    def __init__(self):
+        self._emails_by_id: Dict[int, str] = {}
+        self._emails = array("q")  # user ids ordered by lower-cased email
+        self._words = array("q")   # (user id << 8 | offset) ordered by the email from offset
+        self._lock = threading.Lock()
+        self._ready = False
+        self._loading = False
+        self._pending: List[Tuple[int, Optional[str]]] = []  # writes made while loading
+        self._loader: Optional[Callable[[], Iterable[dict]]] = None
+        self.builds = 0
+        self.build_seconds: Optional[float] = None
+        self.searches = 0
+
+    # -- keys -------------------------------------------------------------
+
+    def _email_key(self, user_id: int) -> Tuple[str, int]:
+        return self._emails_by_id[user_id].lower(), user_id
+
+    def _word_key(self, entry: int) -> Tuple[str, int]:
+        user_id = entry >> _OFFSET_BITS
+        return self._emails_by_id[user_id][entry & _OFFSET_MASK:].lower(), user_id
+
+    @staticmethod
+    def _lower_bound(entries: array, target: Tuple[str, int], key: Callable[[int], Tuple[str, int]]) -> int:
+        lo, hi = 0, len(entries)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if key(entries[mid]) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    # -- maintenance ------------------------------------------------------
+
+    def _insert(self, user_id: int, email: str) -> None:
+        self._emails_by_id[user_id] = email
+        key = self._email_key(user_id)
+        self._emails.insert(self._lower_bound(self._emails, key, self._email_key), user_id)
+        for offset in _word_offsets(email):
+            entry = user_id << _OFFSET_BITS | offset
+            key = self._word_key(entry)
+            self._words.insert(self._lower_bound(self._words, key, self._word_key), entry)
+
+    def _delete(self, user_id: int) -> None:
+        email = self._emails_by_id.get(user_id)
+        if email is None:
+            return
+        index = self._lower_bound(self._emails, self._email_key(user_id), self._email_key)
+        del self._emails[index]
+        for offset in _word_offsets(email):
+            entry = user_id << _OFFSET_BITS | offset
+            index = self._lower_bound(self._words, self._word_key(entry), self._word_key)
+            del self._words[index]
+        del self._emails_by_id[user_id]
+
+    def _apply(self, user_id: int, email: Optional[str]) -> None:
+        self._delete(user_id)
+        if email:
+            self._insert(user_id, email)
+
+    def put(self, user_id: int, email: str) -> None:
+        """Index a created user, or re-index an updated one"""
+        self._write(int(user_id), email)
+
+    def remove(self, user_id: int) -> None:
+        self._write(int(user_id), None)
+
+    def _write(self, user_id: int, email: Optional[str]) -> None:
+        with self._lock:
+            if self._loading:
+                self._pending.append((user_id, email))
+            if self._ready:
+                self._apply(user_id, email)
+
+    # -- loading ----------------------------------------------------------
+
+    def start(self, loader: Callable[[], Iterable[dict]]) -> None:
+        """Build the index from `loader()` (rows with user_id and email) in the background"""
+        self._loader = loader
+        self._spawn()
+
+    def invalidate(self) -> None:
+        """Stop serving from the index and rebuild it (after writes it did not see)"""
+        with self._lock:
+            self._ready = False
+        self._spawn()
+
+    def _spawn(self) -> None:
+        with self._lock:
+            if self._loading or self._loader is None:
+                return
+            self._loading = True
+            self._pending = []
+        threading.Thread(target=self._build, name="user-search-index", daemon=True).start()
+
+    def _build(self) -> None:
+        started = time.perf_counter()
+        try:
+            emails_by_id = {
+                int(row["user_id"]): str(row["email"]) for row in self._loader() if row["email"]
+            }
+        except Exception as e:
+            logger.exception("Building the user search index failed: %s", e)
+            with self._lock:
+                self._loading = False
+            return
+        fresh = UserSearchIndex()
+        fresh._emails_by_id = emails_by_id
+        fresh._emails = array("q", sorted(emails_by_id, key=fresh._email_key))
+        fresh._words = array("q", sorted(
+            (user_id << _OFFSET_BITS | offset
+             for user_id, email in emails_by_id.items()
+             for offset in _word_offsets(email)),
+            key=fresh._word_key,
+        ))
+        with self._lock:
+            # Replay writes that may have raced with the load; each is idempotent
+            for user_id, email in self._pending:
+                fresh._apply(user_id, email)
+            self._emails_by_id, self._emails, self._words = fresh._emails_by_id, fresh._emails, fresh._words
+            self._pending = []
+            self._loading = False
+            self._ready = True
+            self.builds += 1
+            self.build_seconds = time.perf_counter() - started
+        logger.info("User search index built: %d users in %.2fs", len(emails_by_id), self.build_seconds)
+
+    # -- queries ----------------------------------------------------------
+
+    def search(self, q: str, limit: int) -> Optional[List[dict]]:
+        """Up to `limit` users ranked by match quality, or None while not ready.
+
+        Emails starting with `q` come first (an exact match leads, being the
+        shortest), then emails with a word starting with `q`; each group is
+        in email order.
+        """
+        q = q.lower()
+        target = (q, -1)
+        with self._lock:
+            if not self._ready:
+                return None
+            self.searches += 1
+            results: List[dict] = []
+            seen = set()
+            index = self._lower_bound(self._emails, target, self._email_key)
+            while index < len(self._emails) and len(results) < limit:
+                user_id = self._emails[index]
+                email = self._emails_by_id[user_id]
+                if not email.lower().startswith(q):
+                    break
+                results.append({"user_id": user_id, "email": email})
+                seen.add(user_id)
+                index += 1
+            index = self._lower_bound(self._words, target, self._word_key)
+            # An email can hold several matching words: bound the scan, not just the results
+            steps = 0
+            while index < len(self._words) and len(results) < limit and steps < 4 * limit:
+                entry = self._words[index]
+                user_id = entry >> _OFFSET_BITS
+                email = self._emails_by_id[user_id]
+                if not email[entry & _OFFSET_MASK:].lower().startswith(q):
+                    break
+                if user_id not in seen:
+                    results.append({"user_id": user_id, "email": email})
+                    seen.add(user_id)
+                index += 1
+                steps += 1
+            return results
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "ready": self._ready,
+                "loading": self._loading,
+                "users": len(self._emails_by_id),
+                "word_entries": len(self._words),
+                "builds": self.builds,
+                "build_seconds": self.build_seconds,
+                "searches": self.searches,
+            }
+
+
+user_index = UserSearchIndex()